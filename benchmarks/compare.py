@@ -0,0 +1,69 @@
+"""Compare two results of `benchmarks.runtime` and report regressions
+
+Exits with status 1 if any measurement got worse by more than the tolerance.
+"""
+
+import argparse
+import json
+import sys
+
+
+def measurements(results):
+    """{(benchmark, name): (value, better)} of all measurements"""
+    return {
+        (benchmark_name, name): (entry["value"], entry["better"])
+        for benchmark_name, benchmark in results["benchmarks"].items()
+        for name, entry in benchmark.items()
+        if isinstance(entry, dict) and "better" in entry
+    }
+
+
+def compare(baseline, results, tolerance):
+    """Yield (benchmark, name, baseline value, value, relative change, regression) of measurements in both results"""
+    baseline_measurements = measurements(baseline)
+    for key, (value, better) in measurements(results).items():
+        if key not in baseline_measurements:
+            continue
+
+        baseline_value = baseline_measurements[key][0]
+        if baseline_value == 0:
+            change = 0.0 if value == 0 else float("inf")
+        else:
+            change = (value - baseline_value) / abs(baseline_value)
+        # positive is worse
+        worsening = change if better == "lower" else -change
+        yield (*key, baseline_value, value, change, worsening > tolerance)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("baseline")
+    parser.add_argument("results")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.1,
+        help="relative worsening still accepted (default: 0.1)",
+    )
+    arguments = parser.parse_args()
+
+    with open(arguments.baseline) as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(arguments.results) as results_file:
+        results = json.load(results_file)
+
+    regressions = 0
+    for benchmark_name, name, baseline_value, value, change, regression in compare(
+        baseline, results, arguments.tolerance
+    ):
+        regressions += regression
+        print(
+            f"{'REGRESSION' if regression else 'ok':<10} {benchmark_name}.{name}: "
+            f"{baseline_value:.6g} → {value:.6g} ({change:+.1%})"
+        )
+
+    print(
+        f"{regressions} regression(s) between {baseline['meta']['commit']} "
+        f"and {results['meta']['commit']}"
+    )
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,279 @@
+"""Benchmarks of the client runtime's hot paths against simulated hardware (see `client.simulation`)
+
+Every measurement is a `{"value": ..., "better": "lower" | "higher"}` entry in the JSON results, compare two runs with
+`python3 -m benchmarks.compare`.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from datetime import datetime
+from time import perf_counter
+
+import numpy
+
+from benchmarks.synthetic import CLIENT_SERVO_NAMES, write_play
+from client.constants import ServoConfigs, ServoName
+from client.metrics import metrics
+from client.simulation import Simulation
+
+
+def metric(value, better="lower"):
+    return {"value": value, "better": better}
+
+
+@contextlib.contextmanager
+def quiet():
+    """Hide the (very verbose) output of the play"""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def i2c_calls(address):
+    """Number of I2C operations of a device so far"""
+    series = metrics.to_json().get("i2c_calls_total", {"series": []})["series"]
+    return sum(
+        entry["value"]
+        for entry in series
+        if entry["labels"]["address"] == f"0x{address:02x}"
+    )
+
+
+def best_duration(function, repeats):
+    durations = []
+    for _ in range(repeats):
+        start_time = perf_counter()
+        function()
+        durations.append(perf_counter() - start_time)
+    return min(durations)
+
+
+def benchmark_prepare(simulation, repeats):
+    performance = simulation.hardware.performance
+    duration = best_duration(performance.prepare, repeats)
+
+    # separately, tracing slows down allocations
+    tracemalloc.start()
+    performance.prepare()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "seconds": metric(duration),
+        "peak_memory_bytes": metric(peak_memory),
+    }
+
+
+def benchmark_act(simulation):
+    performance = simulation.hardware.performance
+    performance.prepare()
+    virtual_start_time = simulation.clock()
+    start_time = perf_counter()
+    performance.act()
+    wall_seconds = perf_counter() - start_time
+    play_seconds = simulation.clock() - virtual_start_time
+    wakeups = performance.frame_timing["wakeups"]
+    frames = play_seconds * performance._show.fps
+
+    return {
+        "play_seconds": play_seconds,
+        "wakeups": wakeups,
+        "wall_seconds": metric(wall_seconds),
+        "seconds_per_wakeup": metric(wall_seconds / wakeups),
+        "seconds_per_frame": metric(wall_seconds / frames),
+        "speedup": metric(play_seconds / wall_seconds, better="higher"),
+    }
+
+
+def benchmark_servos_set(simulation, calls, repeats):
+    servos = simulation.hardware.servos
+
+    def set_servos():
+        for call_index in range(calls):
+            servos.set(ServoName.CROCO_BASE_LEFT, 40 + call_index % 10)
+
+    calls_before = i2c_calls(0x60)
+    duration = best_duration(set_servos, repeats)
+    transactions = (i2c_calls(0x60) - calls_before) / repeats
+
+    return {
+        "calls_per_second": metric(calls / duration, better="higher"),
+        "i2c_transactions_per_call": metric(transactions / calls),
+    }
+
+
+def benchmark_servo_pose(simulation, poses, repeats):
+    """A pose of all servos, set one by one versus as a batch (`Servos.set_many`)"""
+    servos = simulation.hardware.servos
+    poses_angles = [
+        {
+            servo_name: servo_config.min_angle
+            + (servo_config.max_angle - servo_config.min_angle) * (pose_index % 10) / 10
+            for servo_name, servo_config in ServoConfigs.items()
+        }
+        for pose_index in range(poses)
+    ]
+
+    def set_one_by_one():
+        for angles in poses_angles:
+            for servo_name, angle in angles.items():
+                servos.set(servo_name, angle)
+
+    def set_many():
+        for angles in poses_angles:
+            servos.set_many(angles)
+
+    results = {"servos": len(ServoConfigs)}
+    for name, function in [("one_by_one", set_one_by_one), ("set_many", set_many)]:
+        calls_before = i2c_calls(0x40) + i2c_calls(0x60)
+        duration = best_duration(function, repeats)
+        transactions = (i2c_calls(0x40) + i2c_calls(0x60) - calls_before) / repeats
+        results[f"{name}_seconds_per_pose"] = metric(duration / poses)
+        results[f"{name}_i2c_transactions_per_pose"] = metric(transactions / poses)
+    return results
+
+
+def benchmark_led_output(simulation, changes, repeats):
+    led_extension = simulation.hardware.led_extension
+
+    def change_leds():
+        for change_index in range(changes):
+            led_extension.set(change_index % 8, change_index // 8 % 2 == 0)
+
+    calls_before = i2c_calls(0x21)
+    duration = best_duration(change_leds, repeats)
+    transactions = (i2c_calls(0x21) - calls_before) / repeats
+
+    return {
+        "seconds_per_change": metric(duration / changes),
+        "i2c_transactions_per_change": metric(transactions / changes),
+    }
+
+
+def benchmark_audio_callback(seconds, samplerate, blocksize, channels):
+    from client.audio import Clip, Mixer, Voice
+
+    # stored as exported, 16 bit PCM
+    data = numpy.zeros((int(seconds * samplerate), channels), dtype=numpy.int16)
+    mixer = Mixer(channels, samplerate, blocksize)
+    mixer.add(Voice(Clip(data, samplerate)))
+    callback = mixer.callback
+    outdata = numpy.empty((blocksize, channels), dtype=numpy.float32)
+    blocks = len(data) // blocksize - 1
+    start_time = perf_counter()
+    for _ in range(blocks):
+        callback(outdata, blocksize, None, None)
+    seconds_per_block = (perf_counter() - start_time) / blocks
+
+    return {
+        "blocksize": blocksize,
+        "channels": channels,
+        "seconds_per_block": metric(seconds_per_block),
+        # of the time the block plays
+        "realtime_fraction": metric(seconds_per_block / (blocksize / samplerate)),
+    }
+
+
+def benchmark_microphone_block(blocks, samplerate):
+    from client.microphone import block_duration, block_loudness, fft_size
+
+    blocksize = int(samplerate * block_duration / 1000)
+    fftsize = fft_size(samplerate)
+    indata = numpy.random.default_rng(0).normal(0, 0.01, (blocksize, 1))
+    start_time = perf_counter()
+    for _ in range(blocks):
+        # the work of the monitor callback per block
+        if any(indata):
+            block_loudness(indata[:, 0], fftsize)
+    seconds_per_block = (perf_counter() - start_time) / blocks
+
+    return {
+        "blocksize": blocksize,
+        "seconds_per_block": metric(seconds_per_block),
+        "realtime_fraction": metric(seconds_per_block / (block_duration / 1000)),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(arguments):
+    results = {
+        "meta": {
+            "time": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "parameters": vars(arguments),
+        },
+        "benchmarks": {},
+    }
+    benchmarks = results["benchmarks"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        write_play(
+            os.path.join(directory, "play.json"),
+            frames=arguments.frames,
+            servos=len(CLIENT_SERVO_NAMES),
+            triggers=arguments.triggers,
+            audio_cues=arguments.audio_cues,
+            fps=arguments.fps,
+            servo_curves=True,
+            servo_names=CLIENT_SERVO_NAMES,
+        )
+
+        with quiet():
+            simulation = Simulation(render_directory=directory)
+            simulation.hardware.psu.turn_on()
+            benchmarks["prepare"] = benchmark_prepare(simulation, arguments.repeats)
+            benchmarks["act"] = benchmark_act(simulation)
+            benchmarks["servos_set"] = benchmark_servos_set(
+                simulation, arguments.calls, arguments.repeats
+            )
+            benchmarks["servo_pose"] = benchmark_servo_pose(
+                simulation, arguments.calls // 10, arguments.repeats
+            )
+            benchmarks["led_output"] = benchmark_led_output(
+                simulation, arguments.calls, arguments.repeats
+            )
+            benchmarks["audio_callback"] = benchmark_audio_callback(
+                60, 48000, arguments.audio_blocksize, 8
+            )
+            benchmarks["microphone_block"] = benchmark_microphone_block(
+                arguments.calls // 10, 48000
+            )
+
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--frames", type=int, default=30000)
+    parser.add_argument("--triggers", type=int, default=200)
+    parser.add_argument("--audio-cues", type=int, default=50)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--calls", type=int, default=10000)
+    parser.add_argument("--audio-blocksize", type=int, default=512)
+    parser.add_argument("--output", help="write the results to this file")
+    arguments = parser.parse_args()
+
+    results = json.dumps(run(arguments), indent=4)
+    if arguments.output:
+        with open(arguments.output, "w") as output_file:
+            output_file.write(results)
+    else:
+        print(results)
@@ -0,0 +1,62 @@
+"""Wakeup jitter of the frame scheduler while other processes keep the CPUs busy
+
+Compares plain sleeping (no spin) with the hybrid sleep-then-spin wait used during performances.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+
+from client.scheduler import FrameScheduler
+
+
+def burn_cpu(stop):
+    while not stop.is_set():
+        sum(range(10000))
+
+
+def measure(fps, frames, spin_threshold):
+    scheduler = FrameScheduler(fps, spin_threshold=spin_threshold)
+    scheduler.start()
+    for frame_index in range(frames):
+        scheduler.wait_for(frame_index)
+    return scheduler.statistics.summary()
+
+
+def run(fps, frames, load_processes):
+    stop = multiprocessing.Event()
+    workers = [
+        multiprocessing.Process(target=burn_cpu, args=(stop,), daemon=True)
+        for _ in range(load_processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    try:
+        return {
+            "fps": fps,
+            "load_processes": load_processes,
+            "sleep_only": measure(fps, frames, spin_threshold=0),
+            "hybrid": measure(
+                fps, frames, spin_threshold=FrameScheduler.DEFAULT_SPIN_THRESHOLD
+            ),
+        }
+    finally:
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--load-processes", type=int, default=os.cpu_count())
+    arguments = parser.parse_args()
+
+    print(
+        json.dumps(
+            run(arguments.fps, arguments.frames, arguments.load_processes), indent=4
+        )
+    )
@@ -0,0 +1,126 @@
+"""Compare loading a play from `play.json` with memory-mapping the compiled show and streaming the JSON
+
+Every variant is measured in a fresh interpreter, so resident memory is not skewed by earlier runs.
+"""
+
+import argparse
+import json
+import os.path
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer as timer
+
+from benchmarks.synthetic import write_play
+from client.show import CompiledShow, JSONShow, convert
+from client.streaming import StreamingShow
+
+
+def memory_status():
+    status = {}
+    with open("/proc/self/status") as status_file:
+        for line in status_file:
+            key, value = line.split(":", 1)
+            if key in ["VmRSS", "VmHWM"]:
+                status[key] = int(value.split()[0])
+    return status
+
+
+def measure(mode, path):
+    baseline = memory_status()
+
+    start_time = timer()
+    if mode == "json":
+        show = JSONShow.load(path)
+    elif mode == "compiled":
+        show = CompiledShow(path)
+    else:
+        # with the look-ahead window covering a single frame, loading follows the playhead
+        show = StreamingShow(path, 1 / 25)
+        show.start(on_frame=lambda frame_index: None, on_complete=lambda: None)
+        show.wait_until_loaded(0)
+    load_time = timer() - start_time
+    loaded = memory_status()
+
+    start_time = timer()
+    show.servo_keyframes()
+    frame_index = 0
+    while show.frame_count is None or frame_index < show.frame_count:
+        show.set_playhead(frame_index)
+        show.wait_until_loaded(frame_index)
+        show.audio(frame_index)
+        show.instructions(frame_index)
+        frame_index += 1
+    pass_time = timer() - start_time
+    finished = memory_status()
+
+    return {
+        "mode": mode,
+        "frames": show.frame_count,
+        "file_size_bytes": os.path.getsize(path),
+        "load_seconds": load_time,
+        "full_pass_seconds": pass_time,
+        "rss_after_load_kb": loaded["VmRSS"] - baseline["VmRSS"],
+        "rss_after_pass_kb": finished["VmRSS"] - baseline["VmRSS"],
+        "peak_rss_kb": finished["VmHWM"],
+    }
+
+
+def run(frames, servos, triggers, audio_cues, fps):
+    with tempfile.TemporaryDirectory() as directory:
+        json_path = os.path.join(directory, "play.json")
+        write_play(
+            json_path,
+            frames=frames,
+            servos=servos,
+            triggers=triggers,
+            audio_cues=audio_cues,
+            fps=fps,
+            servo_curves=True,
+        )
+        start_time = timer()
+        show_path = convert(json_path)
+        conversion_time = timer() - start_time
+
+        results = []
+        for mode, path in [
+            ("json", json_path),
+            ("compiled", show_path),
+            ("streaming", json_path),
+        ]:
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.show_loading", "--measure", mode, path],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            results.append(json.loads(output))
+
+    return {"conversion_seconds": conversion_time, "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--frames", type=int, default=30000)
+    parser.add_argument("--servos", type=int, default=6)
+    parser.add_argument("--triggers", type=int, default=200)
+    parser.add_argument("--audio-cues", type=int, default=50)
+    parser.add_argument("--fps", type=int, default=25)
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "PATH"))
+    arguments = parser.parse_args()
+
+    if arguments.measure:
+        print(json.dumps(measure(*arguments.measure)))
+    else:
+        print(
+            json.dumps(
+                run(
+                    arguments.frames,
+                    arguments.servos,
+                    arguments.triggers,
+                    arguments.audio_cues,
+                    arguments.fps,
+                ),
+                indent=4,
+            )
+        )
@@ -0,0 +1,102 @@
+"""Generation of synthetic plays in the format written by `blender_utils.export()`"""
+
+import json
+import math
+import random
+from datetime import datetime
+
+from client.curves import Interpolation, keyframes_from_samples, keyframes_to_export
+
+# servos the client maps to hardware (see `client.constants.ServoTransforms`, written with `Servos.set_pulse_widths`),
+# safe for the generated angles
+CLIENT_SERVO_NAMES = [
+    "croco base right",
+    "croco base center",
+    "croco base left",
+    "croco jaw center",
+    "croco jaw left",
+]
+
+
+def generate_play(
+    frames=30000,
+    servos=6,
+    triggers=200,
+    audio_cues=50,
+    fps=25,
+    seed=0,
+    servo_curves=False,
+    servo_names=None,
+):
+    """With `servo_curves`, servo motion is exported as keyframes (as by the current exporter), otherwise per frame
+
+    Servos are named `servo <index>` unless `servo_names` are given (see `CLIENT_SERVO_NAMES`).
+    """
+    generator = random.Random(seed)
+    if servo_names is None:
+        servo_names = [f"servo {servo_index}" for servo_index in range(servos)]
+
+    play_frames = []
+    for frame_index in range(frames):
+        servo_parameters = {}
+        for servo_index, servo_name in enumerate(servo_names):
+            # servos move in bursts with quiet passages in between, like a real play
+            # between 0° and 10°
+            if (frame_index // (fps * 4) + servo_index) % 3 == 0:
+                servo_parameters[servo_name] = (
+                    1 + math.sin(frame_index / fps + servo_index)
+                ) * math.radians(5)
+
+        play_frames.append(
+            {
+                "index": frame_index,
+                "_absolute_index": frame_index + 1,
+                "servos": servo_parameters,
+                "audio": [],
+                "instructions": [],
+            }
+        )
+
+    audio_files = []
+    for cue_index in range(audio_cues):
+        frame_index = generator.randrange(frames)
+        audio_file = f"audio/{frame_index}-{frame_index + fps * 10}.wav"
+        play_frames[frame_index]["audio"].append(audio_file)
+        audio_files.append(audio_file)
+
+    marker_count = max(triggers // 10, 1)
+    for marker_index in range(marker_count):
+        play_frames[generator.randrange(frames)]["instructions"].append(
+            f"marker:marker-{marker_index}:1"
+        )
+    for trigger_index in range(triggers - marker_count):
+        play_frames[generator.randrange(frames)]["instructions"].append(
+            f"log:trigger {trigger_index}:{generator.randrange(1, fps * 5)}"
+        )
+
+    play = {
+        "meta": {"filename": "synthetic", "render_time": datetime.now().isoformat()},
+        "fps": fps,
+        "audio_files": audio_files,
+    }
+    if servo_curves:
+        # a keyframe every half second, linearly interpolated in between
+        samples = {servo_name: [] for servo_name in servo_names}
+        for frame in play_frames:
+            for servo_name, servo_value in frame.pop("servos").items():
+                if frame["index"] % (fps // 2) == 0:
+                    samples[servo_name].append((frame["index"], servo_value))
+        play["servo_curves"] = {}
+        for servo_name, servo_samples in samples.items():
+            if servo_samples:
+                keyframes = keyframes_from_samples(servo_samples)
+                keyframes["interpolation"] = Interpolation.LINEAR
+                play["servo_curves"][servo_name] = keyframes_to_export(keyframes)
+        play["frame_count"] = frames
+    play["frames"] = play_frames
+    return play
+
+
+def write_play(json_path, **parameters):
+    with open(json_path, "w") as json_file:
+        json.dump(generate_play(**parameters), json_file, indent=4)
@@ -1,11 +1,13 @@
 import bpy
 import json
+import math
 import os.path
 from subprocess import run
 from urllib.request import Request, urlopen
 from datetime import datetime
 
 from config.config import config
+from client.show import compile_show, compiled_path
 
 # bpy.ops.script.reload()
 
@@ -20,6 +22,8 @@ main_audio_file = os.path.join(
 audio_file_extension = config["output"]["audio"]["file_extension"]
 output_file_path = os.path.join(output_base_path, config["output"]["output_filename"])
 audio_channels = list(range(1, 4))
+# F-Curve interpolations evaluated by the client, see client/curves.py
+SUPPORTED_INTERPOLATIONS = ["CONSTANT", "LINEAR", "BEZIER"]
 
 
 def get_master_track_file_name(track_identifier=None):
@@ -154,6 +158,50 @@ def bake_speech_movements():
     #   pass
 
 
+def export_servo_curve(fcurve, frame_start, frame_end):
+    """Keyframes of an F-Curve as `[x, y, interpolation, left handle x, y, right handle x, y]` relative to frame_start
+
+    The client evaluates these at its own servo update rate. Interpolations it doesn't implement (easings) and curves
+    with modifiers are sampled once per frame instead.
+    """
+
+    def sample(frame):
+        value = fcurve.evaluate(frame)
+        return [frame - frame_start, value, "LINEAR"] + [frame - frame_start, value] * 2
+
+    if len(fcurve.modifiers) > 0:
+        return [sample(frame) for frame in range(frame_start, frame_end + 1)]
+
+    keyframes = []
+    keyframe_points = list(fcurve.keyframe_points)
+    for index, keyframe in enumerate(keyframe_points):
+        if (
+            keyframe.interpolation in SUPPORTED_INTERPOLATIONS
+            or index == len(keyframe_points) - 1
+        ):
+            keyframes.append(
+                [
+                    keyframe.co.x - frame_start,
+                    keyframe.co.y,
+                    # unused for the last keyframe, the client only knows the supported ones
+                    keyframe.interpolation
+                    if keyframe.interpolation in SUPPORTED_INTERPOLATIONS
+                    else "CONSTANT",
+                    keyframe.handle_left.x - frame_start,
+                    keyframe.handle_left.y,
+                    keyframe.handle_right.x - frame_start,
+                    keyframe.handle_right.y,
+                ]
+            )
+        else:
+            keyframes.append(sample(keyframe.co.x))
+            next_frame = keyframe_points[index + 1].co.x
+            for frame in range(math.floor(keyframe.co.x) + 1, math.ceil(next_frame)):
+                keyframes.append(sample(frame))
+
+    return keyframes
+
+
 def export():
     render_audio()
     bake_speech_movements()
@@ -176,27 +224,22 @@ def export():
                     break
                 last_keyframe_value = keyframe.co.y
 
+    frame_start = bpy.context.scene.frame_start
+    servo_curves = {
+        servo_name: export_servo_curve(
+            fcurve, frame_start, bpy.context.scene.frame_end
+        )
+        for servo_name, fcurve in servo_curve_map.items()
+    }
+
     frames = []
     audio_files = []
-    servo_last_values = {}
-
-    for frame in range(bpy.context.scene.frame_start, bpy.context.scene.frame_end + 1):
-        # bpy.context.scene.frame_set(frame)
-        servo_parameters = {}
-
-        for servo_name, fcurve in servo_curve_map.items():
-            servo_frame_value = fcurve.evaluate(frame)
-
-            if servo_frame_value != servo_last_values.get(servo_name):
-                servo_parameters[servo_name] = servo_frame_value
-
-            servo_last_values[servo_name] = servo_frame_value
 
+    for frame in range(frame_start, bpy.context.scene.frame_end + 1):
         frames.append(
             {
-                "index": frame - bpy.context.scene.frame_start,
+                "index": frame - frame_start,
                 "_absolute_index": frame,
-                "servos": servo_parameters,
                 "audio": [],
                 "instructions": [],
             }
@@ -230,20 +273,22 @@ def export():
         else:
             print("Unknown sequence:", sequence)
 
+    play = {
+        "meta": {
+            "filename": bpy.data.filepath,
+            "render_time": datetime.now().isoformat(),
+        },
+        "fps": bpy.context.scene.render.fps,
+        "audio_files": audio_files,
+        "servo_curves": servo_curves,
+        # frames have to stay last, the client can stream them
+        "frame_count": len(frames),
+        "frames": frames,
+    }
     with open(output_file_path, "w") as output_file:
-        json.dump(
-            {
-                "meta": {
-                    "filename": bpy.data.filepath,
-                    "render_time": datetime.now().isoformat(),
-                },
-                "fps": bpy.context.scene.render.fps,
-                "audio_files": audio_files,
-                "frames": frames,
-            },
-            output_file,
-            indent=4,
-        )
+        json.dump(play, output_file, indent=4)
+    # the client prefers the compiled show as long as it's not older than the JSON
+    compile_show(play, compiled_path(output_file_path))
 
     print(f"Done rendering: {output_file_path}")
 
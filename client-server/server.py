@@ -2,8 +2,10 @@ import json
 import traceback
 from inspect import signature
 from subprocess import run
-from flask import Flask, request, send_from_directory
+from flask import Flask, Response, request, send_from_directory
 from client.hardware import Hardware
+from client.i2c_trace import tracer
+from client.metrics import metrics
 import client.constants as constants
 
 ServoName = constants.ServoName
@@ -110,6 +112,32 @@ def constants_():
     return constants_summary
 
 
+@app.route("/metrics")
+def metrics_():
+    if request.args.get("format") == "json":
+        return metrics.to_json()
+
+    return Response(
+        metrics.to_prometheus(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.route("/i2c-trace")
+def i2c_trace():
+    if not tracer.enabled:
+        return Response("I2C tracing is off, see i2c_trace in the client config", 404)
+
+    trace = tracer.dump()
+    if request.args.get("records") == "false":
+        del trace["records"]
+    return trace
+
+
+@app.route("/audio-cache")
+def audio_cache():
+    return h.audio.cache_statistics()
+
+
 @app.route("/exec")
 def exec():
     method = request.args.get("method")
@@ -1,8 +1,337 @@
+"""Audio output through one long-lived stream, clips are mixed into it as voices
+
+`Audio.play()` returns a `Voice` immediately, the clip starts with the next buffer (or at a given time). The stream's
+callback sums all active voices into preallocated buffers, it doesn't lock, print or allocate per voice.
+
+Clips are kept as 16 bit integers (files with up to 16 bit) or 32 bit floats, converted in the callback. Clips larger
+than `audio_map_threshold` (client config, bytes) are memory-mapped from their WAV files instead of being read.
+
+Read clips are kept in an `AudioCache` of `audio_cache_bytes` (client config), the least recently used are evicted
+first. Preloaded clips stay until they are unloaded, see `client.audio_prefetch.AudioPrefetcher`.
+"""
+
+import mmap
+import os
+import struct
+from collections import OrderedDict, deque
+from threading import Lock
+from time import perf_counter
+
+import numpy
 import sounddevice as sd
 import soundfile as sf
-import threading
 from config.config import config
-from .exec import threadable
+from .constants import DEFAULT_AUDIO_CACHE_BYTES, DEFAULT_AUDIO_MAP_THRESHOLD, Config
+from .metrics import metrics
+
+DEFAULT_BLOCKSIZE = 512
+# a failed audio output is opened again after this many seconds at the earliest, not with every played clip
+STREAM_RETRY_SECONDS = 5.0
+
+# WAV format tags
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# (format tag, bits per sample): sample type of WAV data that can be mapped
+MAPPABLE_WAV_FORMATS = {
+    (WAVE_FORMAT_PCM, 16): numpy.int16,
+    (WAVE_FORMAT_IEEE_FLOAT, 32): numpy.float32,
+}
+
+
+class Clip:
+    def __init__(self, data, samplerate, mapped=False):
+        # frames × channels, mono files are read as one dimension
+        self.data = data.reshape(len(data), -1)
+        self.samplerate = samplerate
+        self.mapped = mapped
+        # to full scale floats
+        self.scale = 1 / 32768 if self.data.dtype == numpy.int16 else 1.0
+
+    @property
+    def duration(self):
+        return len(self.data) / self.samplerate
+
+    @property
+    def nbytes(self):
+        """Bytes in memory, mapped clips are paged in from their file"""
+        return 0 if self.mapped else self.data.nbytes
+
+
+def wav_layout(file_name):
+    """(format tag, channels, samplerate, bits per sample, data offset, data size) of a WAV file, None for others"""
+    with open(file_name, "rb") as wav_file:
+        header = wav_file.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:] != b"WAVE":
+            return None
+
+        layout = None
+        while True:
+            chunk_header = wav_file.read(8)
+            if len(chunk_header) < 8:
+                return None
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+            if chunk_id == b"fmt ":
+                fmt = wav_file.read(chunk_size)
+                format_tag, channels, samplerate, _, _, bits = struct.unpack(
+                    "<HHIIHH", fmt[:16]
+                )
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                    # the sub format GUID starts with the format tag
+                    format_tag = struct.unpack("<H", fmt[24:26])[0]
+                layout = (format_tag, channels, samplerate, bits)
+                wav_file.seek(chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if layout is None:
+                    return None
+                offset = wav_file.tell()
+                # the size of streamed files may be unknown
+                size = min(chunk_size, os.fstat(wav_file.fileno()).st_size - offset)
+                return (*layout, offset, size)
+            else:
+                wav_file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+def map_wav(file_name):
+    """The clip of a WAV file with 16 bit integer or 32 bit float samples, memory-mapped, otherwise None"""
+    layout = wav_layout(file_name)
+    if layout is None:
+        return None
+    format_tag, channels, samplerate, bits, offset, size = layout
+    dtype = MAPPABLE_WAV_FORMATS.get((format_tag, bits))
+    if dtype is None:
+        return None
+
+    with open(file_name, "rb") as wav_file:
+        # stays open as long as the data refers to it
+        mapping = mmap.mmap(wav_file.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mapping, "madvise"):
+        # read ahead further, the clip is played front to back
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+    frames = size // (channels * numpy.dtype(dtype).itemsize)
+    data = numpy.frombuffer(mapping, dtype, frames * channels, offset)
+    return Clip(data.reshape(frames, channels), samplerate, mapped=True)
+
+
+def read_clip(file_name, map_threshold=DEFAULT_AUDIO_MAP_THRESHOLD):
+    """The clip of an audio file, as compact as its format allows, memory-mapped if larger than `map_threshold`"""
+    info = sf.info(file_name)
+    dtype = "int16" if info.subtype in ("PCM_16", "PCM_S8", "PCM_U8") else "float32"
+    size = info.frames * info.channels * numpy.dtype(dtype).itemsize
+    if size > map_threshold:
+        clip = map_wav(file_name)
+        if clip is not None:
+            return clip
+        print(f"Warning! {file_name} can't be memory-mapped, reading {size} bytes")
+    return Clip(*sf.read(file_name, dtype=dtype, always_2d=True))
+
+
+class AudioCache:
+    """Clips by file name, read with `read(file_name)`, within `byte_budget` bytes by evicting the least recently used
+
+    Pinned clips (see `prefetch`) aren't evicted, they can exceed the budget. Memory-mapped clips take no space.
+    """
+
+    def __init__(self, read, byte_budget):
+        self._read = read
+        self.byte_budget = byte_budget
+        # file name: Clip, least recently used first
+        self._clips = OrderedDict()
+        self._pinned = set()
+        self.nbytes = 0
+        self._lock = Lock()
+        self._hits = metrics.counter(
+            "audio_cache_hits_total", "Clips played from the audio cache"
+        )
+        self._misses = metrics.counter(
+            "audio_cache_misses_total", "Clips read when they were played"
+        )
+        self._evictions = metrics.counter(
+            "audio_cache_evictions_total", "Clips evicted from the audio cache"
+        )
+        self._decode_duration = metrics.histogram(
+            "audio_decode_seconds", "Time to read a clip (decode or memory-map)"
+        )
+
+    def _read_clip(self, file_name):
+        start_time = perf_counter()
+        clip = self._read(file_name)
+        self._decode_duration.observe(perf_counter() - start_time)
+        return clip
+
+    def _add(self, file_name, clip):
+        """The cached clip, `clip` unless another thread read it in the meantime"""
+        with self._lock:
+            if file_name in self._clips:
+                return self._clips[file_name]
+            self._clips[file_name] = clip
+            self.nbytes += clip.nbytes
+            self._shrink()
+            return clip
+
+    def _remove(self, file_name):
+        # self._lock must be held
+        self.nbytes -= self._clips.pop(file_name).nbytes
+        self._evictions.increment()
+
+    def _shrink(self):
+        # self._lock must be held
+        for file_name in list(self._clips):
+            if self.nbytes <= self.byte_budget:
+                break
+            if file_name not in self._pinned:
+                self._remove(file_name)
+
+    def get(self, file_name):
+        """The cached clip (a hit) or the clip read now (a miss)"""
+        with self._lock:
+            clip = self._clips.get(file_name)
+            if clip is not None:
+                self._clips.move_to_end(file_name)
+                self._hits.increment()
+                return clip
+        self._misses.increment()
+        return self._add(file_name, self._read_clip(file_name))
+
+    def peek(self, file_name):
+        """The cached clip or None, without counting it as used"""
+        with self._lock:
+            return self._clips.get(file_name)
+
+    def prefetch(self, file_name):
+        """Reads a clip unless it is cached, it stays until `release`"""
+        with self._lock:
+            self._pinned.add(file_name)
+            clip = self._clips.get(file_name)
+            if clip is not None:
+                self._clips.move_to_end(file_name)
+                return clip
+        try:
+            return self._add(file_name, self._read_clip(file_name))
+        except Exception:
+            with self._lock:
+                self._pinned.discard(file_name)
+            raise
+
+    def release(self, file_name):
+        """Allows evicting a prefetched clip when the space is needed"""
+        with self._lock:
+            self._pinned.discard(file_name)
+            self._shrink()
+
+    def evict(self, file_name):
+        """Removes a clip now, voices playing it keep its data until they finish"""
+        with self._lock:
+            self._pinned.discard(file_name)
+            if file_name in self._clips:
+                self._remove(file_name)
+
+    def statistics(self):
+        with self._lock:
+            return {
+                "clips": len(self._clips),
+                "pinned": len(self._pinned),
+                "bytes": self.nbytes,
+                "byte_budget": self.byte_budget,
+                "hits": self._hits.value,
+                "misses": self._misses.value,
+                "evictions": self._evictions.value,
+                "decode_seconds": self._decode_duration.to_json(),
+            }
+
+
+class Voice:
+    """A clip playing in the mixer, change `gain` while it plays"""
+
+    def __init__(self, clip: Clip, gain=1.0, offset=0.0, at=None, generation=0):
+        self.clip = clip
+        self.gain = gain
+        # frame of the clip played next
+        self.position = int(offset * clip.samplerate)
+        # stream time to start at, None is the next buffer
+        self.at = at
+        self.generation = generation
+        self.stopped = False
+        self.finished = False
+
+
+class Mixer:
+    """Output stream callback summing all active voices into `channels` channels"""
+
+    def __init__(self, channels, samplerate, blocksize=DEFAULT_BLOCKSIZE):
+        self.channels = channels
+        self.samplerate = samplerate
+        # incremented to stop all voices that are currently playing
+        self.generation = 0
+        # added by other threads, taken by the callback
+        self._new_voices = deque()
+        # only used by the callback
+        self._voices = []
+        self._scratch = numpy.zeros((blocksize, channels), dtype=numpy.float32)
+        self._status_counter = metrics.counter(
+            "audio_stream_status_total",
+            "Output stream callbacks with under- or overflows",
+        )
+
+    def add(self, voice: Voice):
+        self._new_voices.append(voice)
+
+    def stop_all(self):
+        self.generation += 1
+
+    def callback(self, outdata, frames, time, status):
+        if status:
+            self._status_counter.increment()
+        while self._new_voices:
+            self._voices.append(self._new_voices.popleft())
+        if len(self._scratch) < frames:
+            self._scratch = numpy.zeros((frames, self.channels), dtype=numpy.float32)
+
+        outdata.fill(0)
+        finished = False
+        # whether the sum can exceed the range
+        mixed = 0
+        amplified = False
+        for voice in self._voices:
+            if voice.stopped or voice.generation != self.generation:
+                voice.finished = finished = True
+                continue
+
+            begin = 0
+            # some drivers don't report times
+            if voice.at is not None and time is not None and time.outputBufferDacTime:
+                begin = round((voice.at - time.outputBufferDacTime) * self.samplerate)
+                if begin >= frames:
+                    continue
+                if begin < 0:
+                    # late, skip what should have played already
+                    voice.position -= begin
+                    begin = 0
+                voice.at = None
+
+            data = voice.clip.data
+            count = min(frames - begin, len(data) - voice.position)
+            if count > 0:
+                channels = min(data.shape[1], self.channels)
+                chunk = data[voice.position : voice.position + count, :channels]
+                output = outdata[begin : begin + count, :channels]
+                mixed += 1
+                amplified = amplified or voice.gain > 1.0
+                if voice.gain == 1.0 and voice.clip.scale == 1.0:
+                    numpy.add(output, chunk, out=output)
+                else:
+                    # converts integer samples as well
+                    scratch = self._scratch[:count, :channels]
+                    numpy.multiply(chunk, voice.gain * voice.clip.scale, out=scratch)
+                    numpy.add(output, scratch, out=output)
+                voice.position += count
+            if voice.position >= len(data):
+                voice.finished = finished = True
+
+        if finished:
+            self._voices = [voice for voice in self._voices if not voice.finished]
+        if mixed > 1 or amplified:
+            numpy.clip(outdata, -1.0, 1.0, out=outdata)
 
 
 class Audio:
@@ -15,41 +344,131 @@ class Audio:
             return device["index"]
 
     def __init__(self):
-        self._audio_files = {}
+        self._map_threshold = config["client"].get(
+            Config.AUDIO_MAP_THRESHOLD, DEFAULT_AUDIO_MAP_THRESHOLD
+        )
+        self._cache = AudioCache(
+            lambda file_name: read_clip(file_name, self._map_threshold),
+            config["client"].get(Config.AUDIO_CACHE_BYTES, DEFAULT_AUDIO_CACHE_BYTES),
+        )
         self._device_index = Audio.discover_device_index()
+        self._mixer = None
+        self._stream = None
+        # preloading (on the prefetcher's thread) and playing may open the stream at the same time
+        self._stream_lock = Lock()
+        # perf_counter() time of the last failed attempt
+        self._stream_failed_at = None
+        # perf_counter() - stream time
+        self._clock_offset = 0.0
+
+    def _open_stream(self, samplerate):
+        """The mixer's stream, opened once with the samplerate of the first clip and all channels of the soundcard
+
+        After a failure it isn't opened again for `STREAM_RETRY_SECONDS`.
+        """
+        if self._stream is not None:
+            return
+        with self._stream_lock:
+            if self._stream is not None:
+                return
+            if (
+                self._stream_failed_at is not None
+                and perf_counter() - self._stream_failed_at < STREAM_RETRY_SECONDS
+            ):
+                return
+            channels = sd.query_devices(self._device_index)["max_output_channels"]
+            blocksize = config["client"]["soundcard"].get(
+                "blocksize", DEFAULT_BLOCKSIZE
+            )
+            mixer = Mixer(channels, samplerate, blocksize)
+            try:
+                stream = sd.OutputStream(
+                    samplerate=samplerate,
+                    device=self._device_index,
+                    channels=channels,
+                    dtype="float32",
+                    blocksize=blocksize,
+                    latency="low",
+                    callback=mixer.callback,
+                )
+                stream.start()
+            except sd.PortAudioError as error:
+                print(f"Failed to open the audio output: {error}")
+                self._stream_failed_at = perf_counter()
+                return
+            self._mixer = mixer
+            self._clock_offset = perf_counter() - stream.time
+            self._stream_failed_at = None
+            # last, the unlocked check above sees it only with the mixer
+            self._stream = stream
+
+    def close(self):
+        with self._stream_lock:
+            if self._stream is not None:
+                self._stream.close()
+                self._stream = None
+
+    def load(self, file_name):
+        """The cached clip, or the clip read now"""
+        return self._cache.get(file_name)
 
     def preload(self, file_name):
-        self._audio_files[file_name] = sf.read(file_name)  # , always_2d=True)
-
-    @threadable
-    def play_preloaded_file(self, file_name):
-        print(f"Starting: {file_name}")
-        event = threading.Event()
-        data, fs = self._audio_files[file_name]
-        print(f"Loaded {data.shape[1]} channel audio with {data.shape[0]} samples")
-        current_frame = 0
-
-        def callback(outdata, frames, time, status):
-            nonlocal current_frame
-            if status:
-                print(status)
-            chunksize = min(len(data) - current_frame, frames)
-            outdata[:chunksize] = data[current_frame : current_frame + chunksize]
-            if chunksize < frames:
-                outdata[chunksize:] = 0
-                raise sd.CallbackStop()
-            current_frame += chunksize
+        """Reads a clip ahead of playing it, it stays cached until `unload`"""
+        self._open_stream(self._cache.prefetch(file_name).samplerate)
 
-        try:
-            stream = sd.OutputStream(
-                samplerate=fs,
-                device=self._device_index,
-                channels=data.shape[1],
-                callback=callback,
-                finished_callback=event.set,
+    def unload(self, file_name):
+        """The clip may be evicted from now on, when the cache needs the space"""
+        self._cache.release(file_name)
+
+    def evict(self, file_name):
+        """Frees a clip that won't be played again"""
+        self._cache.evict(file_name)
+
+    def cache_statistics(self):
+        return self._cache.statistics()
+
+    def duration(self, file_name):
+        clip = self._cache.peek(file_name)
+        if clip is None:
+            return sf.info(file_name).duration
+        return clip.duration
+
+    def play(self, clip, at=None, gain=1.0, offset=0.0):
+        """Plays a `Clip` or file from `offset` seconds on, at the time `at` of perf_counter() or with the next buffer
+
+        Returns the `Voice`, or None if there's no audio output.
+        """
+        if not isinstance(clip, Clip):
+            clip = self.load(clip)
+        self._open_stream(clip.samplerate)
+        if self._stream is None:
+            return None
+        if clip.samplerate != self._mixer.samplerate:
+            print(
+                f"Warning! Clip with {clip.samplerate} Hz can't be played on the "
+                f"{self._mixer.samplerate} Hz output"
             )
-            with stream:
-                event.wait()
-            print(f"Finished: {file_name}")
-        except sd.PortAudioError:
-            print("Failed to play audio!")
+            return None
+
+        voice = Voice(
+            clip,
+            gain,
+            offset,
+            None if at is None else at - self._clock_offset,
+            self._mixer.generation,
+        )
+        self._mixer.add(voice)
+        return voice
+
+    @staticmethod
+    def stop(voice: Voice):
+        voice.stopped = True
+
+    def stop_all(self):
+        if self._mixer is not None:
+            self._mixer.stop_all()
+
+    def play_preloaded_file(self, file_name, offset=0.0):
+        if self._cache.peek(file_name) is None:
+            print(f"Warning! {file_name} wasn't preloaded")
+        self.play(file_name, offset=offset)
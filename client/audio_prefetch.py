@@ -0,0 +1,124 @@
+"""Prefetching of the audio a loaded play needs next, instead of preloading all of it
+
+The clips of all cues that play within the next `audio_prefetch` seconds (client config) of the playhead are read on a
+background thread. Clips that leave this window are evicted from the cache if no later cue plays them, otherwise they
+stay cached as long as the cache has space. See `client.streaming.AudioWindow` for streamed plays.
+
+The performance only wakes up for the frames of its timeline, so the frames at which the window changes
+(`change_frames`) are added to it. Clips that fail to load are read again when they are played, which raises the error.
+"""
+
+import math
+import os.path
+from bisect import bisect_right
+from threading import Condition, Thread
+
+from .show import Show
+
+
+class AudioPrefetcher:
+    def __init__(self, audio, show: Show, base_path, lookahead_seconds):
+        self._audio = audio
+        lookahead_frames = math.ceil(lookahead_seconds * show.fps)
+        # (first frame of the window, end frame, file) of every cue, in frame order
+        self._cues = []
+        # file: end frame of its last cue
+        self._last_end = {}
+        durations = {}
+        for cue_frame in show.audio_cue_frames():
+            for audio_file in show.audio(cue_frame):
+                path = os.path.join(base_path, audio_file)
+                if path not in durations:
+                    try:
+                        durations[path] = audio.duration(path)
+                    except Exception as error:
+                        print(f"Failed to read the duration of {path}: {error!r}")
+                        durations[path] = 0.0
+                # at least the cue's own frame
+                end = cue_frame + max(math.ceil(durations[path] * show.fps), 1)
+                self._cues.append((cue_frame - lookahead_frames, end, path))
+                self._last_end[path] = max(self._last_end.get(path, end), end)
+        # frames at which the wanted clips change
+        self.change_frames = sorted(
+            {start for start, _, _ in self._cues} | {end for _, end, _ in self._cues}
+        )
+
+        self._condition = Condition()
+        self._playhead = 0
+        # index into self.change_frames of the playhead's interval
+        self._interval = self._interval_of(0)
+        self._ready_interval = None
+        self._stopped = False
+
+    def _interval_of(self, frame_index):
+        return bisect_right(self.change_frames, frame_index)
+
+    def start(self):
+        Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+    def set_playhead(self, frame_index):
+        """Wakes the prefetcher only when the wanted clips change, at least at every one of `change_frames`"""
+        interval = self._interval_of(frame_index)
+        with self._condition:
+            self._playhead = frame_index
+            if interval != self._interval:
+                self._interval = interval
+                self._condition.notify_all()
+
+    def wait_until_ready(self):
+        """Wait until the audio around the current playhead is loaded"""
+        with self._condition:
+            while self._ready_interval != self._interval and not self._stopped:
+                self._condition.wait()
+
+    def _wanted(self, playhead):
+        """Files of the cues playing within the look-ahead window, the earliest first"""
+        wanted = {}
+        for start, end, path in self._cues:
+            if start > playhead:
+                break
+            if playhead < end:
+                wanted[path] = None
+        return list(wanted)
+
+    def _run(self):
+        loaded = set()
+        interval = None
+        while True:
+            with self._condition:
+                while self._interval == interval and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    break
+                interval = self._interval
+                playhead = self._playhead
+
+            wanted = self._wanted(playhead)
+            # free the space first
+            for path in loaded.difference(wanted):
+                if self._last_end[path] <= playhead:
+                    self._audio.evict(path)
+                else:
+                    self._audio.unload(path)
+            for path in wanted:
+                if path in loaded:
+                    continue
+                try:
+                    self._audio.preload(path)
+                except Exception as error:
+                    print(f"Failed to prefetch {path}: {error!r}")
+                    continue
+                loaded.add(path)
+            loaded.intersection_update(wanted)
+
+            with self._condition:
+                self._ready_interval = interval
+                self._condition.notify_all()
+
+        for path in loaded:
+            self._audio.unload(path)
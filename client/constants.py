@@ -1,8 +1,18 @@
 from enum import Enum
-from typing import NamedTuple, Union
+from typing import NamedTuple, Optional, Union
 from config.config import config
 
 RENDER_BASE_PATH = config["client"]["media_directory_absolute_path"]
+# Hz, independent of the play's fps
+DEFAULT_SERVO_UPDATE_RATE = 50
+DEFAULT_STREAMING_LOOKAHEAD_SECONDS = 30
+# Hz, the Raspberry Pi's default
+DEFAULT_I2C_BUS_CLOCK = 100_000
+# bytes, larger audio clips are memory-mapped instead of loaded
+DEFAULT_AUDIO_MAP_THRESHOLD = 16 * 1024 * 1024
+# bytes of read audio clips kept, the least recently used are evicted
+DEFAULT_AUDIO_CACHE_BYTES = 256 * 1024 * 1024
+DEFAULT_AUDIO_PREFETCH_SECONDS = 30
 
 
 class Language:
@@ -12,6 +22,27 @@ class Language:
 
 class Config:
     THREADING = "threading"
+    OVERRUN_POLICY = "overrun_policy"
+    SERVO_UPDATE_RATE = "servo_update_rate"
+    STREAMING = "streaming"
+    STREAMING_LOOKAHEAD = "streaming_lookahead"
+    SERVO_TRANSFORMS = "servo_transforms"
+    PSU_CHECK = "psu_check"
+    MOTION_UPDATE_RATE = "motion_update_rate"
+    PSU_VERIFICATION_INTERVAL = "psu_verification_interval"
+    LED_EXTENSION_INTERRUPT_PIN = "led_extension_interrupt_pin"
+    I2C_TRACE = "i2c_trace"
+    I2C_BUS_CLOCK = "i2c_bus_clock"
+    AUDIO_MAP_THRESHOLD = "audio_map_threshold"
+    AUDIO_CACHE_BYTES = "audio_cache_bytes"
+    AUDIO_PREFETCH = "audio_prefetch"
+
+
+class PSUCheck(Enum):
+    # every command checks that the PSU is on
+    COMMAND = "command"
+    # the commands of a frame (and its servo update) during a play check once
+    FRAME = "frame"
 
 
 # hardware
@@ -43,6 +74,10 @@ class LedExtensionPin:
     B_FLAT_MAJOR = 7
 
 
+# port B of the LED extension, see `Config.LED_EXTENSION_INTERRUPT_PIN`
+LED_EXTENSION_INPUT_PINS = range(8, 16)
+
+
 class ServoSide(Enum):
     LEFT = "left"
     RIGHT = "right"
@@ -75,33 +110,101 @@ class ServoName(Enum):
 
 class ServoConfig(NamedTuple):
     side: ServoSide
-    pin: Union[ServosLeftPin, ServosRightPin]
+    # a channel number for servos only defined in the config
+    pin: Union[ServosLeftPin, ServosRightPin, int]
     min_angle: float = 19
     max_angle: float = 71
+    # °/s and °/s² of moves by `client.motion.MotionEngine`, None is as fast as the servo can
+    max_speed: Optional[float] = None
+    max_acceleration: Optional[float] = None
 
 
+# drums hit as fast as possible, the crocodiles move smoothly
+CROCO_MAX_SPEED = 60
+CROCO_MAX_ACCELERATION = 240
+
 ServoConfigs = {
     ServoName.HIHAT: ServoConfig(ServoSide.LEFT, ServosLeftPin.HIHAT),
     ServoName.RIDE: ServoConfig(
         ServoSide.RIGHT, ServosRightPin.RIDE, min_angle=20, max_angle=65
     ),
     ServoName.CROCO_BASE_RIGHT: ServoConfig(
-        ServoSide.RIGHT, ServosRightPin.CROCO_BASE_RIGHT
+        ServoSide.RIGHT,
+        ServosRightPin.CROCO_BASE_RIGHT,
+        max_speed=CROCO_MAX_SPEED,
+        max_acceleration=CROCO_MAX_ACCELERATION,
     ),
     ServoName.CROCO_BASE_CENTER: ServoConfig(
-        ServoSide.RIGHT, ServosRightPin.CROCO_BASE_CENTER
+        ServoSide.RIGHT,
+        ServosRightPin.CROCO_BASE_CENTER,
+        max_speed=CROCO_MAX_SPEED,
+        max_acceleration=CROCO_MAX_ACCELERATION,
     ),
     ServoName.CROCO_BASE_LEFT: ServoConfig(
-        ServoSide.LEFT, ServosLeftPin.CROCO_BASE_LEFT
+        ServoSide.LEFT,
+        ServosLeftPin.CROCO_BASE_LEFT,
+        max_speed=CROCO_MAX_SPEED,
+        max_acceleration=CROCO_MAX_ACCELERATION,
     ),
     ServoName.CROCO_JAW_RIGHT: ServoConfig(
-        ServoSide.RIGHT, ServosRightPin.CROCO_JAW_RIGHT, min_angle=40, max_angle=60
+        ServoSide.RIGHT,
+        ServosRightPin.CROCO_JAW_RIGHT,
+        min_angle=40,
+        max_angle=60,
+        max_speed=CROCO_MAX_SPEED,
+        max_acceleration=CROCO_MAX_ACCELERATION,
     ),
     ServoName.CROCO_JAW_CENTER: ServoConfig(
-        ServoSide.LEFT, ServosLeftPin.CROCO_JAW_CENTER, min_angle=45, max_angle=62
+        ServoSide.LEFT,
+        ServosLeftPin.CROCO_JAW_CENTER,
+        min_angle=45,
+        max_angle=62,
+        max_speed=CROCO_MAX_SPEED,
+        max_acceleration=CROCO_MAX_ACCELERATION,
     ),
     ServoName.CROCO_JAW_LEFT: ServoConfig(
-        ServoSide.LEFT, ServosLeftPin.CROCO_JAW_LEFT, min_angle=28, max_angle=40
+        ServoSide.LEFT,
+        ServosLeftPin.CROCO_JAW_LEFT,
+        min_angle=28,
+        max_angle=40,
+        max_speed=CROCO_MAX_SPEED,
+        max_acceleration=CROCO_MAX_ACCELERATION,
+    ),
+}
+
+
+class ServoTransform(NamedTuple):
+    """angle = offset + scale * degrees(exported value), clamped to [clamp_min, clamp_max] where given"""
+
+    servo: ServoConfig
+    offset: float = 0
+    scale: float = 1
+    clamp_min: Optional[float] = None
+    clamp_max: Optional[float] = None
+
+
+# exported servo names, see `client.servo_transforms`
+ServoTransforms = {
+    "croco base right": ServoTransform(
+        ServoConfigs[ServoName.CROCO_BASE_RIGHT], offset=45
+    ),
+    "croco base center": ServoTransform(
+        ServoConfigs[ServoName.CROCO_BASE_CENTER], offset=45
+    ),
+    "croco base left": ServoTransform(
+        ServoConfigs[ServoName.CROCO_BASE_LEFT], offset=45
+    ),
+    "croco jaw center": ServoTransform(
+        ServoConfigs[ServoName.CROCO_JAW_CENTER], offset=62, scale=-0.55, clamp_min=45
+    ),
+    "croco jaw left": ServoTransform(
+        ServoConfigs[ServoName.CROCO_JAW_LEFT], offset=28, scale=0.7, clamp_max=40
+    ),
+    "croco jaw right": ServoTransform(
+        ServoConfigs[ServoName.CROCO_JAW_RIGHT],
+        offset=60,
+        scale=-1,
+        clamp_min=ServoConfigs[ServoName.CROCO_JAW_RIGHT].min_angle,
     ),
 }
 
@@ -0,0 +1,201 @@
+"""Servo motion as keyframed curves (as exported from Blender's F-Curves), evaluated at the client's own update rate
+
+Curve positions are given in (fractional) frames relative to the start of the play.
+"""
+
+from bisect import bisect_right
+
+import numpy
+
+
+class Interpolation:
+    CONSTANT = 0
+    LINEAR = 1
+    BEZIER = 2
+
+    NAMES = {"CONSTANT": CONSTANT, "LINEAR": LINEAR, "BEZIER": BEZIER}
+
+
+# one keyframe as exported: position, value, interpolation towards the next keyframe and both Bézier handles
+KEYFRAME_DTYPE = numpy.dtype(
+    [
+        ("x", "<f8"),
+        ("y", "<f8"),
+        ("interpolation", "<u4"),
+        ("left_x", "<f8"),
+        ("left_y", "<f8"),
+        ("right_x", "<f8"),
+        ("right_y", "<f8"),
+    ]
+)
+
+BEZIER_ITERATIONS = 24
+BEZIER_TOLERANCE = 1e-6
+
+
+def keyframes_from_export(exported_keyframes, servo_name=None):
+    """Convert `[x, y, interpolation name, left handle x, y, right handle x, y]` lists from `play.json`"""
+    keyframes = []
+    for x, y, interpolation, left_x, left_y, right_x, right_y in exported_keyframes:
+        if interpolation not in Interpolation.NAMES:
+            raise ValueError(
+                f"Unsupported interpolation {interpolation} of servo {servo_name}"
+            )
+        keyframes.append(
+            (x, y, Interpolation.NAMES[interpolation], left_x, left_y, right_x, right_y)
+        )
+    return numpy.array(keyframes, dtype=KEYFRAME_DTYPE)
+
+
+def keyframes_to_export(keyframes):
+    interpolation_names = {code: name for name, code in Interpolation.NAMES.items()}
+    return [
+        [x, y, interpolation_names[interpolation], left_x, left_y, right_x, right_y]
+        for x, y, interpolation, left_x, left_y, right_x, right_y in keyframes.tolist()
+    ]
+
+
+def keyframes_from_samples(samples):
+    """Hold each (frame, value) sample until the next one, like plays exported with one value per frame"""
+    return numpy.array(
+        [(x, y, Interpolation.CONSTANT, x, y, x, y) for x, y in samples],
+        dtype=KEYFRAME_DTYPE,
+    )
+
+
+class ServoCurve:
+    def __init__(self, keyframes):
+        if len(keyframes) == 0:
+            raise ValueError("A servo curve needs at least one keyframe")
+
+        self._x = keyframes["x"].tolist()
+        self._y = keyframes["y"].tolist()
+        self._interpolation = keyframes["interpolation"].tolist()
+        self._control_points = [
+            ServoCurve._correct_handles(keyframes[index], keyframes[index + 1])
+            if self._interpolation[index] == Interpolation.BEZIER
+            else None
+            for index in range(len(keyframes) - 1)
+        ]
+
+        # positions where motion starts (moving segments) or the value steps (constant segments)
+        change_points = set()
+        for index in range(len(keyframes) - 1):
+            if self._is_moving(index):
+                change_points.add(self._x[index])
+            elif (
+                self._interpolation[index] == Interpolation.CONSTANT
+                and self._y[index + 1] != self._y[index]
+            ):
+                change_points.add(self._x[index + 1])
+        self._change_points = sorted(change_points)
+
+    @staticmethod
+    def _correct_handles(start, end):
+        """Shorten handles that overlap in x, like Blender does, so the segment stays a function of x"""
+        x0, y0 = float(start["x"]), float(start["y"])
+        x3, y3 = float(end["x"]), float(end["y"])
+        x1, y1 = float(start["right_x"]), float(start["right_y"])
+        x2, y2 = float(end["left_x"]), float(end["left_y"])
+
+        length = x3 - x0
+        left_length = abs(x1 - x0)
+        right_length = abs(x3 - x2)
+        if left_length + right_length > length > 0:
+            factor = length / (left_length + right_length)
+            x1, y1 = x0 + (x1 - x0) * factor, y0 + (y1 - y0) * factor
+            x2, y2 = x3 + (x2 - x3) * factor, y3 + (y2 - y3) * factor
+        return x0, y0, min(max(x1, x0), x3), y1, min(max(x2, x0), x3), y2, x3, y3
+
+    def _is_moving(self, index):
+        interpolation = self._interpolation[index]
+        if interpolation == Interpolation.CONSTANT:
+            return False
+        if interpolation == Interpolation.LINEAR:
+            return self._y[index] != self._y[index + 1]
+        _, y0, _, y1, _, y2, _, y3 = self._control_points[index]
+        return not (y0 == y1 == y2 == y3)
+
+    def _segment(self, frame):
+        return bisect_right(self._x, frame) - 1
+
+    def evaluate(self, frame):
+        if frame <= self._x[0]:
+            return self._y[0]
+        if frame >= self._x[-1]:
+            return self._y[-1]
+
+        index = self._segment(frame)
+        interpolation = self._interpolation[index]
+        if interpolation == Interpolation.CONSTANT:
+            return self._y[index]
+        if interpolation == Interpolation.LINEAR:
+            x0, x1 = self._x[index], self._x[index + 1]
+            return self._y[index] + (self._y[index + 1] - self._y[index]) * (
+                (frame - x0) / (x1 - x0)
+            )
+        return ServoCurve._evaluate_bezier(self._control_points[index], frame)
+
+    @staticmethod
+    def _evaluate_bezier(control_points, frame):
+        x0, y0, x1, y1, x2, y2, x3, y3 = control_points
+
+        def bezier(t, p0, p1, p2, p3):
+            u = 1 - t
+            return u * u * u * p0 + 3 * u * u * t * p1 + 3 * u * t * t * p2 + t * t * t * p3
+
+        # x(t) is monotonic after the handle correction: Newton's method, falling back to bisection
+        low, high = 0.0, 1.0
+        t = (frame - x0) / (x3 - x0)
+        for _ in range(BEZIER_ITERATIONS):
+            error = bezier(t, x0, x1, x2, x3) - frame
+            if abs(error) < BEZIER_TOLERANCE:
+                break
+            if error > 0:
+                high = t
+            else:
+                low = t
+            u = 1 - t
+            slope = 3 * (u * u * (x1 - x0) + 2 * u * t * (x2 - x1) + t * t * (x3 - x2))
+            t = t - error / slope if slope != 0 else (low + high) / 2
+            if not low < t < high:
+                t = (low + high) / 2
+
+        return bezier(t, y0, y1, y2, y3)
+
+    def next_update(self, frame, tick):
+        """Position after `frame` at which the servo needs to be updated next, None if it won't change anymore
+
+        While the curve moves, updates are `tick` frames apart (and hit the end of each segment exactly).
+        """
+        index = self._segment(frame)
+        if 0 <= index < len(self._control_points) and self._is_moving(index):
+            return min(frame + tick, self._x[index + 1])
+
+        change_index = bisect_right(self._change_points, frame)
+        if change_index < len(self._change_points):
+            return self._change_points[change_index]
+        return None
+
+
+class ServoTrack:
+    """All servo curves of a play, updated together at `update_rate` (Hz) while any of them moves"""
+
+    def __init__(self, curves, fps, update_rate):
+        self.names = list(curves)
+        self._curves = [curves[name] for name in self.names]
+        # frames between two updates
+        self.tick = fps / update_rate
+
+    def values(self, frame):
+        return [curve.evaluate(frame) for curve in self._curves]
+
+    def next_update(self, frame):
+        next_updates = [
+            next_update
+            for next_update in (
+                curve.next_update(frame, self.tick) for curve in self._curves
+            )
+            if next_update is not None
+        ]
+        return min(next_updates) if next_updates else None
@@ -2,9 +2,89 @@
 
 # copied from: https://github.com/adafruit/Adafruit-Raspberry-Pi-Python-Code/tree/legacy
 
+from functools import lru_cache
+from threading import Lock, RLock
+
 import smbus
 
 
+# ===========================================================================
+# SharedSMBus Class
+# ===========================================================================
+
+
+class SharedSMBus(object):
+    """One `smbus.SMBus` handle per bus number, shared by all devices on it
+
+    Every call holds the bus' `lock`, hold it yourself to make a sequence of calls (e.g. read-modify-write) atomic.
+    `i2c_rdwr` (combined transfers without a stop in between) is available if the smbus implementation has it, see
+    `write_read`.
+    """
+
+    METHODS = [
+        "write_byte_data",
+        "read_byte_data",
+        "write_word_data",
+        "read_word_data",
+        "write_i2c_block_data",
+        "read_i2c_block_data",
+        "write_byte",
+        "read_byte",
+        "i2c_rdwr",
+    ]
+
+    _buses = {}
+    _busesLock = Lock()
+
+    @staticmethod
+    def get(busnum):
+        with SharedSMBus._busesLock:
+            if busnum not in SharedSMBus._buses:
+                SharedSMBus._buses[busnum] = SharedSMBus(busnum)
+            return SharedSMBus._buses[busnum]
+
+    @staticmethod
+    def reset():
+        "Forgets all handles, e.g. after smbus was replaced"
+        with SharedSMBus._busesLock:
+            SharedSMBus._buses.clear()
+
+    def __init__(self, busnum):
+        self._bus = smbus.SMBus(busnum)
+        self.lock = RLock()
+        for method in SharedSMBus.METHODS:
+            if hasattr(self._bus, method):
+                setattr(self, method, self._locked(getattr(self._bus, method)))
+
+    def _locked(self, function):
+        def locked_function(*args, **kwargs):
+            with self.lock:
+                return function(*args, **kwargs)
+
+        return locked_function
+
+    def write_read(self, addr, reg_bytes, n):
+        """Writes `reg_bytes` (e.g. a register address) and reads `n` bytes from the device, returned as a list
+
+        With `i2c_rdwr` (smbus2) it's one combined transfer with a repeated start. Otherwise the bytes are written and
+        then read one by one under the bus' lock: no other device gets in between, but there are stops in between. So
+        the fallback only works with devices that keep their register pointer until the next write (and auto-increment
+        it while reading).
+        """
+        with self.lock:
+            if hasattr(self._bus, "i2c_rdwr") and hasattr(smbus, "i2c_msg"):
+                write = smbus.i2c_msg.write(addr, list(reg_bytes))
+                read = smbus.i2c_msg.read(addr, n)
+                self._bus.i2c_rdwr(write, read)
+                return list(read)
+
+            if len(reg_bytes) == 1:
+                self._bus.write_byte(addr, reg_bytes[0])
+            else:
+                self._bus.write_i2c_block_data(addr, reg_bytes[0], list(reg_bytes[1:]))
+            return [self._bus.read_byte(addr) for _ in range(n)]
+
+
 # ===========================================================================
 # Adafruit_I2C Class
 # ===========================================================================
@@ -12,6 +92,7 @@ import smbus
 
 class Adafruit_I2C(object):
     @staticmethod
+    @lru_cache(maxsize=None)
     def getPiRevision():
         "Gets the version number of the Raspberry Pi board"
         # Courtesy quick2wire-python-api
@@ -24,6 +105,8 @@ class Adafruit_I2C(object):
                         return 1 if line.rstrip()[-1] in ["2", "3"] else 2
         except:
             return 0
+        # not a Raspberry Pi
+        return 0
 
     @staticmethod
     def getPiI2CBusNumber():
@@ -32,11 +115,11 @@ class Adafruit_I2C(object):
 
     def __init__(self, address, busnum=-1, debug=False):
         self.address = address
-        # By default, the correct I2C bus is auto-detected using /proc/cpuinfo
+        # By default, the correct I2C bus is auto-detected using /proc/cpuinfo (once)
         # Alternatively, you can hard-code the bus version below:
-        # self.bus = smbus.SMBus(0); # Force I2C0 (early 256MB Pi's)
-        # self.bus = smbus.SMBus(1); # Force I2C1 (512MB Pi's)
-        self.bus = smbus.SMBus(
+        # self.bus = SharedSMBus.get(0); # Force I2C0 (early 256MB Pi's)
+        # self.bus = SharedSMBus.get(1); # Force I2C1 (512MB Pi's)
+        self.bus = SharedSMBus.get(
             busnum if busnum >= 0 else Adafruit_I2C.getPiI2CBusNumber()
         )
         self.debug = debug
@@ -95,6 +178,18 @@ class Adafruit_I2C(object):
         except IOError as err:
             return self.errMsg()
 
+    def update8(self, reg, function):
+        "Replaces the 8-bit value of a register with function(value), no other access to the bus in between"
+        try:
+            with self.bus.lock:
+                value = function(self.bus.read_byte_data(self.address, reg))
+                self.bus.write_byte_data(self.address, reg, value)
+            if self.debug:
+                print("I2C: Updated register 0x%02X to 0x%02X" % (reg, value))
+            return value
+        except IOError as err:
+            return self.errMsg()
+
     def readList(self, reg, length):
         "Read a list of bytes from the I2C device"
         try:
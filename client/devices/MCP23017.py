@@ -1,8 +1,10 @@
 #!/usr/bin/python
 
 from .Adafruit_I2C import Adafruit_I2C
+from ..metrics import CountedI2CDevice
 import smbus
 import time
+from threading import Lock
 import math
 
 MCP23017_IODIRA = 0x00
@@ -54,7 +56,9 @@ class MCP23017(object):
             num_gpios >= 0 and num_gpios <= 16
         ), "Number of GPIOs must be between 0 and 16"
         # busnum being negative will have Adafruit_I2C figure out what is appropriate for your Pi
-        self.i2c = Adafruit_I2C(address=address, busnum=busnum)
+        self.i2c = CountedI2CDevice(
+            Adafruit_I2C(address=address, busnum=busnum), address
+        )
         self.address = address
         self.num_gpios = num_gpios
 
@@ -63,6 +67,9 @@ class MCP23017(object):
         self.i2c.write8(MCP23017_IODIRB, 0xFF)  # all inputs on port B
         self.i2c.write8(MCP23017_GPIOA, 0x00)  # output register to 0
         self.i2c.write8(MCP23017_GPIOB, 0x00)  # output register to 0
+        # copy of the output latch (OLATB << 8 | OLATA), so that changing pins doesn't read it first
+        self.latch = 0x0000
+        self.latchLock = Lock()
 
         # read the current direction of all pins into instance variable
         # self.direction used for assertions in a few methods methods
@@ -105,9 +112,11 @@ class MCP23017(object):
             pin,
             7,
         )
-        # if we don't know what the current register's full value is, get it first
+        # if we don't know what the current register's full value is, read it in the same atomic update
         if not curValue:
-            curValue = self.i2c.readU8(register)
+            return self.i2c.update8(
+                register, lambda current: self._changeBit(current, pin, value)
+            )
         # set the single bit that corresponds to the specific pin within the full register value
         newValue = self._changeBit(curValue, pin, value)
         # write and return the full register value
@@ -154,20 +163,53 @@ class MCP23017(object):
         assert (
             pin >= 0 and pin < self.num_gpios
         ), "Pin number %s is invalid, only 0-%s are valid" % (pin, self.num_gpios)
-        assert self.direction & (1 << pin) == 0, "Pin %s not set to output" % pin
-        # if the pin is < 8, use register from first bank
-        if pin < 8:
-            self.outputvalue = self._readAndChangePin(
-                MCP23017_GPIOA, pin, value, self.i2c.readU8(MCP23017_OLATA)
-            )
-        else:
-            # otherwise use register from second bank
-            # readAndChangePin accepts pin relative to register though, so subtract
-            self.outputvalue = self._readAndChangePin(
-                MCP23017_GPIOB, pin - 8, value, self.i2c.readU8(MCP23017_OLATB)
-            )
+        assert value == 1 or value == 0, "Value is %s must be 1 or 0" % value
+        self.set_pins({pin: value})
+        # value of the pin's bank, as before
+        self.outputvalue = (self.latch >> 8 if pin >= 8 else self.latch) & 0xFF
         return self.outputvalue
 
+    # set several output pins ({pin: 1 or 0}), only banks that change are written
+    # returns the whole latch (OLATB << 8 | OLATA)
+    def set_pins(self, values):
+        with self.latchLock:
+            latch = self.latch
+            for pin, value in values.items():
+                assert (
+                    pin >= 0 and pin < self.num_gpios
+                ), "Pin number %s is invalid, only 0-%s are valid" % (pin, self.num_gpios)
+                assert self.direction & (1 << pin) == 0, "Pin %s not set to output" % pin
+                latch = self._changeBit(latch, pin, 1 if value else 0)
+            self._writeLatch(latch)
+            return latch
+
+    # set all 8 pins of a bank (0 or 1) at once, in one transaction
+    def write_port(self, port, mask):
+        assert port == 0 or port == 1, "Port must be 0 or 1!"
+        assert 0 <= mask <= 0xFF, "Mask %s must be 8 bits" % mask
+        with self.latchLock:
+            shift = 8 * port
+            self._writeLatch(self.latch & ~(0xFF << shift) | mask << shift)
+
+    # set all 16 pins (port B in the high byte) at once, in one transaction
+    def write_ports(self, mask):
+        assert 0 <= mask <= 0xFFFF, "Mask %s must be 16 bits" % mask
+        with self.latchLock:
+            self._writeLatch(mask, force=True)
+
+    # write the banks of the latch that changed, both in one transaction if needed
+    # latchLock must be held
+    def _writeLatch(self, latch, force=False):
+        changed = 0xFFFF if force else latch ^ self.latch
+        self.latch = latch
+        if changed & 0xFF and changed >> 8:
+            # IOCON.BANK is 0, so GPIOB follows GPIOA
+            self.i2c.write16(MCP23017_GPIOA, latch)
+        elif changed & 0xFF:
+            self.i2c.write8(MCP23017_GPIOA, latch & 0xFF)
+        elif changed >> 8:
+            self.i2c.write8(MCP23017_GPIOB, latch >> 8)
+
     # read the value of a pin
     # return a 1 or 0
     def input(self, pin):
@@ -296,6 +338,19 @@ class MCP23017(object):
         elif port == 1:
             return self._readInterruptRegister(1)
 
+    # read which pins caused the interrupt, their values when it happened and their current values in one transaction
+    # (INTFA to GPIOB are consecutive registers), which clears the interrupt
+    # returns (flags, captured, current), 16 bits each with port B in the high byte, or None if the read failed
+    def read_interrupt_capture(self):
+        values = self.i2c.readList(MCP23017_INTFA, 6)
+        if not isinstance(values, list):
+            return None
+        return (
+            values[1] << 8 | values[0],
+            values[3] << 8 | values[2],
+            values[5] << 8 | values[4],
+        )
+
     # check to see if there is an interrupt pending 3 times in a row (indicating it's stuck)
     # and if needed clear the interrupt without reading values
     # return 0 if everything is ok
@@ -328,6 +383,7 @@ class MCP23017(object):
         # make sure the output registers are set to off
         self.i2c.write8(MCP23017_GPIOA, 0x00)
         self.i2c.write8(MCP23017_GPIOB, 0x00)
+        self.latch = 0x0000
         # disable the pull-ups on all ports
         self.i2c.write8(MCP23017_GPPUA, 0x00)
         self.i2c.write8(MCP23017_GPPUB, 0x00)
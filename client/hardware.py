@@ -1,8 +1,21 @@
-from time import sleep
+from contextlib import contextmanager
+from functools import partial
+import math
+from threading import Event, Lock, Thread, local
+from time import perf_counter, sleep
 import RPi.GPIO as GPIO
-from .devices.MCP23017 import MCP23017
+from config.config import config
+from .devices.MCP23017 import (
+    MCP23017,
+    MCP23017_GPIOA,
+    MCP23017_GPIOB,
+    MCP23017_OLATA,
+    MCP23017_OLATB,
+)
 from Adafruit_PCA9685 import PCA9685
 from .constants import (
+    DEFAULT_SERVO_UPDATE_RATE,
+    LED_EXTENSION_INPUT_PINS,
     OnboardPin,
     LedExtensionPin,
     ServoConfigs,
@@ -10,9 +23,15 @@ from .constants import (
     ServoSide,
     I2CAddress,
     Language,
+    Config,
 )
+from .i2c_bus import BusPriority, QueuedI2C, QueuedI2CDevice
+from .led_patterns import PATTERNS, LEDPatternEngine, Merge, lightshow
+from .metrics import metrics
+from .motion import MotionEngine, TrapezoidalProfile
 from .performance import Performance
 from .midi import MIDI
+from .timer import Timer
 from .microphone import Microphone
 from .audio import Audio
 
@@ -21,56 +40,248 @@ GPIO.setmode(GPIO.BCM)
 
 
 class PSU:
-    def __init__(self):
+    """Keeps the state it switched to, so that checking it doesn't read the GPIO
+
+    With a `verification_interval` (seconds), a thread reads the GPIO at that rate and corrects the state if it was
+    changed externally.
+    """
+
+    def __init__(self, verification_interval=None):
         GPIO.setup(OnboardPin.PSU, GPIO.OUT)
+        self._lock = Lock()
+        self._on = GPIO.input(OnboardPin.PSU) == GPIO.HIGH
+        self._switch_offs = 0
+        self._batch = local()
+        self._external_changes = metrics.counter(
+            "psu_external_changes_total",
+            "PSU state changes found by verification, not made by the client",
+        )
+        self._stop_verification = Event()
+        if verification_interval:
+            Thread(
+                target=self._verify_periodically,
+                args=(verification_interval,),
+                daemon=True,
+            ).start()
 
     def turn_on(self):
-        GPIO.output(OnboardPin.PSU, GPIO.HIGH)
+        with self._lock:
+            GPIO.output(OnboardPin.PSU, GPIO.HIGH)
+            self._on = True
 
     def turn_off(self):
-        GPIO.output(OnboardPin.PSU, GPIO.LOW)
+        with self._lock:
+            GPIO.output(OnboardPin.PSU, GPIO.LOW)
+            self._on = False
+            self._switch_offs += 1
 
     def is_on(self):
-        return GPIO.input(OnboardPin.PSU) == GPIO.HIGH
+        return self._on
+
+    def check(self):
+        """Raises a RuntimeError if the PSU is off, within a batch only the first check does"""
+        if getattr(self._batch, "checked", None) == self._switch_offs:
+            return
+        if not self._on:
+            raise RuntimeError("PSU is not switched on")
+        if getattr(self._batch, "active", False):
+            # until the PSU is switched off
+            self._batch.checked = self._switch_offs
+
+    @contextmanager
+    def batch(self):
+        """Commands within (in the same thread) check the PSU only once"""
+        previous = (
+            getattr(self._batch, "active", False),
+            getattr(self._batch, "checked", None),
+        )
+        self._batch.active = True
+        try:
+            yield
+        finally:
+            self._batch.active, self._batch.checked = previous
+
+    def verify(self):
+        """Reads the GPIO and corrects the state if it was changed externally"""
+        with self._lock:
+            on = GPIO.input(OnboardPin.PSU) == GPIO.HIGH
+            if on != self._on:
+                print(f"Warning! PSU was switched {'on' if on else 'off'} externally")
+                self._external_changes.increment()
+                self._on = on
+                if not on:
+                    self._switch_offs += 1
+        return on
+
+    def stop_verification(self):
+        self._stop_verification.set()
+
+    def _verify_periodically(self, interval):
+        while not self._stop_verification.wait(interval):
+            self.verify()
+
+
+class ExpanderInputs:
+    """Input pins of an MCP23017, read once per interrupt instead of being polled
+
+    The expander's INT line (both ports mirrored, active low) must be connected to `interrupt_pin`. Inputs have
+    pull-ups, so pressing a button connected to ground is a falling edge. Changes of a pin within `bouncetime` (ms, as
+    in `RPi.GPIO`) after one of its events don't cause events, but are kept track of: if the pin's level differs from
+    its last event at the end of that time, the event follows then (scheduled on `timer`).
+    """
+
+    def __init__(self, mcp: MCP23017, interrupt_pin, pins, timer, bouncetime=50):
+        self._mcp = mcp
+        self._timer = timer
+        self._bouncetime = bouncetime / 1000
+        self._lock = Lock()
+        # pin: [(edge, callback)]
+        self._subscribers = {pin: [] for pin in pins}
+        # pin: time of the last event
+        self._event_times = {pin: -math.inf for pin in pins}
+        # pin: timer handle of the check at the end of the bounce time
+        self._resyncs = {}
+
+        for pin in pins:
+            mcp.pinMode(pin, MCP23017.INPUT)
+            mcp.pullUp(pin, 1)
+        mcp.configSystemInterrupt(MCP23017.INTMIRRORON, MCP23017.INTPOLACTIVELOW)
+        for pin in pins:
+            mcp.configPinInterrupt(
+                pin, MCP23017.INTERRUPTON, MCP23017.INTERRUPTCOMPAREPREVIOUS
+            )
+        # clears a pending interrupt, otherwise INT would stay low without an edge
+        capture = mcp.read_interrupt_capture()
+        self._levels = 0xFFFF if capture is None else capture[2]
+        # levels as of the last events
+        self._reported = self._levels
+
+        GPIO.setup(interrupt_pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+        GPIO.add_event_detect(interrupt_pin, GPIO.FALLING, callback=self._on_interrupt)
+
+    def probe(self, pin):
+        """Level of the pin as of the last interrupt, without reading the expander"""
+        return self._levels >> pin & 1
+
+    def subscribe(self, pin, callback, edge=GPIO.FALLING):
+        """Calls `callback(pin)` on `edge` (`GPIO.FALLING`, `GPIO.RISING` or `GPIO.BOTH`) of an input pin"""
+        if pin not in self._subscribers:
+            raise ValueError(f"Pin {pin} is not an input")
+        with self._lock:
+            self._subscribers[pin].append((edge, callback))
+
+    def _on_interrupt(self, channel):
+        capture = self._mcp.read_interrupt_capture()
+        if capture is None:
+            print("Reading the expander interrupt failed")
+            return
+        flags, captured, current = capture
+        now = self._timer()
+
+        events = []
+        with self._lock:
+            for pin in self._subscribers:
+                # the value at the interrupt first, then changes while it was pending
+                for value in (captured, current) if flags >> pin & 1 else (current,):
+                    level = value >> pin & 1
+                    if level == self.probe(pin):
+                        continue
+                    self._levels ^= 1 << pin
+                    bounce_end_time = self._event_times[pin] + self._bouncetime
+                    if now < bounce_end_time:
+                        if pin not in self._resyncs:
+                            self._resyncs[pin] = self._timer.call_at(
+                                bounce_end_time, lambda pin=pin: self._resync(pin)
+                            )
+                        continue
+                    events += self._event(pin, now)
+
+        for callback, pin in events:
+            callback(pin)
+
+    def _event(self, pin, now):
+        """(callback, pin) of the subscribers to the pin's change to its current level, if it changed"""
+        # self._lock must be held
+        level = self.probe(pin)
+        if level == self._reported >> pin & 1:
+            return []
+        self._reported ^= 1 << pin
+        self._event_times[pin] = now
+        edge = GPIO.RISING if level else GPIO.FALLING
+        return [
+            (callback, pin)
+            for subscribed_edge, callback in self._subscribers[pin]
+            if subscribed_edge in (edge, GPIO.BOTH)
+        ]
+
+    def _resync(self, pin):
+        with self._lock:
+            del self._resyncs[pin]
+            events = self._event(pin, self._timer())
+        for callback, pin in events:
+            callback(pin)
 
 
 class LEDExtension:
-    def __init__(self):
+    """Patterns and lightshows return immediately, they are played on the timer (see `client.led_patterns`)"""
+
+    def __init__(self, timer: Timer):
         self._mcp = MCP23017(address=I2CAddress.LED_EXTENSION, num_gpios=16)
+        self._mcp.i2c = QueuedI2CDevice(
+            self._mcp.i2c,
+            I2CAddress.LED_EXTENSION,
+            BusPriority.LEDS,
+            coalesced_registers=(
+                MCP23017_GPIOA,
+                MCP23017_GPIOB,
+                MCP23017_OLATA,
+                MCP23017_OLATB,
+            ),
+        )
         for pin in range(8):
             self._mcp.pinMode(pin, MCP23017.OUTPUT)
 
+        # the LEDs are port A
+        self._patterns = LEDPatternEngine(
+            lambda mask: self._mcp.write_port(0, mask), timer
+        )
         self.turn_all_off()
 
+        # None unless the expander's INT line is connected
+        interrupt_pin = config["client"].get(Config.LED_EXTENSION_INTERRUPT_PIN)
+        self.inputs = (
+            ExpanderInputs(self._mcp, interrupt_pin, LED_EXTENSION_INPUT_PINS, timer)
+            if interrupt_pin is not None
+            else None
+        )
+
     def turn_all_off(self):
-        for pin in range(8):
-            self._mcp.output(pin, MCP23017.LOW)
+        """Stops all patterns as well"""
+        self._patterns.clear()
 
     def set(self, pin, value: bool):
-        self._mcp.output(pin, MCP23017.HIGH if value else MCP23017.LOW)
+        self._patterns.set({pin: value})
 
-    def lightshow(self, time_per_step=1, reverse=False):
-        pins = [
-            LedExtensionPin.B_FLAT_MAJOR,
-            LedExtensionPin.F_MAJOR,
-            LedExtensionPin.C_MAJOR,
-            LedExtensionPin.G_MINOR,
-            LedExtensionPin.D_MAJOR,
-            LedExtensionPin.D_MINOR,
-            LedExtensionPin.A_MAJOR,
-            LedExtensionPin.A_MINOR,
-        ]
-        if reverse:
-            pins.reverse()
+    def set_many(self, values):
+        """{pin: bool}, e.g. switching from one chord to another, in one I2C transaction"""
+        self._patterns.set(values)
 
-        for pin in pins:
-            self._mcp.output(pin, MCP23017.HIGH)
-            sleep(time_per_step)
-            self._mcp.output(pin, MCP23017.LOW)
+    def start_pattern(self, name: str, merge: str = "or"):
+        """Starts a pattern of `client.led_patterns.PATTERNS`, merged by `merge` ("or", "xor" or "replace")"""
+        if name not in PATTERNS:
+            raise ValueError(f"Unknown LED pattern: {name}")
+        self._patterns.start(name, PATTERNS[name], Merge(merge))
+
+    def stop_pattern(self, name: str):
+        self._patterns.stop(name)
+
+    def lightshow(self, time_per_step=1, reverse=False):
+        self._patterns.start("lightshow", lightshow(time_per_step, reverse))
 
     def long_lightshow(self, iterations=6, time_per_step=0.2):
-        for iteration in range(iterations):
-            self.lightshow(time_per_step, reverse=(iteration % 2 == 0))
+        self._patterns.start(
+            "lightshow", lightshow(time_per_step, reverse=True, iterations=iterations)
+        )
 
     def set_c_major(self, value: bool):
         self.set(LedExtensionPin.C_MAJOR, value)
@@ -136,8 +347,7 @@ class Organ:
         GPIO.setup(OnboardPin.ORGAN, GPIO.OUT)
 
     def turn_on(self):
-        if not self._psu.is_on():
-            raise RuntimeError("PSU is not switched on")
+        self._psu.check()
 
         GPIO.output(OnboardPin.ORGAN, GPIO.HIGH)
 
@@ -149,12 +359,88 @@ class Servos:
     FREQUENCY = 330
     DEFAULT_TRAVEL_SPEED = 0.013
 
+    # PCA9685 registers
+    MODE1 = 0x00
+    MODE2 = 0x01
+    LED0_ON_L = 0x06
+    PRESCALE = 0xFE
+    RESTART = 0x80
+    AUTO_INCREMENT = 0x20
+    SLEEP = 0x10
+    ALLCALL = 0x01
+    OUTDRV = 0x04
+    CHANNELS = 16
+    # SMBus block writes are limited to 32 bytes, 4 registers per channel
+    CHANNELS_PER_BLOCK = 8
+
     def __init__(self, psu: PSU):
         self._psu = psu
-        self._servos_left = PCA9685(address=I2CAddress.SERVOS_LEFT)
-        self._servos_left.set_pwm_freq(Servos.FREQUENCY)
-        self._servos_right = PCA9685(address=I2CAddress.SERVOS_RIGHT)
-        self._servos_right.set_pwm_freq(Servos.FREQUENCY)
+        # the LED registers of all channels
+        i2c = QueuedI2C(
+            BusPriority.SERVOS,
+            coalesced_registers=range(
+                Servos.LED0_ON_L, Servos.LED0_ON_L + 4 * Servos.CHANNELS
+            ),
+        )
+        self._servos_left = PCA9685(address=I2CAddress.SERVOS_LEFT, i2c=i2c)
+        self._servos_right = PCA9685(address=I2CAddress.SERVOS_RIGHT, i2c=i2c)
+        self._drivers = {
+            ServoSide.LEFT: self._servos_left,
+            ServoSide.RIGHT: self._servos_right,
+        }
+        # (on, off) ticks last written per channel, queued writes update them right away
+        # PCA9685 turns all channels off when initialized
+        self._shadow = {side: [(0, 0)] * Servos.CHANNELS for side in ServoSide}
+        # channels whose queued write failed, they're written again with the next update
+        self._dirty = {side: set() for side in ServoSide}
+        for side, driver in self._drivers.items():
+            driver._device.on_write_error = partial(self._on_write_error, side)
+            driver._device.job(Servos._initialize)
+
+        self._set_duration = metrics.histogram(
+            "servo_set_seconds", "Duration of Servos.set, including the I2C writes"
+        )
+        self._set_many_duration = metrics.histogram(
+            "servo_set_many_seconds",
+            "Duration of Servos.set_many, including the I2C writes",
+        )
+        self._channel_writes = metrics.counter(
+            "servo_channel_writes_total",
+            "Servo channel updates, written or skipped as unchanged",
+            result="written",
+        )
+        self._skipped_channel_writes = metrics.counter(
+            "servo_channel_writes_total",
+            "Servo channel updates, written or skipped as unchanged",
+            result="skipped",
+        )
+
+    @staticmethod
+    def _initialize(device):
+        """`PCA9685.__init__` and `set_pwm_freq` with auto-increment, as one job on the bus so that the oscillator's
+        5 ms are kept
+
+        The mode isn't read from the board, after a reset it's asleep.
+        """
+        prescale = int(25000000.0 / 4096.0 / Servos.FREQUENCY - 1.0 + 0.5)
+        mode = Servos.ALLCALL | Servos.AUTO_INCREMENT
+        device.write8(Servos.MODE2, Servos.OUTDRV)
+        device.write8(Servos.MODE1, mode)
+        # the oscillator wakes up
+        sleep(0.005)
+        device.write8(Servos.MODE1, mode | Servos.SLEEP)
+        device.write8(Servos.PRESCALE, prescale)
+        device.write8(Servos.MODE1, mode)
+        sleep(0.005)
+        device.write8(Servos.MODE1, mode | Servos.RESTART)
+
+    def _on_write_error(self, side: ServoSide, operation, args, error):
+        if operation != "writeList":
+            return
+        first_channel = (args[0] - Servos.LED0_ON_L) // 4
+        self._dirty[side].update(
+            range(first_channel, first_channel + len(args[1]) // 4)
+        )
 
     @staticmethod
     def _angle_to_pulse_width(angle):
@@ -162,9 +448,16 @@ class Servos:
 
     @staticmethod
     def estimate_travel_time(servo_name: ServoName, angle: float):
-        return abs(angle) * Servos.DEFAULT_TRAVEL_SPEED
+        servo_config = ServoConfigs[servo_name]
+        profile = TrapezoidalProfile(
+            0, angle, 0, servo_config.max_speed, servo_config.max_acceleration
+        )
+        # the limits may be above what the servo can do
+        return max(profile.duration, abs(angle) * Servos.DEFAULT_TRAVEL_SPEED)
 
-    def set(self, servo_name: ServoName, angle: float):
+    @staticmethod
+    def check_angle(servo_name: ServoName, angle: float):
+        """Raises a ValueError if the servo doesn't exist or the angle is outside of its range, returns its config"""
         try:
             servo_config = ServoConfigs[servo_name]
         except KeyError:
@@ -176,22 +469,132 @@ class Servos:
                 f'{servo_config.max_angle:.1f}°] for servo "{servo_name.value}"!'
             )
 
-        if not self._psu.is_on():
-            raise RuntimeError("PSU is not switched on")
+        return servo_config
 
-        servo_driver = (
-            self._servos_left
-            if servo_config.side == ServoSide.LEFT
-            else self._servos_right
-        )
-        servo_driver.set_pwm(
-            servo_config.pin.value, 0, Servos._angle_to_pulse_width(angle)
+    def check_psu(self):
+        self._psu.check()
+
+    def last_angle(self, servo_name: ServoName):
+        """Angle last written to a servo, None if it's off"""
+        servo_config = ServoConfigs[servo_name]
+        _, off = self._shadow[servo_config.side][servo_config.pin.value]
+        return off / (Servos.FREQUENCY / 10) if off else None
+
+    def set(self, servo_name: ServoName, angle: float):
+        start_time = perf_counter()
+        servo_config = Servos.check_angle(servo_name, angle)
+        self._psu.check()
+
+        self._write_channels(
+            servo_config.side,
+            {servo_config.pin.value: Servos._angle_to_pulse_width(angle)},
         )
+        self._set_duration.observe(perf_counter() - start_time)
+
+    def set_many(self, angles):
+        """Sets several servos ({servo name: angle}) at once, with one or two I2C transactions per board
+
+        All angles are checked before any servo moves.
+        """
+        start_time = perf_counter()
+        pulse_widths = {side: {} for side in ServoSide}
+        for servo_name, angle in angles.items():
+            servo_config = Servos.check_angle(servo_name, angle)
+            pulse_widths[servo_config.side][
+                servo_config.pin.value
+            ] = Servos._angle_to_pulse_width(angle)
+
+        self._psu.check()
+
+        for side, side_pulse_widths in pulse_widths.items():
+            if side_pulse_widths:
+                self._write_channels(side, side_pulse_widths)
+        self._set_many_duration.observe(perf_counter() - start_time)
+
+    def set_pulse_widths(self, pulse_widths):
+        """Sets {side: {channel: pulse width}} as computed by `client.servo_transforms`, which checks the ranges"""
+        start_time = perf_counter()
+        self._psu.check()
+
+        for side, side_pulse_widths in pulse_widths.items():
+            self._write_channels(side, side_pulse_widths)
+        self._set_many_duration.observe(perf_counter() - start_time)
+
+    def resync(self):
+        """Writes the frequency, mode and last written values of all channels to both boards (e.g. after a power cycle)"""
+        for side, driver in self._drivers.items():
+            driver._device.job(Servos._initialize)
+            self._dirty[side].clear()
+            shadow = self._shadow[side]
+            for first_channel in range(0, Servos.CHANNELS, Servos.CHANNELS_PER_BLOCK):
+                data = []
+                for on, off in shadow[
+                    first_channel : first_channel + Servos.CHANNELS_PER_BLOCK
+                ]:
+                    data += [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+                driver._device.writeList(Servos.LED0_ON_L + 4 * first_channel, data)
+
+    def write_statistics(self):
+        written = self._channel_writes.value
+        skipped = self._skipped_channel_writes.value
+        updates = written + skipped
+        return {
+            "written": written,
+            "skipped": skipped,
+            "skipped_ratio": skipped / updates if updates else 0.0,
+        }
+
+    def _write_channels(self, side: ServoSide, pulse_widths):
+        """Writes {channel: pulse width} of a board in auto-increment block writes of up to 8 adjacent channels
+
+        Channels that already have the pulse width are skipped. Channels in between that don't change are rewritten
+        with their last value, which costs less than another transaction.
+        """
+        device = self._drivers[side]._device
+        shadow = self._shadow[side]
+        dirty = self._dirty[side]
+        # always on at 0, off after the pulse width
+        changes = {
+            channel: (0, pulse_width)
+            for channel, pulse_width in pulse_widths.items()
+            if shadow[channel] != (0, pulse_width) or channel in dirty
+        }
+        self._skipped_channel_writes.increment(len(pulse_widths) - len(changes))
+
+        channels = sorted(changes)
+        while channels:
+            first_channel = channels[0]
+            block_channels = [
+                channel
+                for channel in channels
+                if channel < first_channel + Servos.CHANNELS_PER_BLOCK
+            ]
+            data = []
+            for channel in range(first_channel, block_channels[-1] + 1):
+                on, off = changes.get(channel, shadow[channel])
+                data += [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+            # before queuing, a failure marks them again
+            dirty.difference_update(block_channels)
+            device.writeList(Servos.LED0_ON_L + 4 * first_channel, data)
+
+            for channel in block_channels:
+                shadow[channel] = changes[channel]
+            self._channel_writes.increment(len(block_channels))
+            channels = channels[len(block_channels) :]
 
 
 class Drums:
-    def __init__(self, servos: Servos):
+    """Hits return immediately, the servos go back on the timer (see `client.timer.Timer`)"""
+
+    SERVOS = (ServoName.HIHAT, ServoName.RIDE)
+
+    def __init__(self, servos: Servos, timer: Timer, motion: MotionEngine):
         self._servos = servos
+        self._timer = timer
+        self._motion = motion
+        # servo name: pending return to the resting angle
+        self._returns = {}
+        self._lock = Lock()
 
     def hit(
         self,
@@ -200,13 +603,37 @@ class Drums:
         hit_angle: float,
         travel_time=None,
     ):
-        self._servos.set(servo_name, hit_angle)
-        sleep(
-            Servos.estimate_travel_time(servo_name, hit_angle - resting_angle)
-            if travel_time is None
-            else travel_time
-        )
-        self._servos.set(servo_name, resting_angle)
+        if travel_time is None:
+            travel_time = Servos.estimate_travel_time(
+                servo_name, hit_angle - resting_angle
+            )
+        self._set(servo_name, hit_angle)
+        # at the hit angle until the servo got there, then back
+        with self._lock:
+            self._returns[servo_name] = self._timer.call_at(
+                self._timer() + travel_time,
+                lambda: self._servos.set(servo_name, resting_angle),
+            )
+
+    def _cancel(self, servo_name: ServoName):
+        """Stops a pending return and a move"""
+        with self._lock:
+            pending_return = self._returns.pop(servo_name, None)
+            if pending_return is not None:
+                self._timer.cancel(pending_return)
+        self._motion.cancel(servo_name)
+
+    def _set(self, servo_name: ServoName, angle: float):
+        """Sets the angle now"""
+        self._cancel(servo_name)
+        self._servos.set(servo_name, angle)
+
+    def move(self, servo_name: ServoName, angle: float, speed=None, acceleration=None):
+        """Moves within the speed and acceleration limits (see `client.motion.MotionEngine.move`), returns immediately"""
+        if servo_name not in Drums.SERVOS:
+            raise ValueError(f"{servo_name} is not a drum servo")
+        self._cancel(servo_name)
+        self._motion.move(servo_name, angle, speed=speed, acceleration=acceleration)
 
     def hihat(self):
         # self.hit(ServoName.HIHAT, 52, 54.5, 0.08) # 55, 56.9, 0.08
@@ -216,7 +643,7 @@ class Drums:
         self.hit(ServoName.HIHAT, 41, 34, 0.1)
 
     def ready_to_click(self):
-        self._servos.set(ServoName.HIHAT, 41)
+        self._set(ServoName.HIHAT, 41)
 
     def gong(self):
         # self.hit(ServoName.RIDE, 45, 62, 0.15)
@@ -227,49 +654,77 @@ class Drums:
         self.hit(ServoName.RIDE, 26, 24, 0.02)
 
     def ride_neutral(self):
-        self._servos.set(ServoName.RIDE, 41)
+        self._set(ServoName.RIDE, 41)
 
     def ride_stop(self):
-        self._servos.set(ServoName.RIDE, 24)
+        self._set(ServoName.RIDE, 24)
 
 
 class Crocos:
-    def __init__(self, servos: Servos):
+    """The angle setters write the servos directly (stopping a move), `move` goes through the motion engine"""
+
+    SERVOS = (
+        ServoName.CROCO_BASE_RIGHT,
+        ServoName.CROCO_BASE_CENTER,
+        ServoName.CROCO_BASE_LEFT,
+        ServoName.CROCO_JAW_RIGHT,
+        ServoName.CROCO_JAW_CENTER,
+        ServoName.CROCO_JAW_LEFT,
+    )
+
+    def __init__(self, servos: Servos, motion: MotionEngine):
         self._servos = servos
+        self._motion = motion
+
+    def _set(self, servo_name: ServoName, angle: float):
+        self._motion.cancel(servo_name)
+        self._servos.set(servo_name, angle)
+
+    def move(self, servo_name: ServoName, angle: float, speed=None, acceleration=None):
+        """Moves within the limits of the servo's `ServoConfig` (or `speed` and `acceleration`), returns immediately"""
+        if servo_name not in Crocos.SERVOS:
+            raise ValueError(f"{servo_name} is not a crocodile servo")
+        self._motion.move(servo_name, angle, speed=speed, acceleration=acceleration)
 
     def base_right(self, angle: float):
-        self._servos.set(ServoName.CROCO_BASE_RIGHT, angle)
+        self._set(ServoName.CROCO_BASE_RIGHT, angle)
 
     def base_center(self, angle: float):
-        self._servos.set(ServoName.CROCO_BASE_CENTER, angle)
+        self._set(ServoName.CROCO_BASE_CENTER, angle)
 
     def base_left(self, angle: float):
         """servo:crocodile base left"""
-        self._servos.set(ServoName.CROCO_BASE_LEFT, angle)
+        self._set(ServoName.CROCO_BASE_LEFT, angle)
 
     def jaw_right(self, angle: float):
         """servo:crocodile jaw right"""
-        self._servos.set(ServoName.CROCO_JAW_RIGHT, angle)
+        self._set(ServoName.CROCO_JAW_RIGHT, angle)
 
     def jaw_center(self, angle: float):
         """servo:crocodile jaw center"""
-        self._servos.set(ServoName.CROCO_JAW_CENTER, angle)
+        self._set(ServoName.CROCO_JAW_CENTER, angle)
 
     def jaw_left(self, angle: float):
         """servo:crocodile jaw left"""
-        self._servos.set(ServoName.CROCO_JAW_LEFT, angle)
+        self._set(ServoName.CROCO_JAW_LEFT, angle)
 
 
 class Hardware:
     def __init__(self):
+        self.timer = Timer()
         self.audio = Audio()
-        self.psu = PSU()
+        self.psu = PSU(config["client"].get(Config.PSU_VERIFICATION_INTERVAL))
         self.start_buttons = StartButtons()
-        self.led_extension = LEDExtension()
+        self.led_extension = LEDExtension(self.timer)
         self.organ = Organ(self.psu)
         self.servos = Servos(self.psu)
-        self.drums = Drums(self.servos)
-        self.crocos = Crocos(self.servos)
+        self.motion = MotionEngine(
+            self.servos,
+            config["client"].get(Config.MOTION_UPDATE_RATE, DEFAULT_SERVO_UPDATE_RATE),
+            self.timer,
+        )
+        self.drums = Drums(self.servos, self.timer, self.motion)
+        self.crocos = Crocos(self.servos, self.motion)
         self.performance = Performance(self)
         self.midi = MIDI(self)
         self.microphone = Microphone()
@@ -303,6 +758,8 @@ class Hardware:
             print("Let's do this!")
             self._play_lock = True
             self.psu.turn_on()
+            # the boards may have lost their outputs while the PSU was off
+            self.servos.resync()
             self.start_buttons.turn_LED_off(Language.GERMAN)
             self.start_buttons.turn_LED_off(Language.ENGLISH)
             self.performance.play(finish_callback=on_finish)
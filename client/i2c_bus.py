@@ -0,0 +1,254 @@
+"""One thread owning the I2C bus, devices queue their operations on it by priority
+
+Writes return immediately, failures of queued writes are reported to the device's `on_write_error`. A pending write of
+the same output registers is replaced, the latest one is queued at the end so it can't overtake writes queued in
+between that overlap it. Reads wait until they are done, after everything queued before them for the device. Jobs
+(several operations and sleeps) run without other operations in between. Without threading (see `Config.THREADING`)
+operations run directly in the caller's thread.
+"""
+
+import itertools
+from enum import IntEnum
+from heapq import heappop, heappush
+from threading import Condition, Event, Thread
+from time import perf_counter
+
+from config.config import config
+from .constants import Config
+from .i2c_trace import tracer
+from .metrics import CountedI2C, CountedI2CDevice, metrics
+
+
+class BusPriority(IntEnum):
+    # lower is earlier
+    SERVOS = 0
+    DEFAULT = 1
+    LEDS = 2
+
+
+class I2COperation:
+    def __init__(self, function, args, priority, wait):
+        self.function = function
+        self.args = args
+        self.priority = priority
+        self.coalesce_key = None
+        # replaced by a later write of the same registers
+        self.cancelled = False
+        self.submit_time = perf_counter()
+        self.done = Event() if wait else None
+        # called with the error if a write fails
+        self.on_error = None
+        self.result = None
+        self.error = None
+
+
+class I2CBus:
+    def __init__(self):
+        # (priority, sequence, operation), operations of the same priority in order
+        self._queue = []
+        self._sequence = itertools.count()
+        # coalesce key: pending operation
+        self._pending_writes = {}
+        self._condition = Condition()
+        self._thread = None
+
+        self._queue_depth = metrics.histogram(
+            "i2c_queue_depth",
+            "Operations queued for the I2C bus, including a new one",
+            buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+        )
+        self._coalesced_writes = metrics.counter(
+            "i2c_coalesced_writes_total",
+            "Writes that replaced a pending write of the same registers",
+        )
+        self._errors = metrics.counter(
+            "i2c_write_errors_total", "Failed queued writes"
+        )
+        self._latencies = {
+            priority: metrics.histogram(
+                "i2c_queue_latency_seconds",
+                "Time from queuing an I2C operation until it starts",
+                priority=priority.name.lower(),
+            )
+            for priority in BusPriority
+        }
+
+    def write(
+        self,
+        function,
+        args,
+        priority=BusPriority.DEFAULT,
+        coalesce_key=None,
+        on_error=None,
+    ):
+        """Without threading, errors are raised to the caller instead of passed to `on_error`"""
+        if not config["client"][Config.THREADING]:
+            I2CBus._call(function, args, priority)
+            return
+
+        with self._condition:
+            if coalesce_key is not None:
+                pending = self._pending_writes.pop(coalesce_key, None)
+                if pending is not None:
+                    pending.cancelled = True
+                    self._coalesced_writes.increment()
+
+            operation = self._enqueue(function, args, priority, wait=False)
+            operation.on_error = on_error
+            if coalesce_key is not None:
+                operation.coalesce_key = coalesce_key
+                self._pending_writes[coalesce_key] = operation
+
+    def read(self, function, args, priority=BusPriority.DEFAULT, address=None):
+        """Waits for the result, raises what the read raised"""
+        if not config["client"][Config.THREADING]:
+            return I2CBus._call(function, args, priority)
+
+        with self._condition:
+            if address is not None:
+                # later writes must not change what this read sees
+                for coalesce_key in [
+                    coalesce_key
+                    for coalesce_key in self._pending_writes
+                    if coalesce_key[0] == address
+                ]:
+                    self._pending_writes.pop(coalesce_key).coalesce_key = None
+            operation = self._enqueue(function, args, priority, wait=True)
+
+        operation.done.wait()
+        if operation.error is not None:
+            raise operation.error
+        return operation.result
+
+    @staticmethod
+    def _call(function, args, priority):
+        if not tracer.enabled:
+            return function(*args)
+        # the subsystem of traced transactions
+        tracer.subsystem(priority.name.lower())
+        try:
+            return function(*args)
+        finally:
+            tracer.subsystem(None)
+
+    def _enqueue(self, function, args, priority, wait):
+        operation = I2COperation(function, args, priority, wait)
+        heappush(self._queue, (priority, next(self._sequence), operation))
+        self._queue_depth.observe(len(self._queue))
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._condition.notify()
+        return operation
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                _, _, operation = heappop(self._queue)
+                if operation.cancelled:
+                    continue
+                if operation.coalesce_key is not None:
+                    del self._pending_writes[operation.coalesce_key]
+
+            self._latencies[operation.priority].observe(
+                perf_counter() - operation.submit_time
+            )
+            try:
+                operation.result = I2CBus._call(
+                    operation.function, operation.args, operation.priority
+                )
+            except Exception as error:
+                operation.error = error
+                if operation.done is None:
+                    print(f"I2C write failed: {error!r}")
+                    self._errors.increment()
+                    if operation.on_error is not None:
+                        try:
+                            operation.on_error(error)
+                        except Exception as handler_error:
+                            print(f"I2C write error handler failed: {handler_error!r}")
+            if operation.done is not None:
+                operation.done.set()
+
+
+# bytes written by the operations with a fixed size
+BYTE_COUNTS = {"write8": 1, "write16": 2}
+
+
+class QueuedI2CDevice:
+    """Wraps an I2C device (e.g. a `CountedI2CDevice`), so that its operations are executed by the bus thread
+
+    Writes of `coalesced_registers` (e.g. outputs, not modes) may be coalesced. `on_write_error(operation, args, error)`
+    is called (by the bus thread) when a queued write failed, e.g. to resend what was lost.
+    """
+
+    WRITE_OPERATIONS = ["write8", "write16", "writeRaw8", "writeList"]
+
+    def __init__(self, device, address, priority, coalesced_registers=()):
+        self._device = device
+        self._address = address
+        self._priority = priority
+        self._coalesced_registers = frozenset(coalesced_registers)
+        self.on_write_error = None
+        for operation in CountedI2CDevice.OPERATIONS:
+            if hasattr(device, operation):
+                function = getattr(device, operation)
+                setattr(
+                    self,
+                    operation,
+                    self._queued_write(function, operation)
+                    if operation in QueuedI2CDevice.WRITE_OPERATIONS
+                    else self._queued_read(function),
+                )
+
+    def _queued_write(self, function, operation):
+        def queued_write(*args):
+            coalesce_key = None
+            # writeRaw8 has no register
+            if operation != "writeRaw8" and args[0] in self._coalesced_registers:
+                # the register range written
+                byte_count = (
+                    len(args[1]) if operation == "writeList" else BYTE_COUNTS[operation]
+                )
+                coalesce_key = (self._address, args[0], byte_count)
+            on_error = None
+            if self.on_write_error is not None:
+                on_write_error = self.on_write_error
+                on_error = lambda error: on_write_error(operation, args, error)
+            bus.write(function, args, self._priority, coalesce_key, on_error)
+
+        return queued_write
+
+    def job(self, function):
+        """Queues `function(device)` with the unqueued device, its operations (and sleeps) run without interruption"""
+        bus.write(function, (self._device,), self._priority)
+
+    def _queued_read(self, function):
+        def queued_read(*args):
+            return bus.read(function, args, self._priority, self._address)
+
+        return queued_read
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+
+class QueuedI2C:
+    """Drop-in for the `Adafruit_GPIO.I2C` module (`PCA9685(i2c=...)`) with queued (and counted) devices"""
+
+    def __init__(self, priority, coalesced_registers=()):
+        self._priority = priority
+        self._coalesced_registers = coalesced_registers
+
+    def get_i2c_device(self, address, **kwargs):
+        return QueuedI2CDevice(
+            CountedI2C.get_i2c_device(address, **kwargs),
+            address,
+            self._priority,
+            self._coalesced_registers,
+        )
+
+
+bus = I2CBus()
@@ -0,0 +1,188 @@
+"""Opt-in trace of every I2C transaction, to see how close the bus is to saturation
+
+With `i2c_trace` (number of transactions kept) in the client config, every operation of a counted device (see
+`client.metrics.CountedI2CDevice`, used by `Adafruit_I2C` devices and the PCA9685 driver) is recorded into a
+preallocated ring buffer: time, duration, address, register, direction, byte count and the calling subsystem (the
+I2C bus priority it was queued with, otherwise the thread's name). The bus utilization is estimated from the bits on
+the wire at `i2c_bus_clock` (Hz, 100 kHz by default).
+"""
+
+from threading import Lock, current_thread, local
+from time import perf_counter
+
+import numpy
+
+from config.config import config
+from .constants import DEFAULT_I2C_BUS_CLOCK, Config
+
+DIRECTIONS = ["write", "read", "update"]
+
+# operation: (direction, byte count as a number or a function of the arguments, whether it addresses a register)
+OPERATIONS = {
+    "write8": ("write", 1, True),
+    "write16": ("write", 2, True),
+    "writeRaw8": ("write", 1, False),
+    "writeList": ("write", lambda args: len(args[1]), True),
+    "update8": ("update", 2, True),
+    "readList": ("read", lambda args: args[1], True),
+    "readRaw8": ("read", 1, False),
+    "readU8": ("read", 1, True),
+    "readS8": ("read", 1, True),
+    "readU16": ("read", 2, True),
+    "readS16": ("read", 2, True),
+    "readU16LE": ("read", 2, True),
+    "readU16BE": ("read", 2, True),
+    "readS16LE": ("read", 2, True),
+    "readS16BE": ("read", 2, True),
+}
+
+RECORD = numpy.dtype(
+    [
+        ("time", "f8"),
+        ("duration", "f8"),
+        ("address", "u1"),
+        # -1 without a register
+        ("register", "i2"),
+        ("direction", "u1"),
+        ("bytes", "u2"),
+        ("subsystem", "u2"),
+    ]
+)
+# later subsystems (e.g. threads named by the number) are recorded as "other"
+MAX_SUBSYSTEMS = 1 << 16
+
+
+def wire_bits(direction, byte_count, has_register):
+    """Bits of a transaction on the bus (each byte with its ACK bit, start and stop conditions)"""
+    if direction == "update":
+        # a read of the register, then a write
+        return wire_bits("read", byte_count // 2, True) + wire_bits(
+            "write", byte_count // 2, True
+        )
+    bits = 1 + 9 + 9 * byte_count + 1
+    if has_register:
+        bits += 9
+        if direction == "read":
+            # repeated start and the address again
+            bits += 1 + 9
+    return bits
+
+
+class I2CTracer:
+    def __init__(self, capacity, bus_clock=DEFAULT_I2C_BUS_CLOCK):
+        self.enabled = capacity > 0
+        self.bus_clock = bus_clock
+        self._records = numpy.zeros(capacity, dtype=RECORD)
+        # name: index in the records, in order of the index
+        self._subsystems = {}
+        self._current = local()
+        self._lock = Lock()
+        self.reset()
+
+    def reset(self, clock=perf_counter):
+        """Forgets all records, times are from now on of `clock` (e.g. the simulation's)"""
+        with self._lock:
+            self._clock = clock
+            self._start_time = clock()
+            # total number of records, the latest is at (recorded - 1) % capacity
+            self._recorded = 0
+            self._subsystems.clear()
+
+    def subsystem(self, name):
+        """Sets the subsystem of the following transactions of this thread, None is the thread's name"""
+        self._current.subsystem = name
+
+    def record(self, address, operation, args, duration):
+        """A transaction that just ended"""
+        direction, byte_count, has_register = OPERATIONS[operation]
+        if callable(byte_count):
+            byte_count = byte_count(args)
+        subsystem = getattr(self._current, "subsystem", None) or current_thread().name
+
+        with self._lock:
+            if subsystem not in self._subsystems:
+                if len(self._subsystems) >= MAX_SUBSYSTEMS - 1:
+                    subsystem = "other"
+                self._subsystems.setdefault(subsystem, len(self._subsystems))
+            self._records[self._recorded % len(self._records)] = (
+                self._clock() - self._start_time,
+                duration,
+                address,
+                args[0] if has_register else -1,
+                DIRECTIONS.index(direction),
+                byte_count,
+                self._subsystems[subsystem],
+            )
+            self._recorded += 1
+
+    def records(self):
+        """The kept records, oldest first"""
+        with self._lock:
+            capacity = len(self._records)
+            if self._recorded <= capacity:
+                return self._records[: self._recorded].copy()
+            return numpy.roll(self._records, -(self._recorded % capacity))
+
+    def utilization(self, records=None):
+        """Per second of the kept records: transactions, estimated share of the bus time and measured busy time"""
+        if records is None:
+            records = self.records()
+        if not len(records):
+            return []
+
+        bits = numpy.array(
+            [
+                wire_bits(DIRECTIONS[direction], byte_count, register >= 0)
+                for direction, byte_count, register in zip(
+                    records["direction"], records["bytes"], records["register"]
+                )
+            ]
+        )
+        seconds = records["time"].astype(int)
+        first_second = seconds[0]
+        slots = seconds - first_second
+        transactions = numpy.bincount(slots)
+        estimated = numpy.bincount(slots, weights=bits) / self.bus_clock
+        measured = numpy.bincount(slots, weights=records["duration"])
+        return [
+            {
+                "second": int(first_second + slot),
+                "transactions": int(transactions[slot]),
+                "estimated": float(estimated[slot]),
+                "measured": float(measured[slot]),
+            }
+            for slot in range(len(transactions))
+        ]
+
+    def dump(self):
+        records = self.records()
+        with self._lock:
+            recorded = self._recorded
+            subsystems = list(self._subsystems)
+        return {
+            "bus_clock": self.bus_clock,
+            "capacity": len(self._records),
+            "recorded": recorded,
+            "dropped": max(recorded - len(self._records), 0),
+            "utilization": self.utilization(records),
+            "records": [
+                {
+                    "time": float(record["time"]),
+                    "duration": float(record["duration"]),
+                    "address": f"0x{int(record['address']):02x}",
+                    "register": None
+                    if record["register"] < 0
+                    else int(record["register"]),
+                    "direction": DIRECTIONS[record["direction"]],
+                    "bytes": int(record["bytes"]),
+                    "subsystem": subsystems[record["subsystem"]],
+                }
+                for record in records
+            ],
+        }
+
+
+tracer = I2CTracer(
+    config["client"].get(Config.I2C_TRACE) or 0,
+    config["client"].get(Config.I2C_BUS_CLOCK, DEFAULT_I2C_BUS_CLOCK),
+)
@@ -0,0 +1,300 @@
+"""Compilation of the text strip triggers of a play into callable opcodes
+
+Every instruction has the form `<type>[:<expression>[;<argument>...]]:<duration in frames>` (see README). Compiling
+them once before the play starts resolves hardware functions, MIDI files and marker targets up front, so invalid
+triggers fail before the first frame instead of in the middle of a show.
+"""
+
+import ast
+import inspect
+
+from . import constants
+from .metrics import metrics
+from .midi import MIDI
+
+
+class InstructionError(ValueError):
+    def __init__(self, instruction, frame_index, reason):
+        super().__init__(f'Invalid instruction "{instruction}" at frame {frame_index}: {reason}')
+        self.instruction = instruction
+        self.frame_index = frame_index
+
+
+class ParsedInstruction:
+    __slots__ = ["text", "type", "expression", "arguments", "duration_frames"]
+
+    def __init__(self, text):
+        self.text = text
+        body, raw_duration = text.rsplit(":", 1)
+        self.duration_frames = int(raw_duration)
+        self.type, _, raw_expression = body.partition(":")
+        self.expression, *self.arguments = raw_expression.split(";")
+
+
+class Opcode:
+    __slots__ = ["instruction", "duration_histogram"]
+
+    def __init__(self, instruction: ParsedInstruction):
+        self.instruction = instruction
+        # resolved when compiling, executing only observes
+        self.duration_histogram = metrics.histogram(
+            "instruction_seconds",
+            "Time spent in instructions, per type",
+            type=instruction.type,
+        )
+
+    def __call__(self):
+        raise NotImplementedError()
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.instruction.text})"
+
+
+class HardwareCall(Opcode):
+    __slots__ = ["_function", "_args", "_kwargs"]
+
+    def __init__(self, instruction, function, args, kwargs):
+        super().__init__(instruction)
+        self._function = function
+        self._args = args
+        self._kwargs = kwargs
+
+    def __call__(self):
+        self._function(*self._args, **self._kwargs)
+
+
+class Log(Opcode):
+    __slots__ = ["_message"]
+
+    def __init__(self, instruction):
+        super().__init__(instruction)
+        self._message = instruction.expression
+
+    def __call__(self):
+        print("LOG:", self._message)
+
+
+class SetMuted(Opcode):
+    __slots__ = ["_performance", "muted"]
+
+    def __init__(self, instruction, performance, muted: bool):
+        super().__init__(instruction)
+        self._performance = performance
+        self.muted = muted
+
+    def __call__(self):
+        self._performance.set_muted(self.muted)
+
+
+class PlayMidiFile(Opcode):
+    __slots__ = ["_midi_file_basename"]
+
+    def __init__(self, instruction):
+        super().__init__(instruction)
+        self._midi_file_basename = instruction.expression
+
+    def __call__(self):
+        MIDI.play(self._midi_file_basename)
+
+
+class ListenMidi(Opcode):
+    __slots__ = ["_midi", "_language"]
+
+    def __init__(self, instruction, midi, language):
+        super().__init__(instruction)
+        self._midi = midi
+        self._language = language
+
+    def __call__(self):
+        self._midi.listen(self._language)
+
+
+class MonitorSound(Opcode):
+    """Listen on the microphone for the duration of the instruction and jump to a marker depending on the result"""
+
+    __slots__ = ["_microphone", "_duration_seconds", "_monitor_arguments"]
+
+    def __init__(
+        self,
+        instruction,
+        microphone,
+        duration_seconds,
+        goto,
+        on_sound: bool,
+        invert=False,
+    ):
+        super().__init__(instruction)
+        self._microphone = microphone
+        self._duration_seconds = duration_seconds
+        self._monitor_arguments = {"invert": invert}
+        if on_sound:
+            self._monitor_arguments["callback_on_sound"] = goto
+        else:
+            self._monitor_arguments["callback_after_timeout"] = goto
+
+    def __call__(self):
+        self._microphone.monitor(self._duration_seconds, **self._monitor_arguments)
+
+
+class End(Opcode):
+    __slots__ = ["_performance"]
+
+    def __init__(self, instruction, performance):
+        super().__init__(instruction)
+        self._performance = performance
+
+    def __call__(self):
+        self._performance.end()
+
+
+def _resolve_constant(node):
+    """Resolve `Name` / `Name.attribute` (e.g. `ServoName.HIHAT`) from the constants module"""
+    if isinstance(node, ast.Name):
+        return getattr(constants, node.id)
+    if isinstance(node, ast.Attribute):
+        return getattr(_resolve_constant(node.value), node.attr)
+    raise ValueError(f"unsupported argument {ast.unparse(node)}")
+
+
+def _evaluate_argument(node):
+    try:
+        return ast.literal_eval(node)
+    except ValueError:
+        pass
+
+    try:
+        return _resolve_constant(node)
+    except AttributeError:
+        raise ValueError(f"unknown constant {ast.unparse(node)}")
+
+
+def _compile_hardware_call(instruction, hardware):
+    try:
+        call = ast.parse(instruction.expression, mode="eval").body
+    except SyntaxError as error:
+        raise ValueError(f"syntax error ({error.msg})")
+    if not isinstance(call, ast.Call):
+        raise ValueError("expression must be a function call")
+
+    path = []
+    target = call.func
+    while isinstance(target, ast.Attribute):
+        path.insert(0, target.attr)
+        target = target.value
+    if not isinstance(target, ast.Name):
+        raise ValueError("expression must call a function of the hardware")
+    path.insert(0, target.id)
+
+    function = hardware
+    for attribute in path:
+        if attribute.startswith("_"):
+            raise ValueError(f"{attribute} is private")
+        try:
+            function = getattr(function, attribute)
+        except AttributeError:
+            raise ValueError(f"hardware has no {'.'.join(path)}")
+    if not callable(function):
+        raise ValueError(f"{'.'.join(path)} is not callable")
+
+    if any(isinstance(argument, ast.Starred) for argument in call.args) or any(
+        keyword.arg is None for keyword in call.keywords
+    ):
+        raise ValueError("argument unpacking is not supported")
+    args = tuple(_evaluate_argument(argument) for argument in call.args)
+    kwargs = {
+        keyword.arg: _evaluate_argument(keyword.value) for keyword in call.keywords
+    }
+    try:
+        inspect.signature(function).bind(*args, **kwargs)
+    except TypeError as error:
+        raise ValueError(f"arguments don't match {'.'.join(path)}: {error}")
+
+    return HardwareCall(instruction, function, args, kwargs)
+
+
+def compile_instruction(
+    instruction_text, performance, hardware, markers, fps, deferred_markers=None
+):
+    """Turn a single instruction into an opcode, None for instructions without runtime effect (markers)
+
+    Raises a `ValueError` with the reason if the instruction is invalid. If `deferred_markers` is given (a set), markers
+    that aren't known yet are added to it and only resolved when jumping to them, for plays that are still loading.
+    """
+    try:
+        instruction = ParsedInstruction(instruction_text)
+    except ValueError:
+        raise ValueError("expected <type>[:<expression>]:<duration>")
+    duration_seconds = instruction.duration_frames / fps
+
+    def goto_marker(marker_name):
+        if marker_name not in markers and deferred_markers is not None:
+            deferred_markers.add(marker_name)
+            return lambda: performance.goto_marker(marker_name)
+        if marker_name not in markers:
+            raise ValueError(f'unknown marker "{marker_name}"')
+        marker_frame = markers[marker_name]
+        return lambda: performance.goto(marker_frame)
+
+    instruction_type = instruction.type
+    expression = instruction.expression
+    if instruction_type == "hardware":
+        return _compile_hardware_call(instruction, hardware)
+    elif instruction_type == "log":
+        return Log(instruction)
+    elif instruction_type == "mute":
+        return SetMuted(instruction, performance, True)
+    elif instruction_type == "unmute":
+        return SetMuted(instruction, performance, False)
+    elif instruction_type == "marker":
+        return None
+    elif instruction_type == "midi":
+        if expression == "play":
+            if not instruction.arguments:
+                raise ValueError("'midi:play' requires a language argument")
+            return ListenMidi(instruction, hardware.midi, instruction.arguments[0])
+        return PlayMidiFile(instruction)
+    elif instruction_type == "logic":
+        if expression == "abort_if_no_sound":
+            return MonitorSound(
+                instruction,
+                hardware.microphone,
+                duration_seconds,
+                goto_marker("aborted-ending"),
+                on_sound=False,
+            )
+        elif expression == "wait_for_sound":
+            if not instruction.arguments or not instruction.arguments[0].startswith(
+                "goto="
+            ):
+                raise ValueError("unknown callback for 'wait_for_sound'")
+            return MonitorSound(
+                instruction,
+                hardware.microphone,
+                duration_seconds,
+                goto_marker(instruction.arguments[0].split("=")[1]),
+                on_sound=True,
+                invert="invert" in instruction.arguments,
+            )
+        elif expression == "end":
+            return End(instruction, performance)
+        else:
+            raise ValueError("unknown logic instruction")
+    else:
+        raise ValueError(f'unknown type "{instruction_type}"')
+
+
+def compile_instructions(show, performance, hardware):
+    """Compile all instructions of a show into a {frame index: (opcode, ...)} mapping of the frames that have any"""
+    program = {}
+    for frame_index, instruction_text in show.iter_instructions():
+        try:
+            opcode = compile_instruction(
+                instruction_text, performance, hardware, show.markers, show.fps
+            )
+        except ValueError as error:
+            raise InstructionError(instruction_text, frame_index, str(error))
+
+        if opcode is not None:
+            program[frame_index] = program.get(frame_index, ()) + (opcode,)
+
+    return program
@@ -0,0 +1,210 @@
+"""LED patterns precompiled into (time, port mask) steps, played on the shared `client.timer.Timer`
+
+Starting a pattern returns immediately. Every step is one write of the whole port. Several patterns can play at once,
+each is merged (see `Merge`) in the order they were started onto the LEDs set directly (e.g. chords).
+"""
+
+from enum import Enum
+from threading import Lock
+
+import numpy
+
+from .constants import LedExtensionPin
+
+
+class Merge(Enum):
+    # adds the pattern's LEDs
+    OR = "or"
+    # toggles the pattern's LEDs
+    XOR = "xor"
+    # only the pattern's LEDs
+    REPLACE = "replace"
+
+
+class LEDPattern:
+    """`masks[i]` from `times[i]` (seconds since the start) on, until `duration`, when it ends or starts over"""
+
+    def __init__(self, times, masks, duration, repeat=False):
+        self.times = numpy.asarray(times, dtype=float)
+        self.masks = numpy.asarray(masks, dtype=numpy.uint8)
+        if len(self.times) != len(self.masks) or not len(self.times):
+            raise ValueError("A pattern needs as many masks as times, at least one")
+        if self.times[0] != 0 or numpy.any(numpy.diff(self.times) <= 0):
+            raise ValueError("Pattern times must start at 0 and increase")
+        if duration <= self.times[-1]:
+            raise ValueError("A pattern must end after its last step")
+        self.duration = duration
+        self.repeat = repeat
+
+    def step(self, time):
+        """(index of the step at `time` since the start, or None after the end; start time of the next step)"""
+        if self.repeat:
+            offset = time - time % self.duration
+            time -= offset
+        elif time >= self.duration:
+            return None, None
+        else:
+            offset = 0.0
+        index = int(numpy.searchsorted(self.times, time, side="right")) - 1
+        next_time = (
+            self.times[index + 1] if index + 1 < len(self.times) else self.duration
+        )
+        return index, float(offset + next_time)
+
+    @staticmethod
+    def sequence(pins, time_per_step, repeat=False):
+        """One pin after another"""
+        return LEDPattern(
+            [step * time_per_step for step in range(len(pins))],
+            [1 << pin for pin in pins],
+            len(pins) * time_per_step,
+            repeat,
+        )
+
+    @staticmethod
+    def concatenate(patterns, repeat=False):
+        times = []
+        offset = 0.0
+        for pattern in patterns:
+            times.append(pattern.times + offset)
+            offset += pattern.duration
+        return LEDPattern(
+            numpy.concatenate(times),
+            numpy.concatenate([pattern.masks for pattern in patterns]),
+            offset,
+            repeat,
+        )
+
+
+class Playback:
+    def __init__(self, pattern: LEDPattern, merge: Merge, start_time):
+        self.pattern = pattern
+        self.merge = merge
+        self.start_time = start_time
+
+
+class LEDPatternEngine:
+    """Writes the merged 8-bit mask with `write_mask` whenever it changes, scheduled on `timer`"""
+
+    def __init__(self, write_mask, timer):
+        self._write_mask = write_mask
+        self._timer = timer
+        self._lock = Lock()
+        # LEDs set directly
+        self._base = 0
+        # name: Playback, in the order started
+        self._playbacks = {}
+        self._written = None
+        # (time, timer handle) of the next update
+        self._scheduled = None
+
+    def start(self, name, pattern: LEDPattern, merge=Merge.OR):
+        """Plays `pattern` from now, instead of the one playing as `name`"""
+        with self._lock:
+            self._playbacks.pop(name, None)
+            self._playbacks[name] = Playback(pattern, merge, self._timer())
+            self._update()
+
+    def stop(self, name):
+        with self._lock:
+            if self._playbacks.pop(name, None) is not None:
+                self._update()
+
+    def is_playing(self, name):
+        with self._lock:
+            return name in self._playbacks
+
+    def set(self, values):
+        """{pin: bool} of the LEDs set directly"""
+        with self._lock:
+            for pin, value in values.items():
+                if value:
+                    self._base |= 1 << pin
+                else:
+                    self._base &= ~(1 << pin)
+            self._update()
+
+    def clear(self):
+        """Stops all patterns and turns all LEDs off"""
+        with self._lock:
+            self._playbacks.clear()
+            self._base = 0
+            self._update(force=True)
+
+    def _scheduled_update(self):
+        with self._lock:
+            self._scheduled = None
+            self._update()
+
+    def _update(self, force=False):
+        # self._lock must be held
+        now = self._timer()
+        mask = self._base
+        next_time = None
+        for name, playback in list(self._playbacks.items()):
+            # scheduled at a step's start, which rounding must not move into the previous step
+            index, step_end_time = playback.pattern.step(
+                now - playback.start_time + 1e-9
+            )
+            if index is None:
+                del self._playbacks[name]
+                continue
+
+            pattern_mask = int(playback.pattern.masks[index])
+            if playback.merge == Merge.OR:
+                mask |= pattern_mask
+            elif playback.merge == Merge.XOR:
+                mask ^= pattern_mask
+            else:
+                mask = pattern_mask
+            step_end_time += playback.start_time
+            if next_time is None or step_end_time < next_time:
+                next_time = step_end_time
+
+        if force or mask != self._written:
+            self._write_mask(mask)
+            self._written = mask
+
+        if self._scheduled is not None and (
+            next_time is None or next_time < self._scheduled[0]
+        ):
+            self._timer.cancel(self._scheduled[1])
+            self._scheduled = None
+        if next_time is not None and self._scheduled is None:
+            self._scheduled = (
+                next_time,
+                self._timer.call_at(next_time, self._scheduled_update),
+            )
+
+
+LIGHTSHOW_PINS = [
+    LedExtensionPin.B_FLAT_MAJOR,
+    LedExtensionPin.F_MAJOR,
+    LedExtensionPin.C_MAJOR,
+    LedExtensionPin.G_MINOR,
+    LedExtensionPin.D_MAJOR,
+    LedExtensionPin.D_MINOR,
+    LedExtensionPin.A_MAJOR,
+    LedExtensionPin.A_MINOR,
+]
+
+
+def lightshow(time_per_step=1, reverse=False, iterations=1):
+    """The chord LEDs one after another, back and forth with several iterations"""
+    forward = LEDPattern.sequence(LIGHTSHOW_PINS, time_per_step)
+    backward = LEDPattern.sequence(LIGHTSHOW_PINS[::-1], time_per_step)
+    return LEDPattern.concatenate(
+        [
+            backward if (iteration % 2 == 0) == reverse else forward
+            for iteration in range(iterations)
+        ]
+    )
+
+
+# patterns for `LEDExtension.start_pattern`, by name
+PATTERNS = {
+    "lightshow": lightshow(),
+    "lightshow_reverse": lightshow(reverse=True),
+    "long_lightshow": lightshow(0.2, reverse=True, iterations=6),
+    "chase": LEDPattern.sequence(LIGHTSHOW_PINS, 0.2, repeat=True),
+}
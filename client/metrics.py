@@ -0,0 +1,253 @@
+"""Counters and histograms of the client's timing, exported as JSON or in the Prometheus text format
+
+Metrics are identified by name and labels, created on first use and kept for the lifetime of the process. Hot paths
+should look a metric up once and keep it, observing a value is then a lock and a few additions.
+"""
+
+import math
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+
+from .i2c_trace import tracer
+
+# upper bounds in seconds, from well below a frame to far beyond it
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+)
+
+
+class Counter:
+    TYPE = "counter"
+
+    def __init__(self):
+        self.value = 0
+        self._lock = Lock()
+
+    def increment(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def to_json(self):
+        return {"value": self.value}
+
+    def samples(self, name):
+        yield name, {}, self.value
+
+
+class Histogram:
+    TYPE = "histogram"
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # the last count is for values above the largest bucket
+        self._counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = Lock()
+
+    def observe(self, value):
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[bucket] += 1
+            self.count += 1
+            self.sum += value
+
+    def cumulative_counts(self):
+        """(upper bound, number of values up to it) for all buckets, ending with infinity"""
+        with self._lock:
+            counts = list(self._counts)
+        cumulative = 0
+        for upper_bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            yield upper_bound, cumulative
+
+    def to_json(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {
+                format_number(upper_bound): count
+                for upper_bound, count in self.cumulative_counts()
+            },
+        }
+
+    def samples(self, name):
+        for upper_bound, count in self.cumulative_counts():
+            yield f"{name}_bucket", {"le": format_number(upper_bound)}, count
+        yield f"{name}_sum", {}, self.sum
+        yield f"{name}_count", {}, self.count
+
+
+def format_number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in labels.items()]
+    return "{" + ",".join(pairs) + "}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    def __init__(self):
+        # name: (type, help, {labels: metric})
+        self._families = {}
+        self._lock = Lock()
+
+    def _get(self, metric_type, name, help_text, labels, create):
+        key = tuple(sorted(labels.items()))
+        family = self._families.get(name)
+        if family is not None and key in family[2]:
+            return family[2][key]
+
+        with self._lock:
+            if name not in self._families:
+                self._families[name] = (metric_type, help_text, {})
+            family_type, _, metrics = self._families[name]
+            if family_type is not metric_type:
+                raise ValueError(f"Metric {name} is a {family_type.TYPE}")
+            if key not in metrics:
+                metrics[key] = create()
+            return metrics[key]
+
+    def counter(self, name, help_text="", **labels) -> Counter:
+        return self._get(Counter, name, help_text, labels, Counter)
+
+    def histogram(
+        self, name, help_text="", buckets=DEFAULT_BUCKETS, **labels
+    ) -> Histogram:
+        return self._get(
+            Histogram, name, help_text, labels, lambda: Histogram(buckets)
+        )
+
+    def reset(self):
+        with self._lock:
+            self._families = {}
+
+    def _snapshot(self):
+        with self._lock:
+            return [
+                (name, metric_type, help_text, list(metrics.items()))
+                for name, (metric_type, help_text, metrics) in sorted(
+                    self._families.items()
+                )
+            ]
+
+    def to_json(self):
+        return {
+            name: {
+                "type": metric_type.TYPE,
+                "help": help_text,
+                "series": [
+                    {"labels": dict(key), **metric.to_json()} for key, metric in series
+                ],
+            }
+            for name, metric_type, help_text, series in self._snapshot()
+        }
+
+    def to_prometheus(self):
+        lines = []
+        for name, metric_type, help_text, series in self._snapshot():
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type.TYPE}")
+            for key, metric in series:
+                for sample_name, sample_labels, value in metric.samples(name):
+                    labels = format_labels({**dict(key), **sample_labels})
+                    lines.append(f"{sample_name}{labels} {format_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class CountedI2CDevice:
+    """Wraps an I2C device (`Adafruit_I2C` or `Adafruit_GPIO.I2C.Device`) and counts its bus operations"""
+
+    OPERATIONS = [
+        "write8",
+        "write16",
+        "writeRaw8",
+        "writeList",
+        "update8",
+        "readList",
+        "readRaw8",
+        "readU8",
+        "readS8",
+        "readU16",
+        "readS16",
+        "readU16LE",
+        "readU16BE",
+        "readS16LE",
+        "readS16BE",
+    ]
+
+    def __init__(self, device, address):
+        self._device = device
+        for operation in CountedI2CDevice.OPERATIONS:
+            if hasattr(device, operation):
+                setattr(
+                    self,
+                    operation,
+                    CountedI2CDevice._counted(
+                        getattr(device, operation), address, operation
+                    ),
+                )
+
+    @staticmethod
+    def _counted(function, address, operation):
+        counter = None
+
+        def counted_function(*args, **kwargs):
+            nonlocal counter
+            # created on first use, so that only operations a device actually uses show up
+            if counter is None:
+                counter = metrics.counter(
+                    "i2c_calls_total",
+                    "I2C operations per device",
+                    address=f"0x{address:02x}",
+                    operation=function.__name__,
+                )
+            counter.increment()
+            if not tracer.enabled:
+                return function(*args, **kwargs)
+
+            start_time = perf_counter()
+            result = function(*args, **kwargs)
+            tracer.record(address, operation, args, perf_counter() - start_time)
+            return result
+
+        return counted_function
+
+    def __getattr__(self, name):
+        return getattr(self._device, name)
+
+
+class CountedI2C:
+    """Drop-in for the `Adafruit_GPIO.I2C` module (`PCA9685(i2c=...)`) whose devices count their operations"""
+
+    @staticmethod
+    def get_i2c_device(address, **kwargs):
+        import Adafruit_GPIO.I2C as I2C
+
+        return CountedI2CDevice(I2C.get_i2c_device(address, **kwargs), address)
+
+
+metrics = Metrics()
@@ -18,6 +18,21 @@ gain = 10
 block_duration = 50
 
 
+def fft_size(samplerate):
+    delta_f = (FILTER_HIGHEST_FREQUENCY - FILTER_LOWEST_FREQUENCY) / (columns - 1)
+    return math.ceil(samplerate / delta_f)
+
+
+def block_loudness(block, fftsize):
+    """Average spectral magnitude of one block of samples, compared to `LOUDNESS_THRESHOLD`"""
+    magnitude = numpy.abs(numpy.fft.rfft(block, n=fftsize))
+    magnitude *= gain / fftsize
+    # line = (gradient[int(numpy.clip(x, 0, 1) * (len(gradient) - 1))]
+    #        for x in magnitude[low_bin:low_bin + columns])
+    # print(*line, sep='', end='\x1b[0m\n')
+    return numpy.average(magnitude)
+
+
 class Microphone:
     def __init__(self):
         self._device_index = Audio.discover_device_index()
@@ -36,9 +51,7 @@ class Microphone:
         verbose=False,
         invert=False,
     ):
-        delta_f = (FILTER_HIGHEST_FREQUENCY - FILTER_LOWEST_FREQUENCY) / (columns - 1)
-        fftsize = math.ceil(self._samplerate / delta_f)
-        low_bin = math.floor(FILTER_LOWEST_FREQUENCY / delta_f)
+        fftsize = fft_size(self._samplerate)
 
         def callback(indata, frames, time, status):
             nonlocal start_time
@@ -46,13 +59,7 @@ class Microphone:
                 return
 
             if any(indata):
-                magnitude = numpy.abs(numpy.fft.rfft(indata[:, 0], n=fftsize))
-                magnitude *= gain / fftsize
-                # line = (gradient[int(numpy.clip(x, 0, 1) * (len(gradient) - 1))]
-                #        for x in magnitude[low_bin:low_bin + columns])
-                # print(*line, sep='', end='\x1b[0m\n')
-
-                loudness = numpy.average(magnitude)
+                loudness = block_loudness(indata[:, 0], fftsize)
                 threshold_passed = loudness > LOUDNESS_THRESHOLD
                 if threshold_passed != invert:
                     print("loud!")
@@ -1,5 +1,5 @@
 from subprocess import run
-from threading import Thread
+from time import perf_counter
 import os.path
 
 import mido
@@ -13,6 +13,7 @@ from .constants import (
     RENDER_BASE_PATH,
 )
 from .exec import threadable
+from .metrics import metrics
 
 
 def system_music_files(language):
@@ -39,6 +40,10 @@ class MIDI:
             DrumMidiNote.HIHAT: drums.hihat,
             DrumMidiNote.CLICK: drums.click,
         }
+        self._note_to_hit = metrics.histogram(
+            "midi_note_to_hit_seconds",
+            "Time from receiving a drum note until the hit is queued on the I2C bus",
+        )
 
     @threadable
     def listen(self, language):
@@ -53,6 +58,7 @@ class MIDI:
 
         with mido.open_input() as in_port:
             for midi_message in in_port:
+                receive_time = perf_counter()
                 if midi_message.type != "note_on" and midi_message.type != "note_off":
                     continue
 
@@ -68,7 +74,12 @@ class MIDI:
 
                     action = self._midi_mapping_drums.get(midi_message.note, None)
                     if action is not None:
-                        Thread(target=action).start()
+                        # hits return immediately, no thread needed
+                        try:
+                            action()
+                        except (RuntimeError, ValueError) as error:
+                            print(f"Drum hit failed: {error}")
+                        self._note_to_hit.observe(perf_counter() - receive_time)
                     else:
                         raise ValueError("Unknown MIDI message: " + midi_message)
 
@@ -101,6 +112,11 @@ class MIDI:
                 else:
                     print(f"Unknown MIDI channel: {midi_message.channel}")
 
+        # stay cached for the next time, unless the space is needed
+        for music_file in music_files:
+            if music_file is not None:
+                self._audio.unload(music_file)
+
     @staticmethod
     def unlisten():
         MIDI.play("unlisten")  # contains a single note 59 on channel SYSTEM
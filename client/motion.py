@@ -0,0 +1,270 @@
+"""Servo motion within speed and acceleration limits, at a fixed update rate and without blocking the caller
+
+`MotionEngine.move()` returns immediately, the engine moves the servo through its waypoints along trapezoidal profiles
+(accelerate, cruise, decelerate) on the shared `client.timer.Timer` and writes all moving servos of an update in one batch.
+"""
+
+import math
+from collections import deque
+from threading import Condition
+from time import perf_counter
+from typing import NamedTuple
+
+from .constants import ServoConfigs, ServoName
+from .metrics import metrics
+
+
+class Waypoint(NamedTuple):
+    angle: float
+    # seconds to stay at the angle before moving on
+    hold: float = 0.0
+
+
+class TrapezoidalProfile:
+    """Motion from `start` (moving at `velocity`) to rest at `target`
+
+    Speed (°/s) and acceleration (°/s²) are limited to `max_speed` and `max_acceleration`, None is unlimited.
+    """
+
+    def __init__(
+        self, start, target, velocity=0.0, max_speed=None, max_acceleration=None
+    ):
+        self.start = start
+        self.target = target
+        speed = math.inf if max_speed is None else max_speed
+        acceleration = math.inf if max_acceleration is None else max_acceleration
+        # (duration, velocity at the start, acceleration), each phase starts where the previous one ends
+        self._phases = []
+
+        distance = target - start
+        if math.isinf(acceleration):
+            # velocity changes instantly, a step if the speed is unlimited as well
+            if distance and not math.isinf(speed):
+                self._phases.append(
+                    (abs(distance) / speed, math.copysign(speed, distance), 0.0)
+                )
+            self.duration = sum(phase[0] for phase in self._phases)
+            return
+
+        if velocity and (
+            velocity * distance <= 0 or velocity**2 / (2 * acceleration) > abs(distance)
+        ):
+            # moving away or too fast to stop in time, stop first
+            braking_time = abs(velocity) / acceleration
+            self._phases.append(
+                (braking_time, velocity, -math.copysign(acceleration, velocity))
+            )
+            distance -= velocity * braking_time / 2
+            velocity = 0.0
+
+        direction = math.copysign(1, distance)
+        initial_speed = abs(velocity)
+        peak_speed = min(
+            speed, math.sqrt(acceleration * abs(distance) + initial_speed**2 / 2)
+        )
+        accelerating_distance = (peak_speed**2 - initial_speed**2) / (2 * acceleration)
+        decelerating_distance = peak_speed**2 / (2 * acceleration)
+        cruising_distance = max(
+            abs(distance) - accelerating_distance - decelerating_distance, 0.0
+        )
+        for duration, phase_speed, phase_acceleration in [
+            (
+                abs(peak_speed - initial_speed) / acceleration,
+                initial_speed,
+                math.copysign(acceleration, peak_speed - initial_speed),
+            ),
+            (cruising_distance / peak_speed if peak_speed else 0.0, peak_speed, 0.0),
+            (peak_speed / acceleration, peak_speed, -acceleration),
+        ]:
+            if duration > 0:
+                self._phases.append(
+                    (duration, direction * phase_speed, direction * phase_acceleration)
+                )
+        self.duration = sum(phase[0] for phase in self._phases)
+
+    def _state(self, time):
+        position = self.start
+        for duration, velocity, acceleration in self._phases:
+            if time < duration:
+                return (
+                    position + velocity * time + acceleration * time**2 / 2,
+                    velocity + acceleration * time,
+                )
+            position += velocity * duration + acceleration * duration**2 / 2
+            time -= duration
+        return self.target, 0.0
+
+    def position(self, time):
+        """Angle `time` seconds after the start"""
+        return self._state(time)[0]
+
+    def velocity(self, time):
+        return self._state(time)[1]
+
+
+class Motion:
+    """Moves of one servo through its waypoints"""
+
+    def __init__(self, position, velocity, waypoints, start_time, limits):
+        self._position = position
+        self._velocity = velocity
+        self._waypoints = deque(waypoints)
+        self._limits = limits
+        self._profile = None
+        self._hold = 0.0
+        self._profile_start_time = start_time
+        self._hold_end_time = start_time
+
+    def advance(self, time):
+        """(angle, whether the motion has finished) at `time`"""
+        while True:
+            if self._profile is not None:
+                profile_time = time - self._profile_start_time
+                if profile_time < self._profile.duration:
+                    return self._profile.position(profile_time), False
+                self._position = self._profile.target
+                self._velocity = 0.0
+                self._hold_end_time = (
+                    self._profile_start_time + self._profile.duration + self._hold
+                )
+                self._profile = None
+
+            if time < self._hold_end_time:
+                return self._position, False
+            if not self._waypoints:
+                return self._position, True
+
+            waypoint = self._waypoints.popleft()
+            self._profile = TrapezoidalProfile(
+                self._position, waypoint.angle, self._velocity, *self._limits
+            )
+            self._hold = waypoint.hold
+            # when the previous waypoint ended, not when that's noticed
+            self._profile_start_time = self._hold_end_time
+
+    def state(self, time):
+        """(angle, velocity) at `time`"""
+        angle, _ = self.advance(time)
+        if self._profile is None:
+            return angle, 0.0
+        return angle, self._profile.velocity(time - self._profile_start_time)
+
+
+class MotionEngine:
+    """Moves servos (see `client.hardware.Servos`) at `update_rate` (Hz)
+
+    The updates are scheduled on `timer` (`client.timer.Timer` or `client.simulation.VirtualClock`), only while a servo
+    is moving.
+    """
+
+    def __init__(self, servos, update_rate, timer):
+        self._servos = servos
+        self._interval = 1 / update_rate
+        self._timer = timer
+        # servo name: Motion
+        self._motions = {}
+        self._condition = Condition()
+        self._stopped = False
+        self._scheduled = None
+        self._update_duration = metrics.histogram(
+            "motion_update_seconds", "Duration of a motion engine update"
+        )
+
+    def move(self, servo_name: ServoName, *waypoints, speed=None, acceleration=None):
+        """Move a servo through waypoints (angles or `Waypoint`s), replacing its current move
+
+        Returns immediately. `speed` and `acceleration` override the limits of the servo's `ServoConfig`.
+        Raises a ValueError if an angle is out of the servo's range, or a RuntimeError if the PSU is off.
+        """
+        waypoints = [
+            waypoint if isinstance(waypoint, Waypoint) else Waypoint(waypoint)
+            for waypoint in waypoints
+        ]
+        for waypoint in waypoints:
+            self._servos.check_angle(servo_name, waypoint.angle)
+        self._servos.check_psu()
+
+        servo_config = ServoConfigs[servo_name]
+        limits = (
+            servo_config.max_speed if speed is None else speed,
+            servo_config.max_acceleration if acceleration is None else acceleration,
+        )
+        with self._condition:
+            now = self._timer()
+            motion = self._motions.get(servo_name)
+            if motion is not None:
+                position, velocity = motion.state(now)
+            else:
+                position = self._servos.last_angle(servo_name)
+                velocity = 0.0
+                if position is None:
+                    # unknown, the first waypoint is set directly
+                    position = waypoints[0].angle if waypoints else None
+            if position is None:
+                return
+            self._motions[servo_name] = Motion(
+                position, velocity, waypoints, now, limits
+            )
+
+            if self._scheduled is None and not self._stopped:
+                self._scheduled = self._timer.call_at(now, self._scheduled_update)
+
+    def cancel(self, servo_name: ServoName):
+        """Stops moving a servo where it is, e.g. before it is set directly"""
+        with self._condition:
+            self._motions.pop(servo_name, None)
+
+    def cancel_channels(self, pulse_widths):
+        """Stops moving the servos of {side: {channel: pulse width}} before `Servos.set_pulse_widths` writes them"""
+        # most of the time nothing is moving
+        if not self._motions:
+            return
+        with self._condition:
+            for servo_name in list(self._motions):
+                servo_config = ServoConfigs[servo_name]
+                if servo_config.pin.value in pulse_widths.get(servo_config.side, ()):
+                    del self._motions[servo_name]
+
+    def is_moving(self, servo_name: ServoName):
+        with self._condition:
+            return servo_name in self._motions
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._motions.clear()
+            if self._scheduled is not None:
+                self._timer.cancel(self._scheduled)
+                self._scheduled = None
+
+    def _update(self):
+        """Writes the angles of all moving servos, returns whether any is still moving"""
+        start_time = perf_counter()
+        # written with the lock held, so that a cancelled move can't overwrite what replaced it
+        with self._condition:
+            now = self._timer()
+            angles = {}
+            for servo_name, motion in list(self._motions.items()):
+                angles[servo_name], finished = motion.advance(now)
+                if finished:
+                    del self._motions[servo_name]
+            moving = bool(self._motions)
+
+            try:
+                self._servos.set_many(angles)
+            except (RuntimeError, ValueError) as error:
+                print(f"Motion stopped: {error}")
+                self._motions.clear()
+                moving = False
+        self._update_duration.observe(perf_counter() - start_time)
+        return moving
+
+    def _scheduled_update(self):
+        with self._condition:
+            self._scheduled = None
+        if self._update():
+            with self._condition:
+                if self._scheduled is None and not self._stopped:
+                    self._scheduled = self._timer.call_at(
+                        self._timer() + self._interval, self._scheduled_update
+                    )
@@ -1,165 +1,432 @@
-import json
 import os.path
-from time import sleep
-from timeit import default_timer as timer
-from math import degrees
+from bisect import bisect_left
+from contextlib import nullcontext
+from time import perf_counter
+import numpy
+from config.config import config
 from .audio import Audio
+from .audio_prefetch import AudioPrefetcher
 from .exec import threadable
-from .constants import RENDER_BASE_PATH, ServoConfigs
-from .midi import MIDI
+from .constants import (
+    RENDER_BASE_PATH,
+    DEFAULT_SERVO_UPDATE_RATE,
+    DEFAULT_AUDIO_PREFETCH_SECONDS,
+    DEFAULT_STREAMING_LOOKAHEAD_SECONDS,
+    Config,
+    PSUCheck,
+)
+from .curves import ServoCurve, ServoTrack
+from .instructions import (
+    InstructionError,
+    SetMuted,
+    compile_instruction,
+    compile_instructions,
+)
+from .metrics import metrics
+from .scheduler import FrameScheduler, OverrunPolicy
+from .servo_transforms import ServoTransformTable, load_transforms
+from .show import JSON_FILE_NAME, load_show
+from .streaming import AudioWindow, StreamingShow
+from .timeline import Timeline
 
 
 class Performance:
-    def __init__(self, hardware):
+    def __init__(self, hardware, clock=perf_counter, render_directory=RENDER_BASE_PATH):
+        """`clock` is passed to the frame scheduler, see `client.scheduler.FrameScheduler`"""
         self._hardware = hardware
+        self._clock = clock
+        self._render_directory = render_directory
         self._audio = hardware.audio
         self._abort = False
         self._goto = None
         self._frame_index = 0
         self._muted = False
+        self._scheduler = None
+        self._seek = None
+        self._show = None
+        self._audio_window = None
+        # jitter statistics of the last act, see `client.scheduler.JitterStatistics.summary()`
+        self.frame_timing = None
 
     def abort(self):
         print("ABORT!")
+        self.end()
+
+    def end(self):
         self._abort = True
+        if self._scheduler is not None:
+            self._scheduler.interrupt()
+
+    def goto(self, frame_index: int):
+        self._goto = frame_index
+        if self._scheduler is not None:
+            self._scheduler.interrupt()
+
+    def goto_marker(self, marker_name):
+        """Jump to a marker that might not be loaded yet when the play is streamed"""
+        marker_frame = self._show.wait_for_marker(marker_name)
+        if marker_frame is None:
+            print(f"No such marker: {marker_name}")
+            self.abort()
+            return
+        self.goto(marker_frame)
+
+    def set_muted(self, muted: bool):
+        self._muted = muted
+
+    def seek(self, target):
+        """Continue at a frame index or marker name, with servos, mute state and audio as if played up to there
+
+        If the play isn't running, the next `act()` starts there.
+        """
+        self._seek = self._resolve_frame(target)
+        if self._scheduler is not None:
+            self._scheduler.interrupt()
+
+    def _resolve_frame(self, target):
+        if self._show is None:
+            raise RuntimeError("Play is not prepared")
+
+        if isinstance(target, str):
+            marker_frame = self._show.wait_for_marker(target)
+            if marker_frame is None:
+                raise ValueError(f"No such marker: {target}")
+            return marker_frame
+
+        # the length of a streamed play might not be known yet
+        frame_count = self._show.frame_count
+        if target < 0 or (frame_count is not None and target >= frame_count):
+            raise ValueError(f"Frame {target} outside of play ({frame_count} frames)")
+        return target
+
+    def _muted_at(self, frame_index):
+        """Mute state when `frame_index` is reached, before its own instructions"""
+        mute_change = bisect_left(self._mute_changes, (frame_index,)) - 1
+        return mute_change >= 0 and self._mute_changes[mute_change][1]
+
+    def _set_playhead(self, frame_index):
+        self._show.set_playhead(frame_index)
+        if self._audio_window is not None:
+            self._audio_window.set_playhead(frame_index)
+
+    def _restore_state(self, frame_index):
+        """Reconstruct the mute state and the audio that would be playing at `frame_index`"""
+        self._set_playhead(frame_index)
+        self._show.wait_until_loaded(frame_index)
+        if self._audio_window is not None:
+            self._audio_window.wait_until_ready()
+        self._muted = self._muted_at(frame_index)
+
+        self._audio.stop_all()
+        fps = self._show.fps
+        for cue_frame in self._show.audio_cue_frames():
+            if cue_frame >= frame_index:
+                break
+            if self._muted_at(cue_frame):
+                continue
+            for audio_file_path in self._show.audio(cue_frame):
+                audio_file_path = os.path.join(self._render_directory, audio_file_path)
+                offset = (frame_index - cue_frame) / fps
+                if offset < self._audio.duration(audio_file_path):
+                    print(f"Resume audio {audio_file_path} at {offset:.2f}s")
+                    self._audio.play_preloaded_file(audio_file_path, offset=offset)
 
     def prepare(self):
-        with open(os.path.join(RENDER_BASE_PATH, "play.json"), "r") as json_file:
-            self._instructions = json.load(json_file)
+        json_path = os.path.join(self._render_directory, JSON_FILE_NAME)
+        if self._show is not None:
+            self._show.close()
+        if self._audio_window is not None:
+            self._audio_window.stop()
+            self._audio_window = None
+
+        if config["client"].get(Config.STREAMING, False):
+            self._prepare_streaming(json_path)
+        else:
+            self._show = load_show(json_path)
+            print(self._show.meta)
+            self._program = compile_instructions(self._show, self, self._hardware)
+            # (frame index, muted) of all mute/unmute instructions, to restore the state when seeking
+            self._mute_changes = [
+                (frame_index, opcode.muted)
+                for frame_index, opcodes in sorted(self._program.items())
+                for opcode in opcodes
+                if isinstance(opcode, SetMuted)
+            ]
+
+            self._audio_window = AudioPrefetcher(
+                self._audio,
+                self._show,
+                self._render_directory,
+                config["client"].get(
+                    Config.AUDIO_PREFETCH, DEFAULT_AUDIO_PREFETCH_SECONDS
+                ),
+            )
+            # wakes the performance up to move the prefetched window in quiet passages
+            self._timeline = Timeline.of_show(
+                self._show, self._program, self._audio_window.change_frames
+            )
+            self._audio_window.start()
+            self._audio_window.wait_until_ready()
+
+        self._servo_track = ServoTrack(
+            {
+                servo_name: ServoCurve(keyframes)
+                for servo_name, keyframes in self._show.servo_keyframes().items()
+            },
+            self._show.fps,
+            config["client"].get(Config.SERVO_UPDATE_RATE, DEFAULT_SERVO_UPDATE_RATE),
+        )
+        self._servo_transforms = ServoTransformTable(
+            self._servo_track.names,
+            load_transforms(config["client"]),
+            self._hardware.servos.FREQUENCY,
+        )
+        for servo_name in self._servo_transforms.unknown_names:
+            print(f"Unknown servo {servo_name}")
+
+    def _prepare_streaming(self, json_path):
+        """Load the play in the background, returns as soon as the first look-ahead window (and its audio) is loaded
+
+        Instructions are compiled as their frames are loaded. Errors in later frames end the play at that frame.
+        """
+        show = StreamingShow(
+            json_path,
+            config["client"].get(
+                Config.STREAMING_LOOKAHEAD, DEFAULT_STREAMING_LOOKAHEAD_SECONDS
+            ),
+        )
+        print(show.meta)
+        self._show = show
+        self._program = {}
+        self._timeline = Timeline()
+        self._mute_changes = []
+        self._load_error = None
+        deferred_markers = set()
+
+        def on_frame(frame_index):
+            if self._load_error is not None:
+                return
+
+            opcodes = ()
+            for instruction_text in show.instructions(frame_index):
+                try:
+                    opcode = compile_instruction(
+                        instruction_text,
+                        self,
+                        self._hardware,
+                        show.markers,
+                        show.fps,
+                        deferred_markers,
+                    )
+                except ValueError as error:
+                    self._fail_loading(
+                        InstructionError(instruction_text, frame_index, str(error)),
+                        frame_index,
+                    )
+                    return
+                if opcode is not None:
+                    opcodes += (opcode,)
+                if isinstance(opcode, SetMuted):
+                    self._mute_changes.append((frame_index, opcode.muted))
+
+            if opcodes:
+                self._program[frame_index] = opcodes
+            self._timeline.add(frame_index)
+
+        def on_complete():
+            if self._load_error is not None:
+                return
+
+            unknown_markers = deferred_markers - set(show.markers)
+            if unknown_markers:
+                self._fail_loading(
+                    ValueError(
+                        f"Unknown markers: {', '.join(sorted(unknown_markers))}"
+                    ),
+                    show.frame_count,
+                )
+                return
+            self._timeline.finish(show.frame_count)
 
-        print(self._instructions["meta"])
+        self._audio_window = AudioWindow(self._audio, show, self._render_directory)
+        self._audio_window.start()
+        show.start(on_frame, on_complete)
 
-        audio_file_names = self._instructions["audio_files"]
-        for audio_file_name in audio_file_names:
-            self._audio.preload(os.path.join(RENDER_BASE_PATH, audio_file_name))
+        show.wait_until_loaded(show.lookahead_frames)
+        if self._load_error is not None:
+            raise self._load_error
+        self._audio_window.wait_until_ready()
+
+    def _fail_loading(self, error, frame_index):
+        """Stop a streamed play at `frame_index` because of an error in the play"""
+        print(f"Failed to load play: {error}")
+        self._load_error = error
+        self._show.close()
+        self._timeline.finish(frame_index)
+        self.end()
 
     @threadable
-    def act(self, finish_callback=lambda: None):
-        fps = self._instructions["fps"]
-        frames = self._instructions["frames"]
-
-        marker = {}
-        for frame in frames:
-            for instruction in frame["instructions"]:
-                if instruction.startswith("marker"):
-                    marker_name = instruction.split(":")[1]
-                    marker[marker_name] = frame["index"]
-
-        start_time = timer()
-        self._frame_index = 0
+    def act(self, finish_callback=lambda: None, start_at=None):
+        start_frame = 0
+        if start_at is not None:
+            # on the act thread, the caller can't catch it
+            try:
+                start_frame = self._resolve_frame(start_at)
+            except ValueError as error:
+                print(f"Failed to start play: {error}")
+                finish_callback()
+                return
+        elif self._seek is not None:
+            start_frame = self._seek
+
+        show = self._show
+        fps = show.fps
+        program = self._program
+        timeline = self._timeline
+        servo_track = self._servo_track
+        servo_transforms = self._servo_transforms
+        psu_check = PSUCheck(
+            config["client"].get(Config.PSU_CHECK, PSUCheck.COMMAND.value)
+        )
+        # with PSUCheck.FRAME, the commands of a wakeup check that the PSU is on once
+        psu_batch = (
+            self._hardware.psu.batch if psu_check == PSUCheck.FRAME else nullcontext
+        )
+        render_directory = self._render_directory
+
+        scheduler = FrameScheduler(
+            fps,
+            OverrunPolicy(
+                config["client"].get(
+                    Config.OVERRUN_POLICY, OverrunPolicy.SKIP_SERVO_FRAMES.value
+                )
+            ),
+            clock=self._clock,
+        )
+        # -1 for servos without a pulse width sent yet
+        pulse_widths_sent = numpy.full(len(servo_transforms.names), -1)
+
+        frame_duration = metrics.histogram(
+            "frame_processing_seconds",
+            "Time from waking up for a frame (or servo update) until it is processed",
+        )
+        lateness_histogram = metrics.histogram(
+            "scheduler_lateness_seconds", "How late the scheduler woke up"
+        )
+        audio_dispatch_duration = metrics.histogram(
+            "audio_dispatch_seconds", "Time to start the audio of a frame"
+        )
+        servo_update_duration = metrics.histogram(
+            "servo_update_seconds", "Time to evaluate and send one servo update"
+        )
+
+        self._seek = None
+        self._restore_state(start_frame)
+
+        position = timeline.position(start_frame)
+        # (fractional) frame of the next servo update, None while no servo moves anymore
+        servo_update = start_frame
         self._abort = False
         self._goto = None
-        while self._frame_index < len(frames):
-            frame = frames[self._frame_index]
-
-            print(f"{frame['index']}/{len(frames)} [{frame['_absolute_index']}]")
-            for audio_file_path in frame["audio"]:
-                if not self._muted:
-                    print(f"Play audio {audio_file_path}")
-                    self._audio.play_preloaded_file(
-                        os.path.join(RENDER_BASE_PATH, audio_file_path)
-                    )
-
-            for instruction in frame["instructions"]:
-                instruction_type, raw_expression, raw_duration = instruction.split(":")
-                duration_frames = int(raw_duration)
-                duration_seconds = duration_frames / fps
-                expression = raw_expression.split(";")[0]
-                expression_arguments = raw_expression.split(";")[1:]
-                if instruction_type == "hardware":
-                    eval(f"self._hardware.{expression}")
-                elif instruction_type == "log":
-                    print("LOG:", expression)
-                elif instruction_type == "mute":
-                    self._muted = True
-                elif instruction_type == "unmute":
-                    self._muted = False
-                elif instruction_type == "marker":
-                    pass
-                elif instruction_type == "midi":
-                    if expression == "play":
-                        self._hardware.midi.listen(expression_arguments[0])
-                    else:
-                        MIDI.play(expression)
-                elif instruction_type == "logic":
-                    if expression == "abort_if_no_sound":
+        self._scheduler = scheduler
+        scheduler.start(start_frame)
+        while timeline.wait_for(position):
+            frame_index = timeline.frames[position]
+            due = (
+                frame_index if servo_update is None else min(frame_index, servo_update)
+            )
+            lateness = scheduler.wait_for(due)
+            if self._abort:
+                break
+            start_time = perf_counter()
+            if lateness is not None:
+                lateness_histogram.observe(lateness)
 
-                        def abort_no_sound():
-                            self._goto = marker["aborted-ending"]
+            with psu_batch():
+                if lateness is not None and due == frame_index:
+                    position += 1
+                    self._set_playhead(frame_index)
+                    if timeline.end_frame is None or frame_index < timeline.end_frame:
+                        self._frame_index = frame_index
+                        if lateness * fps >= 1:
+                            print(
+                                f"Warning! Frame {frame_index} started {lateness:.3f}s late!"
+                            )
 
-                        self._hardware.microphone.monitor(
-                            duration_seconds, callback_after_timeout=abort_no_sound
-                        )
-                    elif expression == "wait_for_sound":
-                        if expression_arguments[0].startswith("goto"):
-                            goto_target = expression_arguments[0].split("=")[1]
-                            goto_marker_frame = marker[goto_target]
-
-                            def goto():
-                                self._goto = goto_marker_frame
-
-                            self._hardware.microphone.monitor(
-                                duration_seconds,
-                                callback_on_sound=goto,
-                                invert="invert" in expression_arguments,
+                        audio_files = show.audio(frame_index)
+                        if audio_files:
+                            audio_start_time = perf_counter()
+                            for audio_file_path in audio_files:
+                                if not self._muted:
+                                    print(f"Play audio {audio_file_path}")
+                                    self._audio.play_preloaded_file(
+                                        os.path.join(render_directory, audio_file_path)
+                                    )
+                            audio_dispatch_duration.observe(
+                                perf_counter() - audio_start_time
                             )
-                        else:
-                            print(
-                                f"Unknown callback for 'wait_for_sound' logic instruction: {instruction}"
+
+                        for opcode in program.get(frame_index, ()):
+                            opcode_start_time = perf_counter()
+                            opcode()
+                            opcode.duration_histogram.observe(
+                                perf_counter() - opcode_start_time
                             )
-                    elif expression == "end":
-                        self._abort = True
+
+                if lateness is not None and due == servo_update:
+                    if scheduler.should_skip_servos(servo_update, servo_track.tick):
+                        # the next update evaluates the curves where the schedule is now
+                        servo_update = scheduler.current_frame()
                     else:
-                        print(f"Unknown logic instruction: {instruction}")
-                else:
-                    print(f"Unknown instruction: {instruction}")
-
-            # print(frame['servos'])
-            for servo_name, servo_radians in frame["servos"].items():
-                servo_angle = degrees(servo_radians)
-                if servo_name == "croco base right":
-                    self._hardware.crocos.base_right(45 + servo_angle)
-                elif servo_name == "croco base center":
-                    self._hardware.crocos.base_center(45 + servo_angle)
-                elif servo_name == "croco base left":
-                    self._hardware.crocos.base_left(45 + servo_angle)
-                elif servo_name == "croco jaw center":
-                    self._hardware.crocos.jaw_center(max(62 - servo_angle * 0.55, 45))
-                elif servo_name == "croco jaw left":
-                    self._hardware.crocos.jaw_left(min(28 + servo_angle * 0.7, 40))
-                elif servo_name == "croco jaw right":
-                    self._hardware.crocos.jaw_right(
-                        max(60 - servo_angle, ServoConfigs[servo_name].min_angle)
-                    )
-                else:
-                    print(f"Unknown servo {servo_name}")
+                        servo_start_time = perf_counter()
+                        pulse_widths = servo_transforms.pulse_widths(
+                            servo_track.values(servo_update)
+                        )
+                        changed = pulse_widths != pulse_widths_sent
+                        if changed.any():
+                            writes = servo_transforms.writes(pulse_widths, changed)
+                            # the curves take over from moves of the same servos
+                            self._hardware.motion.cancel_channels(writes)
+                            self._hardware.servos.set_pulse_widths(writes)
+                            pulse_widths_sent = pulse_widths
+                        servo_update_duration.observe(perf_counter() - servo_start_time)
+                    servo_update = servo_track.next_update(servo_update)
+
+            if lateness is not None:
+                frame_duration.observe(perf_counter() - start_time)
 
             if self._goto is not None:
-                start_time -= (self._goto - self._frame_index) / fps
-                self._frame_index = self._goto
+                print(f"Jump to frame {self._goto}")
+                self._set_playhead(self._goto)
+                position = timeline.position(self._goto)
+                servo_update = self._goto
+                scheduler.rebase(self._goto)
                 self._goto = None
-            else:
-                self._frame_index += 1
-
-            wall_time = timer() - start_time
-            next_frame_time = (frame["index"] + 1) / fps
-            time_to_next_frame = next_frame_time - wall_time
-            if time_to_next_frame <= 0:
-                print(
-                    f"Warning! Drift of {time_to_next_frame:.3f}s at frame {frame['index']}! (Actual offender unknown)"
-                )
-                continue
 
-            sleep(next_frame_time - wall_time)
-
-            if self._abort:
-                break
+            if self._seek is not None:
+                print(f"Seek to frame {self._seek}")
+                self._restore_state(self._seek)
+                pulse_widths_sent[:] = -1
+                position = timeline.position(self._seek)
+                servo_update = self._seek
+                scheduler.rebase(self._seek)
+                self._seek = None
 
+        self._scheduler = None
+        self.frame_timing = scheduler.statistics.summary()
+        print(f"Frame timing: {self.frame_timing}")
         finish_callback()
 
     @threadable
-    def play(self, finish_callback=lambda: None):
-        self.prepare()
-        self.act(finish_callback=finish_callback)
+    def play(self, finish_callback=lambda: None, start_at=None):
+        try:
+            self.prepare()
+        except ValueError as error:
+            print(f"Failed to prepare play: {error}")
+            finish_callback()
+            return
+
+        self.act(finish_callback=finish_callback, start_at=start_at)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,134 @@
+"""Frame timing for the performance, based on absolute deadlines so that waiting never accumulates drift"""
+
+import math
+from enum import Enum
+from threading import Event
+from time import perf_counter
+
+
+class OverrunPolicy(Enum):
+    # servo updates whose time slot has already passed are dropped (the next update catches up to the curves),
+    # audio and instructions are still executed
+    SKIP_SERVO_FRAMES = "skip_servo_frames"
+    # every frame is processed completely, as fast as possible until the schedule is met again
+    RUN_LATE = "run_late"
+
+
+class JitterStatistics:
+    """Running statistics (Welford) of how late the scheduler woke up relative to the deadlines"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.overruns = 0
+
+    def add(self, lateness):
+        self.count += 1
+        delta = lateness - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (lateness - self.mean)
+        if lateness < self.min:
+            self.min = lateness
+        if lateness > self.max:
+            self.max = lateness
+
+    @property
+    def standard_deviation(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def summary(self):
+        return {
+            "wakeups": self.count,
+            "mean_ms": self.mean * 1000,
+            "standard_deviation_ms": self.standard_deviation * 1000,
+            "min_ms": (self.min if self.count else 0) * 1000,
+            "max_ms": (self.max if self.count else 0) * 1000,
+            "overruns": self.overruns,
+        }
+
+
+class FrameScheduler:
+    # wake up this long before the deadline from a coarse sleep and spin for the rest
+    DEFAULT_SPIN_THRESHOLD = 0.001
+
+    def __init__(
+        self,
+        fps,
+        overrun_policy=OverrunPolicy.SKIP_SERVO_FRAMES,
+        spin_threshold=DEFAULT_SPIN_THRESHOLD,
+        clock=perf_counter,
+    ):
+        """`clock` returns the current time in seconds. If it has a `sleep_until(deadline, interrupted_event)` method
+        (like `client.simulation.VirtualClock`), waiting is left to it."""
+        self.fps = fps
+        self.overrun_policy = overrun_policy
+        self.spin_threshold = spin_threshold
+        self.statistics = JitterStatistics()
+        self._clock = clock
+        self._sleep_until = getattr(clock, "sleep_until", self._sleep_and_spin_until)
+        self._origin = clock()
+        self._interrupted = Event()
+
+    def start(self, frame_index=0):
+        """Start the schedule so that `frame_index` is due now"""
+        self.statistics.reset()
+        self._interrupted.clear()
+        self.rebase(frame_index)
+
+    def rebase(self, frame_index):
+        """Continue the schedule from `frame_index` (due now), e.g. after jumping to a marker"""
+        self._origin = self._clock() - frame_index / self.fps
+
+    def deadline(self, frame_index):
+        return self._origin + frame_index / self.fps
+
+    def current_frame(self):
+        """The (fractional) frame that is due right now"""
+        return (self._clock() - self._origin) * self.fps
+
+    def interrupt(self):
+        """Wake up a pending `wait_for` early, e.g. to abort or jump"""
+        self._interrupted.set()
+
+    def wait_for(self, frame_index):
+        """Block until `frame_index` is due and return how late (in seconds) it was started
+
+        Returns None if the wait was interrupted before the deadline.
+        """
+        deadline = self.deadline(frame_index)
+        if self._sleep_until(deadline, self._interrupted):
+            self._interrupted.clear()
+            return None
+
+        lateness = self._clock() - deadline
+        self.statistics.add(lateness)
+        if lateness * self.fps >= 1:
+            self.statistics.overruns += 1
+        return lateness
+
+    def _sleep_and_spin_until(self, deadline, interrupted):
+        """Returns True if interrupted before the deadline"""
+        remaining = deadline - self._clock()
+        if remaining > self.spin_threshold and interrupted.wait(
+            remaining - self.spin_threshold
+        ):
+            return True
+        while self._clock() < deadline:
+            pass
+        return False
+
+    def is_overrun(self, frame_index, period=1):
+        """Whether processing `frame_index` has already taken until (or past) the next update `period` frames later"""
+        return self._clock() >= self.deadline(frame_index + period)
+
+    def should_skip_servos(self, frame_index, period=1):
+        return (
+            self.overrun_policy == OverrunPolicy.SKIP_SERVO_FRAMES
+            and self.is_overrun(frame_index, period)
+        )
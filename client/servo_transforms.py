@@ -0,0 +1,122 @@
+"""Mapping of exported servo values (radians) to PCA9685 pulse widths, for all servos of an update at once
+
+Every exported servo name has a `ServoTransform` from `client.constants.ServoTransforms`. The client config's
+`servo_transforms` replaces or adds to them, targeting a servo by name or by board side and channel:
+
+    "servo_transforms": {
+        "croco jaw left": {"servo": "crocodile jaw left", "offset": 28, "scale": 0.7, "clamp_max": 40},
+        "croco tail": {"side": "right", "channel": 9, "min_angle": 30, "max_angle": 60, "offset": 45}
+    }
+"""
+
+import math
+
+import numpy
+
+from .constants import (
+    Config,
+    ServoConfig,
+    ServoConfigs,
+    ServoName,
+    ServoSide,
+    ServoTransform,
+    ServoTransforms,
+)
+
+
+def transform_from_config(name, parameters):
+    try:
+        if "servo" in parameters:
+            servo_config = ServoConfigs[ServoName(parameters["servo"])]
+        else:
+            servo_config = ServoConfig(
+                ServoSide(parameters["side"]),
+                int(parameters["channel"]),
+                min_angle=parameters["min_angle"],
+                max_angle=parameters["max_angle"],
+            )
+        return ServoTransform(
+            servo_config,
+            offset=parameters.get("offset", 0),
+            scale=parameters.get("scale", 1),
+            clamp_min=parameters.get("clamp_min"),
+            clamp_max=parameters.get("clamp_max"),
+        )
+    except (KeyError, TypeError, ValueError) as error:
+        raise ValueError(f'Invalid servo transform for "{name}": {error!r}')
+
+
+def load_transforms(client_config):
+    transforms = dict(ServoTransforms)
+    for name, parameters in client_config.get(Config.SERVO_TRANSFORMS, {}).items():
+        transforms[name] = transform_from_config(name, parameters)
+    return transforms
+
+
+class ServoTransformTable:
+    """The transforms of a fixed list of exported servos (e.g. `ServoTrack.names`) as arrays
+
+    Servos without a transform are listed in `unknown_names` and ignored.
+    """
+
+    def __init__(self, names, transforms, frequency):
+        self.names = [name for name in names if name in transforms]
+        self.unknown_names = [name for name in names if name not in transforms]
+        # positions of the known servos in the values passed in
+        self._indices = numpy.array(
+            [index for index, name in enumerate(names) if name in transforms],
+            dtype=int,
+        )
+        rows = [transforms[name] for name in self.names]
+
+        self._offsets = numpy.array([row.offset for row in rows], dtype=float)
+        # values are in radians
+        self._scales = numpy.array(
+            [math.degrees(row.scale) for row in rows], dtype=float
+        )
+        self._clamp_min = numpy.array(
+            [-math.inf if row.clamp_min is None else row.clamp_min for row in rows]
+        )
+        self._clamp_max = numpy.array(
+            [math.inf if row.clamp_max is None else row.clamp_max for row in rows]
+        )
+        self._min_angles = numpy.array([row.servo.min_angle for row in rows])
+        self._max_angles = numpy.array([row.servo.max_angle for row in rows])
+        self._ticks_per_degree = frequency / 10
+
+        self._channels = numpy.array(
+            [getattr(row.servo.pin, "value", row.servo.pin) for row in rows], dtype=int
+        )
+        self._side_masks = {
+            side: numpy.array([row.servo.side == side for row in rows], dtype=bool)
+            for side in ServoSide
+        }
+
+    def angles(self, values):
+        values = numpy.asarray(values, dtype=float)[self._indices]
+        return numpy.clip(
+            self._offsets + self._scales * values, self._clamp_min, self._clamp_max
+        )
+
+    def pulse_widths(self, values):
+        """Pulse widths (ticks) of the known servos from all values, raises a ValueError if any is out of its range"""
+        angles = self.angles(values)
+        unsafe = (angles < self._min_angles) | (angles > self._max_angles)
+        if unsafe.any():
+            index = int(numpy.argmax(unsafe))
+            raise ValueError(
+                f"Angle {angles[index]:.1f}° outside of safe range [{self._min_angles[index]:.1f}°, "
+                f'{self._max_angles[index]:.1f}°] for servo "{self.names[index]}"!'
+            )
+        return (angles * self._ticks_per_degree).astype(int)
+
+    def writes(self, pulse_widths, selected):
+        """{side: {channel: pulse width}} of the servos selected by a boolean array, for `Servos.set_pulse_widths`"""
+        writes = {}
+        for side, side_mask in self._side_masks.items():
+            mask = side_mask & selected
+            if mask.any():
+                writes[side] = dict(
+                    zip(self._channels[mask].tolist(), pulse_widths[mask].tolist())
+                )
+        return writes
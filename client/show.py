@@ -0,0 +1,372 @@
+"""Access to exported plays, either as the `play.json` written by Blender or as its compiled binary form.
+
+The compiled form stores everything that scales with the length of the play in fixed-size arrays, so the client can
+memory-map it instead of building one Python dict per frame. Run `python3 -m client.show <play.json>` from the project
+root to compile an existing export.
+"""
+
+import json
+import mmap
+import os.path
+import struct
+import sys
+
+import numpy
+
+from .curves import KEYFRAME_DTYPE, keyframes_from_export, keyframes_from_samples
+
+JSON_FILE_NAME = "play.json"
+COMPILED_FILE_EXTENSION = ".show"
+
+MAGIC = b"BOOTSHOW"
+FORMAT_VERSION = 2
+# magic, version, fps, frame count, absolute index of first frame, servo count, string table offset and size
+HEADER = struct.Struct("<8sIdIiIQQ")
+# offset and row count for every section listed in SECTIONS
+SECTION_ENTRY = struct.Struct("<QQ")
+SECTION_ALIGNMENT = 8
+
+EVENT_DTYPE = numpy.dtype([("frame", "<u4"), ("value", "<u4")])
+SECTIONS = ["servo_keyframes", "audio_cues", "instructions", "markers"]
+
+
+def compiled_path(json_path):
+    return os.path.splitext(json_path)[0] + COMPILED_FILE_EXTENSION
+
+
+def parse_marker_name(instruction):
+    """Return the marker name of a `marker:<name>:<duration>` instruction or None for any other instruction"""
+    if not instruction.startswith("marker:"):
+        return None
+    return instruction.split(":")[1]
+
+
+def servo_keyframes(play):
+    """Keyframes of every servo in a `play.json` (as dict) as {servo name: array of KEYFRAME_DTYPE}
+
+    Older exports without `servo_curves` contain one value per frame (only when it changed), these are held until
+    the next value.
+    """
+    if "servo_curves" in play:
+        return {
+            servo_name: keyframes_from_export(exported_keyframes, servo_name)
+            for servo_name, exported_keyframes in play["servo_curves"].items()
+        }
+
+    samples = {}
+    for frame in play["frames"]:
+        for servo_name, servo_value in frame.get("servos", {}).items():
+            samples.setdefault(servo_name, []).append((frame["index"], servo_value))
+    return {
+        servo_name: keyframes_from_samples(servo_samples)
+        for servo_name, servo_samples in samples.items()
+    }
+
+
+class Show:
+    """Common interface of loaded plays, indexed by (relative) frame index"""
+
+    fps = None
+    frame_count = 0
+    first_absolute_index = 0
+    meta = {}
+    audio_files = []
+    servo_names = []
+    markers = {}
+
+    def servo_keyframes(self):
+        """{servo name: keyframes} of all servos, see `client.curves`"""
+        raise NotImplementedError()
+
+    def audio(self, frame_index):
+        raise NotImplementedError()
+
+    def instructions(self, frame_index):
+        raise NotImplementedError()
+
+    def iter_instructions(self):
+        """Yield (frame index, instruction) for all instructions in frame order"""
+        raise NotImplementedError()
+
+    def audio_cue_frames(self):
+        """Sorted indices of all frames with audio cues"""
+        raise NotImplementedError()
+
+    def absolute_index(self, frame_index):
+        return self.first_absolute_index + frame_index
+
+    def set_playhead(self, frame_index):
+        """Tell the show where the performance is, streamed shows load ahead of it"""
+        pass
+
+    def close(self):
+        pass
+
+    def wait_until_loaded(self, frame_index):
+        pass
+
+    def wait_for_marker(self, marker_name):
+        """Frame index of a marker, None if there is no such marker"""
+        return self.markers.get(marker_name)
+
+
+class JSONShow(Show):
+    def __init__(self, play):
+        self._frames = play["frames"]
+        self.fps = play["fps"]
+        self.frame_count = len(self._frames)
+        self.first_absolute_index = (
+            self._frames[0]["_absolute_index"] if self._frames else 0
+        )
+        self.meta = play["meta"]
+        self.audio_files = play["audio_files"]
+
+        self._servo_keyframes = servo_keyframes(play)
+        self.servo_names = list(self._servo_keyframes)
+        self.markers = {}
+        for frame in self._frames:
+            for instruction in frame["instructions"]:
+                marker_name = parse_marker_name(instruction)
+                if marker_name is not None:
+                    self.markers[marker_name] = frame["index"]
+
+    @staticmethod
+    def load(json_path):
+        with open(json_path, "r") as json_file:
+            return JSONShow(json.load(json_file))
+
+    def servo_keyframes(self):
+        return self._servo_keyframes
+
+    def audio(self, frame_index):
+        return self._frames[frame_index]["audio"]
+
+    def instructions(self, frame_index):
+        return self._frames[frame_index]["instructions"]
+
+    def iter_instructions(self):
+        for frame in self._frames:
+            for instruction in frame["instructions"]:
+                yield frame["index"], instruction
+
+    def audio_cue_frames(self):
+        return [frame["index"] for frame in self._frames if frame["audio"]]
+
+
+class CompiledShow(Show):
+    """Memory-mapped view of a compiled show, see `compile_show` for the layout"""
+
+    def __init__(self, show_path):
+        with open(show_path, "rb") as show_file:
+            self._buffer = mmap.mmap(show_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (
+            magic,
+            version,
+            self.fps,
+            self.frame_count,
+            self.first_absolute_index,
+            _,
+            strings_offset,
+            strings_size,
+        ) = HEADER.unpack_from(self._buffer, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{show_path} is not a compiled show")
+        if version != FORMAT_VERSION:
+            raise ValueError(
+                f"{show_path} has format version {version}, expected {FORMAT_VERSION} (re-compile it)"
+            )
+        if self.fps == int(self.fps):
+            self.fps = int(self.fps)
+
+        strings = json.loads(
+            self._buffer[strings_offset : strings_offset + strings_size]
+        )
+        self.meta = strings["meta"]
+        self.audio_files = strings["audio_files"]
+        self.servo_names = strings["servo_names"]
+        self._servo_keyframe_counts = strings["servo_keyframe_counts"]
+        self._strings = strings["strings"]
+
+        sections = {}
+        for section_index, section_name in enumerate(SECTIONS):
+            sections[section_name] = SECTION_ENTRY.unpack_from(
+                self._buffer, HEADER.size + section_index * SECTION_ENTRY.size
+            )
+
+        offset, count = sections["servo_keyframes"]
+        self._servo_keyframes = numpy.frombuffer(
+            self._buffer, dtype=KEYFRAME_DTYPE, count=count, offset=offset
+        )
+        self._audio_cues = self._map_events(*sections["audio_cues"])
+        self._instructions = self._map_events(*sections["instructions"])
+        markers = self._map_events(*sections["markers"])
+        self.markers = {
+            self._strings[name]: int(frame) for frame, name in markers.tolist()
+        }
+
+    def _map_events(self, offset, count):
+        return numpy.frombuffer(
+            self._buffer, dtype=EVENT_DTYPE, count=count, offset=offset
+        )
+
+    @staticmethod
+    def _event_range(events, frame_index):
+        frames = events["frame"]
+        return (
+            numpy.searchsorted(frames, frame_index, side="left"),
+            numpy.searchsorted(frames, frame_index, side="right"),
+        )
+
+    def servo_keyframes(self):
+        keyframes = {}
+        offset = 0
+        for servo_name, count in zip(self.servo_names, self._servo_keyframe_counts):
+            keyframes[servo_name] = self._servo_keyframes[offset : offset + count]
+            offset += count
+        return keyframes
+
+    def audio(self, frame_index):
+        start, end = CompiledShow._event_range(self._audio_cues, frame_index)
+        return [self.audio_files[file] for file in self._audio_cues["value"][start:end]]
+
+    def instructions(self, frame_index):
+        start, end = CompiledShow._event_range(self._instructions, frame_index)
+        return [self._strings[text] for text in self._instructions["value"][start:end]]
+
+    def iter_instructions(self):
+        for frame_index, text in self._instructions.tolist():
+            yield frame_index, self._strings[text]
+
+    def audio_cue_frames(self):
+        return numpy.unique(self._audio_cues["frame"]).tolist()
+
+
+def compile_show(play, show_path):
+    """Write the content of an exported `play.json` (as dict) in compiled form to `show_path`
+
+    Layout: header, section table, then 8-byte aligned sections
+    - servo_keyframes: keyframes (see `client.curves.KEYFRAME_DTYPE`) of all servos, one after the other
+    - audio_cues: (frame, index into audio_files) sorted by frame
+    - instructions: (frame, index into strings) sorted by frame
+    - markers: (frame, index into strings)
+    - string table: JSON with meta, audio_files, servo_names, servo_keyframe_counts and strings
+    """
+    frames = play["frames"]
+    frame_count = len(frames)
+
+    keyframes = servo_keyframes(play)
+    servo_names = list(keyframes)
+    audio_files = list(play["audio_files"])
+    audio_file_indices = {
+        audio_file: index for index, audio_file in enumerate(audio_files)
+    }
+    audio_cues = []
+    strings = []
+    string_indices = {}
+    instructions = []
+    markers = []
+
+    def string_index(string):
+        if string not in string_indices:
+            string_indices[string] = len(strings)
+            strings.append(string)
+        return string_indices[string]
+
+    for frame_index, frame in enumerate(frames):
+        for audio_file in frame["audio"]:
+            if audio_file not in audio_file_indices:
+                audio_file_indices[audio_file] = len(audio_files)
+                audio_files.append(audio_file)
+            audio_cues.append((frame_index, audio_file_indices[audio_file]))
+        for instruction in frame["instructions"]:
+            instructions.append((frame_index, string_index(instruction)))
+            marker_name = parse_marker_name(instruction)
+            if marker_name is not None:
+                markers.append((frame_index, string_index(marker_name)))
+
+    sections = [
+        numpy.concatenate(
+            [keyframes[servo_name] for servo_name in servo_names]
+            or [numpy.array([], dtype=KEYFRAME_DTYPE)]
+        ),
+        numpy.array(audio_cues, dtype=EVENT_DTYPE),
+        numpy.array(instructions, dtype=EVENT_DTYPE),
+        numpy.array(markers, dtype=EVENT_DTYPE),
+    ]
+    string_table = json.dumps(
+        {
+            "meta": play["meta"],
+            "audio_files": audio_files,
+            "servo_names": servo_names,
+            "servo_keyframe_counts": [
+                len(keyframes[servo_name]) for servo_name in servo_names
+            ],
+            "strings": strings,
+        }
+    ).encode("utf-8")
+
+    def align(offset):
+        return -(-offset // SECTION_ALIGNMENT) * SECTION_ALIGNMENT
+
+    offset = HEADER.size + len(SECTIONS) * SECTION_ENTRY.size
+    section_entries = []
+    for section in sections:
+        offset = align(offset)
+        section_entries.append((offset, len(section)))
+        offset += section.nbytes
+    strings_offset = align(offset)
+
+    temporary_path = show_path + ".tmp"
+    with open(temporary_path, "wb") as show_file:
+        show_file.write(
+            HEADER.pack(
+                MAGIC,
+                FORMAT_VERSION,
+                play["fps"],
+                frame_count,
+                frames[0]["_absolute_index"] if frames else 0,
+                len(servo_names),
+                strings_offset,
+                len(string_table),
+            )
+        )
+        for section_entry in section_entries:
+            show_file.write(SECTION_ENTRY.pack(*section_entry))
+        for section, (section_offset, _) in zip(sections, section_entries):
+            show_file.write(b"\0" * (section_offset - show_file.tell()))
+            show_file.write(section.tobytes())
+        show_file.write(b"\0" * (strings_offset - show_file.tell()))
+        show_file.write(string_table)
+    # replace atomically, a running client might have the previous version mapped
+    os.replace(temporary_path, show_path)
+
+
+def convert(json_path, show_path=None):
+    show_path = show_path or compiled_path(json_path)
+    with open(json_path, "r") as json_file:
+        compile_show(json.load(json_file), show_path)
+    return show_path
+
+
+def load_show(json_path):
+    """Load the compiled show next to `json_path` if it is up-to-date, otherwise fall back to parsing the JSON"""
+    show_path = compiled_path(json_path)
+    if os.path.exists(show_path) and (
+        not os.path.exists(json_path)
+        or os.path.getmtime(show_path) >= os.path.getmtime(json_path)
+    ):
+        try:
+            return CompiledShow(show_path)
+        except ValueError as error:
+            print(f"Ignoring compiled show: {error}")
+
+    return JSONShow.load(json_path)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in [2, 3]:
+        print("Usage: python3 -m client.show <play.json> [<play.show>]")
+        exit(1)
+
+    print(f"Compiled {convert(*sys.argv[1:])}")
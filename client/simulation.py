@@ -0,0 +1,570 @@
+"""Headless simulation of the hardware, to run plays faster than realtime on any Linux machine
+
+`Simulation` replaces the hardware libraries (`RPi.GPIO`, `smbus`, `Adafruit_PCA9685`, `sounddevice`, `soundfile`,
+`mido`) with simulated modules before `client.hardware` is imported, and `Audio` and `Microphone` with simulated ones.
+Everything runs on a `VirtualClock` that jumps straight to the next deadline instead of sleeping, and every actuator
+command is recorded with its virtual time in an `ActuatorLog`.
+
+The real `client/` code (hardware classes, performance, scheduler) runs unchanged, with threading disabled.
+
+    python3 -m client.simulation --render-directory <directory with play.json> --log actuators.jsonl
+"""
+
+import argparse
+import contextlib
+import functools
+import heapq
+import itertools
+import json
+import os.path
+import struct
+import sys
+import types
+from time import perf_counter
+
+from config.config import config
+from .constants import RENDER_BASE_PATH, Config
+
+
+class VirtualClock:
+    """Simulated time in seconds, advanced only by sleeping or waiting for deadlines
+
+    Callbacks scheduled with `call_at` run (in order) when the clock passes their time, on the thread that advances it.
+    """
+
+    def __init__(self, start=0.0):
+        self._now = start
+        self._timers = []
+        self._sequence = itertools.count()
+
+    def __call__(self):
+        return self._now
+
+    def call_at(self, time, callback):
+        """Returns a handle for `cancel`"""
+        timer = [time, next(self._sequence), callback]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    @staticmethod
+    def cancel(timer):
+        timer[2] = None
+
+    def advance_to(self, time, interrupted=None):
+        """Run all callbacks until `time`, returns True if `interrupted` (an `Event`) was set by one of them"""
+        while self._timers and self._timers[0][0] <= time:
+            timer_time, _, callback = heapq.heappop(self._timers)
+            self._now = max(self._now, timer_time)
+            if callback is not None:
+                callback()
+            if interrupted is not None and interrupted.is_set():
+                return True
+        self._now = max(self._now, time)
+        return False
+
+    def sleep(self, seconds):
+        self.advance_to(self._now + seconds)
+
+    def sleep_until(self, deadline, interrupted):
+        """Waiting of `client.scheduler.FrameScheduler`"""
+        if interrupted.is_set():
+            return True
+        return self.advance_to(deadline, interrupted)
+
+
+class ActuatorLog:
+    def __init__(self, clock):
+        self._clock = clock
+        self.entries = []
+
+    def record(self, device, command, **arguments):
+        self.entries.append(
+            {"time": self._clock(), "device": device, "command": command, **arguments}
+        )
+
+    def counts(self):
+        """{device: number of commands}"""
+        counts = {}
+        for entry in self.entries:
+            counts[entry["device"]] = counts.get(entry["device"], 0) + 1
+        return counts
+
+    def write(self, path):
+        """Write the log as JSON lines"""
+        with open(path, "w") as log_file:
+            for entry in self.entries:
+                log_file.write(json.dumps(entry) + "\n")
+
+
+class SimulatedGPIO:
+    """The subset of `RPi.GPIO` used by the client, inputs can be driven with `set_input`"""
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, log: ActuatorLog):
+        self._log = log
+        self._levels = {}
+        self._event_callbacks = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, enabled):
+        pass
+
+    def cleanup(self, *pins):
+        self._event_callbacks.clear()
+
+    def setup(self, pin, direction, pull_up_down=PUD_OFF, initial=LOW):
+        if direction == SimulatedGPIO.OUT:
+            self._levels[pin] = initial
+        elif pin not in self._levels:
+            self._levels[pin] = (
+                SimulatedGPIO.HIGH
+                if pull_up_down == SimulatedGPIO.PUD_UP
+                else SimulatedGPIO.LOW
+            )
+
+    def output(self, pin, value):
+        value = SimulatedGPIO.HIGH if value else SimulatedGPIO.LOW
+        self._levels[pin] = value
+        self._log.record("gpio", "output", pin=pin, value=value)
+
+    def input(self, pin):
+        return self._levels.get(pin, SimulatedGPIO.LOW)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self._event_callbacks[pin] = (edge, [] if callback is None else [callback])
+
+    def add_event_callback(self, pin, callback):
+        self._event_callbacks[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        self._event_callbacks.pop(pin, None)
+
+    def set_input(self, pin, value):
+        """Change the level of an input pin from the outside, calling event callbacks on matching edges"""
+        previous_value = self._levels.get(pin, SimulatedGPIO.LOW)
+        value = SimulatedGPIO.HIGH if value else SimulatedGPIO.LOW
+        self._levels[pin] = value
+        if pin not in self._event_callbacks or value == previous_value:
+            return
+
+        edge, callbacks = self._event_callbacks[pin]
+        if edge == SimulatedGPIO.BOTH or edge == (
+            SimulatedGPIO.RISING if value else SimulatedGPIO.FALLING
+        ):
+            for callback in callbacks:
+                callback(pin)
+
+
+class SimulatedSMBus:
+    """`smbus.SMBus` backed by register arrays of all devices, shared by all buses"""
+
+    def __init__(self, registers, log: ActuatorLog, bus=None):
+        self._registers = registers
+        self._log = log
+
+    def _device(self, address):
+        if address not in self._registers:
+            self._registers[address] = bytearray(256)
+        return self._registers[address]
+
+    def write_byte_data(self, address, register, value):
+        self._device(address)[register] = value & 0xFF
+        self._log.record(
+            f"i2c 0x{address:02x}", "write", register=register, values=[value & 0xFF]
+        )
+
+    def read_byte_data(self, address, register):
+        return self._device(address)[register]
+
+    def write_word_data(self, address, register, value):
+        self.write_i2c_block_data(address, register, [value & 0xFF, value >> 8 & 0xFF])
+
+    def read_word_data(self, address, register):
+        device = self._device(address)
+        return device[register] | device[(register + 1) % 256] << 8
+
+    def write_i2c_block_data(self, address, register, values):
+        device = self._device(address)
+        for offset, value in enumerate(values):
+            device[(register + offset) % 256] = value & 0xFF
+        self._log.record(
+            f"i2c 0x{address:02x}",
+            "write",
+            register=register,
+            values=[value & 0xFF for value in values],
+        )
+
+    def read_i2c_block_data(self, address, register, length=32):
+        device = self._device(address)
+        return [device[(register + offset) % 256] for offset in range(length)]
+
+    def write_byte(self, address, value):
+        self._log.record(f"i2c 0x{address:02x}", "write", values=[value & 0xFF])
+
+    def read_byte(self, address):
+        return 0
+
+    def close(self):
+        pass
+
+
+class SimulatedPCA9685:
+    """`Adafruit_PCA9685.PCA9685` writing the same registers as the original"""
+
+    MODE1 = 0x00
+    MODE2 = 0x01
+    PRESCALE = 0xFE
+    LED0_ON_L = 0x06
+    ALL_LED_ON_L = 0xFA
+    RESTART = 0x80
+    SLEEP = 0x10
+    ALLCALL = 0x01
+    OUTDRV = 0x04
+
+    def __init__(self, clock, log: ActuatorLog, address=0x40, i2c=None, **kwargs):
+        if i2c is None:
+            import Adafruit_GPIO.I2C as i2c
+        self._clock = clock
+        self._log = log
+        self.address = address
+        self._device = i2c.get_i2c_device(address, **kwargs)
+        # block writes of the LED registers (see `client.hardware.Servos`) are logged per channel like `set_pwm`
+        write_list = self._device.writeList
+
+        def write_list_and_log(register, data):
+            write_list(register, data)
+            self._log_channels(register, data)
+
+        self._device.writeList = write_list_and_log
+        self.set_all_pwm(0, 0)
+        self._device.write8(SimulatedPCA9685.MODE2, SimulatedPCA9685.OUTDRV)
+        self._device.write8(SimulatedPCA9685.MODE1, SimulatedPCA9685.ALLCALL)
+        self._clock.sleep(0.005)
+        mode = self._device.readU8(SimulatedPCA9685.MODE1) & ~SimulatedPCA9685.SLEEP
+        self._device.write8(SimulatedPCA9685.MODE1, mode)
+        self._clock.sleep(0.005)
+
+    def set_pwm_freq(self, frequency):
+        prescale = int(25000000.0 / 4096.0 / float(frequency) - 1.0 + 0.5)
+        old_mode = self._device.readU8(SimulatedPCA9685.MODE1)
+        self._device.write8(
+            SimulatedPCA9685.MODE1, (old_mode & 0x7F) | SimulatedPCA9685.SLEEP
+        )
+        self._device.write8(SimulatedPCA9685.PRESCALE, prescale)
+        self._device.write8(SimulatedPCA9685.MODE1, old_mode)
+        self._clock.sleep(0.005)
+        self._device.write8(
+            SimulatedPCA9685.MODE1, old_mode | SimulatedPCA9685.RESTART
+        )
+
+    def set_pwm(self, channel, on, off):
+        register = SimulatedPCA9685.LED0_ON_L + 4 * channel
+        self._device.write8(register, on & 0xFF)
+        self._device.write8(register + 1, on >> 8)
+        self._device.write8(register + 2, off & 0xFF)
+        self._device.write8(register + 3, off >> 8)
+        self._log.record(
+            f"pca9685 0x{self.address:02x}", "pwm", channel=channel, on=on, off=off
+        )
+
+    def _log_channels(self, register, data):
+        first_channel, offset = divmod(register - SimulatedPCA9685.LED0_ON_L, 4)
+        if offset or not 0 <= first_channel < 16:
+            return
+        for channel_offset in range(len(data) // 4):
+            on_l, on_h, off_l, off_h = data[4 * channel_offset : 4 * channel_offset + 4]
+            self._log.record(
+                f"pca9685 0x{self.address:02x}",
+                "pwm",
+                channel=first_channel + channel_offset,
+                on=on_h << 8 | on_l,
+                off=off_h << 8 | off_l,
+            )
+
+    def set_all_pwm(self, on, off):
+        register = SimulatedPCA9685.ALL_LED_ON_L
+        self._device.write8(register, on & 0xFF)
+        self._device.write8(register + 1, on >> 8)
+        self._device.write8(register + 2, off & 0xFF)
+        self._device.write8(register + 3, off >> 8)
+
+
+def wav_duration(path):
+    """Duration in seconds from the header of a WAV file"""
+    with open(path, "rb") as wav_file:
+        riff, _, wave = struct.unpack("<4sI4s", wav_file.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"Not a WAV file: {path}")
+
+        byte_rate = None
+        while True:
+            chunk_header = wav_file.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"No audio data in {path}")
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk_header)
+            if chunk_id == b"fmt ":
+                byte_rate = struct.unpack("<HHII", wav_file.read(12))[3]
+                wav_file.seek(chunk_size - 12 + chunk_size % 2, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if byte_rate is None:
+                    raise ValueError(f"No format chunk before the data in {path}")
+                return chunk_size / byte_rate
+            else:
+                wav_file.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+class SimulatedVoice:
+    def __init__(self, clip, gain):
+        self.clip = clip
+        self.gain = gain
+        self.stopped = False
+        self.finished = False
+
+
+class SimulatedAudio:
+    """`client.audio.Audio` that only logs, clips that don't exist are treated as silent and empty"""
+
+    def __init__(self, log: ActuatorLog):
+        self._log = log
+        self._durations = {}
+
+    def preload(self, file_name):
+        self._durations[file_name] = self.duration(file_name)
+
+    def unload(self, file_name):
+        self._durations.pop(file_name, None)
+
+    def evict(self, file_name):
+        self._durations.pop(file_name, None)
+
+    def duration(self, file_name):
+        if file_name in self._durations:
+            return self._durations[file_name]
+        if not os.path.exists(file_name):
+            return 0.0
+        return wav_duration(file_name)
+
+    def stop_all(self):
+        self._log.record("audio", "stop_all")
+
+    def play(self, clip, at=None, gain=1.0, offset=0.0):
+        voice = SimulatedVoice(clip, gain)
+        self._log.record(
+            "audio", "play", file=clip, offset=offset, at=at, gain=gain, voice=id(voice)
+        )
+        return voice
+
+    def stop(self, voice):
+        self._log.record("audio", "stop", voice=id(voice))
+
+    def play_preloaded_file(self, file_name, offset=0.0):
+        self.play(file_name, offset=offset)
+
+
+class SimulatedMicrophone:
+    """`client.microphone.Microphone` hearing sound during the given (start, end) intervals of virtual time
+
+    The detector is evaluated once per block like the original, `continuos` monitoring isn't simulated.
+    """
+
+    BLOCK_DURATION = 0.05
+
+    def __init__(self, clock: VirtualClock, log: ActuatorLog, sound=()):
+        self._clock = clock
+        self._log = log
+        self._sound = list(sound)
+        self._timer = None
+
+    def _is_loud(self, time):
+        return any(start <= time < end for start, end in self._sound)
+
+    def monitor(
+        self,
+        timeout,
+        callback_on_sound=lambda: None,
+        callback_after_timeout=lambda: None,
+        continuos=False,
+        verbose=False,
+        invert=False,
+    ):
+        self.stop()
+        start_time = self._clock()
+        self._log.record("microphone", "monitor", timeout=timeout, invert=invert)
+
+        def on_sound():
+            self._log.record("microphone", "sound")
+            callback_on_sound()
+
+        def after_timeout():
+            self._log.record("microphone", "timeout")
+            callback_after_timeout()
+
+        block_time = start_time + SimulatedMicrophone.BLOCK_DURATION
+        while block_time - start_time <= timeout:
+            if self._is_loud(block_time) != invert:
+                self._timer = self._clock.call_at(block_time, on_sound)
+                return
+            block_time += SimulatedMicrophone.BLOCK_DURATION
+        self._timer = self._clock.call_at(start_time + timeout, after_timeout)
+
+    def stop(self):
+        if self._timer is not None:
+            self._clock.cancel(self._timer)
+            self._timer = None
+
+
+class Simulation:
+    def __init__(self, render_directory=RENDER_BASE_PATH, sound=()):
+        """`sound` are the (start, end) intervals of virtual time in which the microphone hears something"""
+        if "client.hardware" in sys.modules and not getattr(
+            sys.modules.get("smbus"), "__simulated__", False
+        ):
+            raise RuntimeError(
+                "The simulation has to be set up before client.hardware is imported"
+            )
+
+        self.clock = VirtualClock()
+        self.log = ActuatorLog(self.clock)
+        self.gpio = SimulatedGPIO(self.log)
+        self._i2c_registers = {}
+        self._install_modules()
+
+        config["client"][Config.THREADING] = False
+        from . import hardware as hardware_module, midi as midi_module
+        from .devices.Adafruit_I2C import SharedSMBus
+        from .i2c_trace import tracer
+        from .performance import Performance
+
+        # the handles of a previous simulation's bus
+        SharedSMBus.reset()
+        tracer.reset(self.clock)
+        # module globals bound on the first import, rebound for every simulation
+        hardware_module.sleep = self.clock.sleep
+        hardware_module.PCA9685 = sys.modules["Adafruit_PCA9685"].PCA9685
+        hardware_module.Timer = lambda: self.clock
+        hardware_module.Audio = lambda: SimulatedAudio(self.log)
+        hardware_module.Microphone = lambda: SimulatedMicrophone(
+            self.clock, self.log, sound
+        )
+        midi_module.run = lambda command, **kwargs: self.log.record(
+            "midi", "run", command=command
+        )
+
+        self.hardware = hardware_module.Hardware()
+        self.hardware.performance = Performance(
+            self.hardware, clock=self.clock, render_directory=render_directory
+        )
+
+    def _install_modules(self):
+        def module(name):
+            if not getattr(sys.modules.get(name), "__simulated__", False):
+                sys.modules[name] = types.ModuleType(name)
+                sys.modules[name].__simulated__ = True
+            return sys.modules[name]
+
+        gpio = module("RPi.GPIO")
+        for name in dir(self.gpio):
+            if not name.startswith("_"):
+                setattr(gpio, name, getattr(self.gpio, name))
+        module("RPi").GPIO = gpio
+
+        module("smbus").SMBus = functools.partial(
+            SimulatedSMBus, self._i2c_registers, self.log
+        )
+
+        def get_i2c_device(address, busnum=None, **kwargs):
+            from .devices.Adafruit_I2C import Adafruit_I2C
+
+            return Adafruit_I2C(address, -1 if busnum is None else busnum)
+
+        i2c = module("Adafruit_GPIO.I2C")
+        i2c.get_i2c_device = get_i2c_device
+        module("Adafruit_GPIO").I2C = i2c
+
+        module("Adafruit_PCA9685").PCA9685 = functools.partial(
+            SimulatedPCA9685, self.clock, self.log
+        )
+
+        # only used by the replaced audio, microphone and MIDI input code
+        sounddevice = module("sounddevice")
+        sounddevice.query_devices = lambda *args, **kwargs: []
+        sounddevice.CallbackStop = type("CallbackStop", (Exception,), {})
+        sounddevice.PortAudioError = type("PortAudioError", (Exception,), {})
+        module("soundfile")
+        module("mido").open_input = lambda *args, **kwargs: contextlib.nullcontext(
+            iter(())
+        )
+
+    def run(self, start_at=None):
+        """Play the show (with the PSU switched on) and return a summary"""
+        performance = self.hardware.performance
+        self.hardware.psu.turn_on()
+        self.hardware.servos.resync()
+        virtual_start_time = self.clock()
+        start_time = perf_counter()
+        performance.play(start_at=start_at)
+        wall_seconds = perf_counter() - start_time
+        virtual_seconds = self.clock() - virtual_start_time
+
+        return {
+            "virtual_seconds": virtual_seconds,
+            "wall_seconds": wall_seconds,
+            "speedup": virtual_seconds / wall_seconds if wall_seconds else None,
+            "actuator_commands": self.log.counts(),
+            "servo_writes": self.hardware.servos.write_statistics(),
+            "frame_timing": performance.frame_timing,
+        }
+
+
+def parse_interval(interval):
+    start, end = interval.split("-")
+    return float(start), float(end)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--render-directory", default=RENDER_BASE_PATH)
+    parser.add_argument(
+        "--start-at", help="frame index or marker name to start the play at"
+    )
+    parser.add_argument(
+        "--sound",
+        type=parse_interval,
+        action="append",
+        default=[],
+        metavar="START-END",
+        help="virtual seconds in which the microphone hears sound (repeatable)",
+    )
+    parser.add_argument("--log", help="write the actuator log to this file (JSON lines)")
+    parser.add_argument(
+        "--verbose", action="store_true", help="show the output of the play"
+    )
+    arguments = parser.parse_args()
+
+    start_at = arguments.start_at
+    if start_at is not None and start_at.isdigit():
+        start_at = int(start_at)
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+        sys.stdout if arguments.verbose else devnull
+    ):
+        simulation = Simulation(arguments.render_directory, arguments.sound)
+        summary = simulation.run(start_at=start_at)
+
+    if arguments.log:
+        simulation.log.write(arguments.log)
+    print(json.dumps(summary, indent=4))
@@ -0,0 +1,331 @@
+"""Streaming of very long plays: frames are parsed incrementally and only a look-ahead window of audio is loaded
+
+Only the (few) frames with audio cues or instructions are kept once parsed, the empty ones are dropped. So memory
+grows with the number of cues and instructions (and one timeline entry per keepalive second) rather than with the
+frames. These are kept for the whole play, jumps and seeks may go back to any earlier frame and
+`Performance._restore_state` resumes the audio of all earlier cues. Playback starts as soon as the first window is
+loaded.
+"""
+
+import json
+import os.path
+import re
+from bisect import bisect_left
+from threading import Condition, Thread
+
+from .curves import keyframes_from_export
+from .show import Show, parse_marker_name
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class JSONStreamReader:
+    """Incremental reader of `play.json`: the keys before `frames` are read as header, frames are yielded one by one
+
+    The exporter writes `frames` last.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, json_path):
+        self._file = open(json_path, "r", encoding="utf-8")
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._position = 0
+        self._exhausted = False
+
+        self.header = {}
+        self._expect("{")
+        while True:
+            key = self._decode()
+            self._expect(":")
+            if key == "frames":
+                break
+            self.header[key] = self._decode()
+            self._expect(",")
+        self._expect("[")
+
+    def close(self):
+        self._file.close()
+
+    def _fill(self):
+        """Read more data, at least as much as is buffered so that retried parses stay linear"""
+        if self._exhausted:
+            return False
+
+        remaining = self._buffer[self._position :]
+        chunk = self._file.read(max(JSONStreamReader.CHUNK_SIZE, len(remaining)))
+        if not chunk:
+            self._exhausted = True
+            return False
+        self._buffer = remaining + chunk
+        self._position = 0
+        return True
+
+    def _peek(self):
+        while True:
+            self._position = WHITESPACE.match(self._buffer, self._position).end()
+            if self._position < len(self._buffer):
+                return self._buffer[self._position]
+            if not self._fill():
+                return ""
+
+    def _expect(self, token):
+        if self._peek() != token:
+            raise ValueError(
+                f"Unexpected play.json structure, expected '{token}' but got '{self._peek()}'"
+            )
+        self._position += 1
+
+    def _decode(self):
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._position)
+                # a number at the very end of the buffer might continue in the next chunk
+                if end < len(self._buffer) or not self._fill():
+                    self._position = end
+                    return value
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+
+    def frames(self):
+        if self._peek() == "]":
+            return
+
+        while True:
+            yield self._decode()
+            if self._peek() == "]":
+                return
+            self._expect(",")
+
+
+class StreamingShow(Show):
+    # without any event for this long, an empty frame is still added to the timeline so playback can't overtake loading
+    KEEPALIVE_SECONDS = 1
+
+    def __init__(self, json_path, lookahead_seconds):
+        self._reader = JSONStreamReader(json_path)
+        header = self._reader.header
+        if "servo_curves" not in header:
+            raise ValueError(
+                "Streaming requires an export with servo curves, re-export the play"
+            )
+
+        self.fps = header["fps"]
+        self.meta = header["meta"]
+        self.audio_files = header["audio_files"]
+        # unknown until loaded completely for exports without frame_count
+        self.frame_count = header.get("frame_count")
+        self.servo_names = list(header["servo_curves"])
+        self._servo_keyframes = {
+            servo_name: keyframes_from_export(exported_keyframes, servo_name)
+            for servo_name, exported_keyframes in header["servo_curves"].items()
+        }
+        self.markers = {}
+        self.complete = False
+        self.loaded_frames = 0
+        self.playhead = 0
+        self.lookahead_frames = lookahead_seconds * self.fps
+
+        self._audio = {}
+        self._instructions = {}
+        self._wanted_marker = None
+        self._closed = False
+        self._condition = Condition()
+
+    def start(self, on_frame, on_complete):
+        """Load frames in the background, calling `on_frame(frame_index)` for frames with audio or instructions
+        (or keepalive) and `on_complete()` at the end"""
+        Thread(target=self._load, args=(on_frame, on_complete), daemon=True).start()
+
+    def _load(self, on_frame, on_complete):
+        keepalive_frames = StreamingShow.KEEPALIVE_SECONDS * self.fps
+        last_frame = -keepalive_frames
+        for frame in self._reader.frames():
+            frame_index = frame["index"]
+            if frame_index == 0:
+                self.first_absolute_index = frame["_absolute_index"]
+
+            with self._condition:
+                while (
+                    frame_index > self.playhead + self.lookahead_frames
+                    and self._wanted_marker is None
+                    and not self._closed
+                ):
+                    self._condition.wait()
+                if self._closed:
+                    break
+
+                if frame["audio"]:
+                    self._audio[frame_index] = frame["audio"]
+                if frame["instructions"]:
+                    self._instructions[frame_index] = frame["instructions"]
+                    for instruction in frame["instructions"]:
+                        marker_name = parse_marker_name(instruction)
+                        if marker_name is not None:
+                            self.markers[marker_name] = frame_index
+
+            if (
+                frame["audio"]
+                or frame["instructions"]
+                or frame_index - last_frame >= keepalive_frames
+            ):
+                on_frame(frame_index)
+                last_frame = frame_index
+
+            with self._condition:
+                self.loaded_frames = frame_index + 1
+                if self._wanted_marker in self.markers:
+                    self._wanted_marker = None
+                self._condition.notify_all()
+
+        self._reader.close()
+        with self._condition:
+            if self._closed:
+                return
+            self.frame_count = self.loaded_frames
+            self.complete = True
+            self._wanted_marker = None
+            self._condition.notify_all()
+        on_complete()
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def window_loaded(self):
+        """Whether all frames up to the end of the look-ahead window are loaded"""
+        return (
+            self.complete or self.loaded_frames > self.playhead + self.lookahead_frames
+        )
+
+    def set_playhead(self, frame_index):
+        with self._condition:
+            self.playhead = frame_index
+            self._condition.notify_all()
+
+    def wait_until_loaded(self, frame_index):
+        with self._condition:
+            while (
+                self.loaded_frames <= frame_index
+                and not self.complete
+                and not self._closed
+            ):
+                self._condition.wait()
+
+    def wait_for_marker(self, marker_name):
+        """Frame index of a marker, loading beyond the look-ahead window until it is found"""
+        with self._condition:
+            while (
+                marker_name not in self.markers
+                and not self.complete
+                and not self._closed
+            ):
+                self._wanted_marker = marker_name
+                self._condition.notify_all()
+                self._condition.wait()
+            return self.markers.get(marker_name)
+
+    def servo_keyframes(self):
+        return self._servo_keyframes
+
+    def audio(self, frame_index):
+        return self._audio.get(frame_index, [])
+
+    def instructions(self, frame_index):
+        return self._instructions.get(frame_index, [])
+
+    def iter_instructions(self):
+        for frame_index, instructions in list(self._instructions.items()):
+            for instruction in instructions:
+                yield frame_index, instruction
+
+    def audio_cue_frames(self):
+        # frames are loaded in order, so the dict is sorted
+        return list(self._audio)
+
+
+class AudioWindow:
+    """Keeps the audio of all cues from the playhead to the end of the look-ahead window loaded, and nothing else"""
+
+    def __init__(self, audio, show: StreamingShow, base_path):
+        self._audio = audio
+        self._show = show
+        self._base_path = base_path
+        self._loaded = set()
+        self._stopped = False
+        self._ready = False
+
+    def start(self):
+        Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        with self._show._condition:
+            self._stopped = True
+            self._show._condition.notify_all()
+
+    def set_playhead(self, frame_index):
+        """The window follows the show's playhead"""
+        pass
+
+    def wait_until_ready(self):
+        """Wait until the audio of the whole look-ahead window is loaded once"""
+        with self._show._condition:
+            while not self._ready and not self._stopped:
+                self._show._condition.wait()
+
+    def _wanted(self):
+        show = self._show
+        cue_frames = show.audio_cue_frames()
+        start = bisect_left(cue_frames, show.playhead)
+        end = bisect_left(cue_frames, show.playhead + show.lookahead_frames + 1)
+        return {
+            os.path.join(self._base_path, audio_file)
+            for cue_frame in cue_frames[start:end]
+            for audio_file in show.audio(cue_frame)
+        }
+
+    def _state(self):
+        return self._show.playhead, len(self._show._audio)
+
+    def _run(self):
+        show = self._show
+        condition = show._condition
+        state = None
+        while True:
+            with condition:
+                while (
+                    state == self._state()
+                    and not (show.window_loaded() and not self._ready)
+                    and not self._stopped
+                ):
+                    condition.wait()
+                if self._stopped:
+                    break
+                state = self._state()
+                window_loaded = show.window_loaded()
+                wanted = self._wanted()
+
+            # clips that are still playing keep their data until they're finished
+            for audio_file in self._loaded - wanted:
+                self._audio.unload(audio_file)
+            self._loaded &= wanted
+            for audio_file in wanted - self._loaded:
+                # read again when played, which raises the error there
+                try:
+                    self._audio.preload(audio_file)
+                except Exception as error:
+                    print(f"Failed to load {audio_file}: {error!r}")
+                    continue
+                self._loaded.add(audio_file)
+
+            if window_loaded and not self._ready:
+                with condition:
+                    self._ready = True
+                    condition.notify_all()
+
+        for audio_file in self._loaded:
+            self._audio.unload(audio_file)
@@ -0,0 +1,64 @@
+"""Sparse view of a play: only the frames where something happens"""
+
+from array import array
+from bisect import bisect_left
+from threading import Condition
+
+
+class Timeline:
+    """Time-sorted frame indices of all audio cues and triggers
+
+    The performance sleeps from one of these frames (or servo update, see `client.curves.ServoTrack`) straight to the
+    next instead of waking up for every frame. The end of the play is included as a final (empty) entry, so the
+    performance still lasts as long as the play.
+
+    When streaming a play, frames are added while it is being loaded and `end_frame` is None until it is complete.
+    """
+
+    def __init__(self, frames=(), end_frame=None):
+        self.frames = array("L", sorted(frames))
+        self.end_frame = None
+        self._condition = Condition()
+        if end_frame is not None:
+            self.finish(end_frame)
+
+    @staticmethod
+    def of_show(show, program, extra_frames=()):
+        """`extra_frames` outside of the play are left out"""
+        frames = set(show.audio_cue_frames())
+        frames.update(program)
+        frames.update(
+            frame_index
+            for frame_index in extra_frames
+            if 0 <= frame_index < show.frame_count
+        )
+        return Timeline(frames, show.frame_count)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def add(self, frame_index):
+        """Append a frame while the play is being loaded, frames must be added in order"""
+        with self._condition:
+            self.frames.append(frame_index)
+            self._condition.notify_all()
+
+    def finish(self, end_frame):
+        with self._condition:
+            self.end_frame = end_frame
+            self.frames.append(end_frame)
+            self._condition.notify_all()
+
+    def wait_for(self, position):
+        """Whether there is an entry at `position`, waiting for it if the play is still being loaded"""
+        if position < len(self.frames):
+            return True
+
+        with self._condition:
+            while position >= len(self.frames) and self.end_frame is None:
+                self._condition.wait()
+            return position < len(self.frames)
+
+    def position(self, frame_index):
+        """Position of the first event at or after `frame_index`"""
+        return bisect_left(self.frames, frame_index)
@@ -0,0 +1,65 @@
+"""Timed actions (drum hits, motion updates) on one shared thread instead of a thread and a sleep each
+
+`Timer` is also a clock, it has the interface of `client.simulation.VirtualClock`, which replaces it in the simulation.
+Actions should return quickly, they delay the ones after them.
+"""
+
+import itertools
+from heapq import heappop, heappush
+from threading import Condition, Thread
+from time import perf_counter
+
+from .metrics import metrics
+
+
+class Timer:
+    def __init__(self, clock=perf_counter):
+        self._clock = clock
+        # [time, sequence, callback], callback None if cancelled
+        self._timers = []
+        self._sequence = itertools.count()
+        self._condition = Condition()
+        self._thread = None
+        self._lateness = metrics.histogram(
+            "timer_lateness_seconds", "How late timed actions started"
+        )
+
+    def __call__(self):
+        return self._clock()
+
+    def call_at(self, time, callback):
+        """Run `callback` at `time` (of the clock), returns a handle for `cancel`"""
+        timer = [time, next(self._sequence), callback]
+        with self._condition:
+            heappush(self._timers, timer)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+            if self._timers[0] is timer:
+                self._condition.notify()
+        return timer
+
+    @staticmethod
+    def cancel(timer):
+        timer[2] = None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while True:
+                    if not self._timers:
+                        self._condition.wait()
+                        continue
+                    delay = self._timers[0][0] - self._clock()
+                    if delay <= 0:
+                        break
+                    self._condition.wait(delay)
+                time, _, callback = heappop(self._timers)
+
+            if callback is None:
+                continue
+            self._lateness.observe(self._clock() - time)
+            try:
+                callback()
+            except Exception as error:
+                print(f"Timed action failed: {error!r}")
@@ -0,0 +1,11 @@
+import pytest
+
+from client.simulation import Simulation
+
+
+@pytest.fixture
+def simulation(tmp_path):
+    """Simulated hardware with the PSU on, see `client.simulation`"""
+    simulation = Simulation(str(tmp_path))
+    simulation.hardware.psu.turn_on()
+    return simulation
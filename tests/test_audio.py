@@ -0,0 +1,34 @@
+import numpy
+
+
+def test_failed_output_is_not_opened_with_every_clip(simulation, monkeypatch):
+    # the simulation provides the sounddevice module
+    from client import audio as audio_module
+
+    attempts = []
+
+    def open_stream(**kwargs):
+        attempts.append(kwargs)
+        raise audio_module.sd.PortAudioError("Device unavailable")
+
+    monkeypatch.setattr(
+        audio_module.sd,
+        "query_devices",
+        lambda *args: {"max_output_channels": 2} if args else [],
+    )
+    monkeypatch.setattr(audio_module.sd, "OutputStream", open_stream, raising=False)
+    audio = audio_module.Audio()
+    clip = audio_module.Clip(numpy.zeros((100, 2), dtype=numpy.float32), 44100)
+
+    assert audio.play(clip) is None
+    assert audio.play(clip) is None
+    assert len(attempts) == 1
+
+    now = audio_module.perf_counter()
+    monkeypatch.setattr(
+        audio_module,
+        "perf_counter",
+        lambda: now + audio_module.STREAM_RETRY_SECONDS,
+    )
+    audio.play(clip)
+    assert len(attempts) == 2
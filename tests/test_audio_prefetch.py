@@ -0,0 +1,72 @@
+from client.audio_prefetch import AudioPrefetcher
+from client.show import Show
+from client.timeline import Timeline
+
+FPS = 25
+LOOKAHEAD_SECONDS = 30
+
+
+class CueShow(Show):
+    def __init__(self, cues, frame_count):
+        self.fps = FPS
+        self.frame_count = frame_count
+        self._cues = cues
+
+    def audio(self, frame_index):
+        return self._cues.get(frame_index, [])
+
+    def audio_cue_frames(self):
+        return sorted(self._cues)
+
+
+class RecordingAudio:
+    """Records the playhead at which clips are preloaded, `failing` clips raise"""
+
+    def __init__(self, failing=()):
+        self.playhead = 0
+        self.preloaded = {}
+        self.evicted = []
+        self._failing = set(failing)
+
+    def duration(self, file_name):
+        return 2.0
+
+    def preload(self, file_name):
+        if file_name in self._failing:
+            raise RuntimeError(f"Error opening {file_name}")
+        self.preloaded.setdefault(file_name, self.playhead)
+
+    def unload(self, file_name):
+        pass
+
+    def evict(self, file_name):
+        self.evicted.append(file_name)
+
+
+def play(show, prefetcher, audio):
+    """Moves the playhead over the frames the performance wakes up for"""
+    prefetcher.start()
+    prefetcher.wait_until_ready()
+    for frame_index in Timeline.of_show(show, {}, prefetcher.change_frames).frames:
+        audio.playhead = frame_index
+        prefetcher.set_playhead(frame_index)
+        prefetcher.wait_until_ready()
+    prefetcher.stop()
+
+
+def test_prefetches_across_gap_longer_than_lookahead():
+    show = CueShow({0: ["a.wav"], 3000: ["b.wav"]}, 4000)
+    audio = RecordingAudio()
+    play(show, AudioPrefetcher(audio, show, "", LOOKAHEAD_SECONDS), audio)
+
+    assert audio.preloaded["a.wav"] == 0
+    assert audio.preloaded["b.wav"] == 3000 - LOOKAHEAD_SECONDS * FPS
+    assert audio.evicted == ["a.wav", "b.wav"]
+
+
+def test_failing_clip_does_not_block():
+    show = CueShow({0: ["missing.wav", "a.wav"], 100: ["b.wav"]}, 200)
+    audio = RecordingAudio(failing=["missing.wav"])
+    play(show, AudioPrefetcher(audio, show, "", LOOKAHEAD_SECONDS), audio)
+
+    assert list(audio.preloaded) == ["a.wav", "b.wav"]
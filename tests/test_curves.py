@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+import pytest
+
+from client.curves import ServoCurve, keyframes_from_export
+from client.show import JSONShow
+
+
+def keyframe(x, y, interpolation):
+    return [x, y, interpolation, x - 1, y, x + 1, y]
+
+
+def test_last_keyframe_exported_as_constant():
+    # only available in Blender
+    pytest.importorskip("bpy")
+    from blender.blender_utils import export_servo_curve
+
+    def point(x, y, interpolation):
+        return SimpleNamespace(
+            co=SimpleNamespace(x=x, y=y),
+            interpolation=interpolation,
+            handle_left=SimpleNamespace(x=x - 1, y=y),
+            handle_right=SimpleNamespace(x=x + 1, y=y),
+        )
+
+    fcurve = SimpleNamespace(
+        modifiers=[],
+        keyframe_points=[point(1, 0.0, "BEZIER"), point(11, 1.0, "SINE")],
+        evaluate=lambda frame: 0.0,
+    )
+    keyframes = export_servo_curve(fcurve, 1, 20)
+
+    assert [exported[2] for exported in keyframes] == ["BEZIER", "CONSTANT"]
+    curve = ServoCurve(keyframes_from_export(keyframes, "servo"))
+    assert curve.evaluate(15) == 1.0
+
+
+def test_unsupported_interpolation_names_the_servo():
+    play = {
+        "fps": 25,
+        "meta": {},
+        "audio_files": [],
+        "servo_curves": {
+            "croco jaw left": [keyframe(0, 0.0, "BEZIER"), keyframe(10, 1.0, "SINE")]
+        },
+        "frames": [],
+    }
+
+    with pytest.raises(ValueError, match="SINE of servo croco jaw left"):
+        JSONShow(play)
+
+
+def test_non_bezier_last_keyframe_holds_its_value():
+    curve = ServoCurve(
+        keyframes_from_export(
+            [keyframe(0, 0.0, "BEZIER"), keyframe(10, 1.0, "CONSTANT")], "servo"
+        )
+    )
+
+    assert curve.evaluate(0) == 0.0
+    assert curve.evaluate(20) == 1.0
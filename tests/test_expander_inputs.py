@@ -0,0 +1,71 @@
+import pytest
+
+from client.constants import LED_EXTENSION_INPUT_PINS, I2CAddress
+
+INTERRUPT_PIN = 17
+BUTTON = 8
+
+
+@pytest.fixture
+def expander(simulation):
+    """(ExpanderInputs of the LED extension, function changing the button's level at a time)"""
+    # imports the hardware, after the simulation replaced it
+    from client.devices.MCP23017 import MCP23017_INTFA
+    from client.hardware import ExpanderInputs
+
+    registers = simulation._i2c_registers[I2CAddress.LED_EXTENSION]
+
+    def set_registers(flags, port_b):
+        # INTF, INTCAP and GPIO of both ports
+        registers[MCP23017_INTFA : MCP23017_INTFA + 6] = bytes(
+            [0, flags, 0, port_b, 0, port_b]
+        )
+
+    set_registers(0, 0xFF)
+    inputs = ExpanderInputs(
+        simulation.hardware.led_extension._mcp,
+        INTERRUPT_PIN,
+        LED_EXTENSION_INPUT_PINS,
+        simulation.clock,
+    )
+
+    def change(time, level):
+        """The button changes to `level` at `time`, the expander interrupts"""
+        simulation.clock.advance_to(time)
+        set_registers(1 << BUTTON - 8, 0xFF if level else 0xFE)
+        simulation.gpio.set_input(INTERRUPT_PIN, 0)
+        simulation.gpio.set_input(INTERRUPT_PIN, 1)
+
+    return inputs, change
+
+
+def test_change_within_bounce_time_is_not_lost(simulation, expander):
+    inputs, change = expander
+    events = []
+    inputs.subscribe(
+        BUTTON,
+        lambda pin: events.append((inputs.probe(pin), simulation.clock())),
+        simulation.gpio.BOTH,
+    )
+
+    change(1.00, 0)
+    # released within the bounce time
+    change(1.03, 1)
+    change(2.00, 0)
+    change(2.50, 1)
+    simulation.clock.advance_to(3)
+
+    assert events == [(0, 1.00), (1, 1.05), (0, 2.00), (1, 2.50)]
+
+
+def test_bounce_is_suppressed(simulation, expander):
+    inputs, change = expander
+    presses = []
+    inputs.subscribe(BUTTON, lambda pin: presses.append(simulation.clock()))
+
+    for time, level in [(1.00, 0), (1.01, 1), (1.02, 0), (1.03, 1), (1.04, 0)]:
+        change(time, level)
+    simulation.clock.advance_to(2)
+
+    assert presses == [1.00]
+    assert inputs.probe(BUTTON) == 0
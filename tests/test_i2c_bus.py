@@ -0,0 +1,63 @@
+from threading import Event
+
+import pytest
+
+from config.config import config
+from client.constants import Config
+from client.i2c_bus import BusPriority, QueuedI2CDevice
+
+
+class RegisterDevice:
+    """Registers written by `writeList`, writes block until `release` is set"""
+
+    def __init__(self):
+        self.registers = {}
+        self.release = Event()
+        self.fail = set()
+
+    def writeList(self, register, data):
+        self.release.wait()
+        if register in self.fail:
+            raise OSError(f"Remote I/O error at {register}")
+        for offset, value in enumerate(data):
+            self.registers[register + offset] = value
+
+    def readU8(self, register):
+        return self.registers.get(register)
+
+
+@pytest.fixture
+def device(monkeypatch):
+    monkeypatch.setitem(config["client"], Config.THREADING, True)
+    device = RegisterDevice()
+    yield device, QueuedI2CDevice(
+        device, 0x40, BusPriority.SERVOS, coalesced_registers=range(64)
+    )
+    device.release.set()
+
+
+def test_coalesced_write_keeps_order_of_overlapping_writes(device):
+    device, queued = device
+    # keeps the bus busy while the others are queued
+    queued.writeList(32, [0])
+    queued.writeList(0, list("xxxxaxxx"))
+    queued.writeList(4, ["b"])
+    queued.writeList(0, list("xxxxcxxx"))
+    device.release.set()
+
+    assert queued.readU8(4) == "c"
+
+
+def test_failed_write_is_reported(device):
+    device, queued = device
+    errors = []
+    queued.on_write_error = lambda operation, args, error: errors.append(
+        (operation, args[0])
+    )
+    device.fail.add(8)
+    queued.writeList(8, [1, 2])
+    device.release.set()
+    # queued after the failed write
+    queued.readU8(8)
+
+    assert errors == [("writeList", 8)]
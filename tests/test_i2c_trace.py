@@ -0,0 +1,32 @@
+from client import i2c_trace
+from client.i2c_trace import I2CTracer
+
+
+def record(tracer, subsystem):
+    tracer.subsystem(subsystem)
+    tracer.record(0x40, "write8", (0x00, 0x10), 0.0001)
+
+
+def test_reset_forgets_subsystems():
+    tracer = I2CTracer(4)
+    record(tracer, "servos")
+    tracer.reset()
+    record(tracer, "leds")
+
+    assert [record["subsystem"] for record in tracer.dump()["records"]] == ["leds"]
+    assert tracer.records()["subsystem"].tolist() == [0]
+
+
+def test_subsystems_beyond_the_limit_are_other(monkeypatch):
+    monkeypatch.setattr(i2c_trace, "MAX_SUBSYSTEMS", 3)
+    tracer = I2CTracer(8)
+    for subsystem in ["servos", "leds", "thread 1", "thread 2", "servos"]:
+        record(tracer, subsystem)
+
+    assert [record["subsystem"] for record in tracer.dump()["records"]] == [
+        "servos",
+        "leds",
+        "other",
+        "other",
+        "servos",
+    ]
@@ -0,0 +1,39 @@
+import pytest
+
+from client.led_patterns import LEDPattern, LEDPatternEngine, Merge
+from client.simulation import VirtualClock
+
+
+def engine():
+    clock = VirtualClock()
+    writes = []
+    led_engine = LEDPatternEngine(lambda mask: writes.append((clock(), mask)), clock)
+    return led_engine, clock, writes
+
+
+def test_pattern_steps_until_its_end():
+    led_engine, clock, writes = engine()
+    led_engine.start("chase", LEDPattern.sequence([0, 1, 2], 0.1))
+    clock.advance_to(1)
+
+    assert [time for time, _ in writes] == pytest.approx([0, 0.1, 0.2, 0.3])
+    assert [mask for _, mask in writes] == [0b001, 0b010, 0b100, 0]
+    assert not led_engine.is_playing("chase")
+
+
+def test_repeating_pattern_is_merged_onto_direct_leds():
+    led_engine, clock, writes = engine()
+    led_engine.set({7: True})
+    led_engine.start("blink", LEDPattern([0, 0.5], [0b1, 0], 1, repeat=True), Merge.OR)
+    clock.advance_to(2.2)
+
+    assert [mask for _, mask in writes] == [
+        0x80,
+        0x81,
+        0x80,
+        0x81,
+        0x80,
+        0x81,
+    ]
+    assert [time for time, _ in writes] == pytest.approx([0, 0, 0.5, 1, 1.5, 2])
+    assert led_engine.is_playing("blink")
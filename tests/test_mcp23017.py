@@ -0,0 +1,44 @@
+def latch_writes(simulation, address):
+    """(register, values) written to the device"""
+    return [
+        (entry["register"], entry["values"])
+        for entry in simulation.log.entries
+        if entry["device"] == f"i2c 0x{address:02x}"
+    ]
+
+
+def test_only_changed_ports_are_written(simulation):
+    # the simulation provides the smbus module
+    from client.devices.MCP23017 import MCP23017, MCP23017_GPIOA, MCP23017_GPIOB
+
+    mcp = MCP23017(0x27, 16)
+    for pin in range(16):
+        mcp.pinMode(pin, MCP23017.OUTPUT)
+    simulation.log.entries.clear()
+
+    mcp.write_port(0, 0x0F)
+    mcp.write_port(0, 0x0F)
+    mcp.set_pins({8: 1})
+    mcp.set_pins({0: 0, 9: 1})
+    mcp.set_pins({9: 1})
+
+    assert latch_writes(simulation, 0x27) == [
+        (MCP23017_GPIOA, [0x0F]),
+        (MCP23017_GPIOB, [0x01]),
+        # both ports in one transaction
+        (MCP23017_GPIOA, [0x0E, 0x03]),
+    ]
+    assert mcp.latch == 0x030E
+
+
+def test_write_ports_writes_both_ports(simulation):
+    from client.devices.MCP23017 import MCP23017, MCP23017_GPIOA
+
+    mcp = MCP23017(0x27, 16)
+    for pin in range(16):
+        mcp.pinMode(pin, MCP23017.OUTPUT)
+    simulation.log.entries.clear()
+
+    mcp.write_ports(0x0000)
+
+    assert latch_writes(simulation, 0x27) == [(MCP23017_GPIOA, [0x00, 0x00])]
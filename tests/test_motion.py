@@ -0,0 +1,48 @@
+import pytest
+
+from client.constants import ServoName
+
+
+def test_triggered_move_ramps_over_several_frames(simulation):
+    # imports the hardware, after the simulation replaced it
+    from client.instructions import compile_instruction
+
+    hardware = simulation.hardware
+    hardware.crocos.jaw_left(30)
+    move = compile_instruction(
+        "hardware:crocos.move(ServoName.CROCO_JAW_LEFT, 40):1",
+        hardware.performance,
+        hardware,
+        {},
+        25,
+    )
+
+    move()
+    angles = []
+    for frame in range(1, 26):
+        simulation.clock.advance_to(frame / 25)
+        angles.append(hardware.servos.last_angle(ServoName.CROCO_JAW_LEFT))
+
+    # accelerates, then slows down into the target
+    intermediate = [angle for angle in angles if 30 < angle < 40]
+    assert len(intermediate) >= 5
+    assert angles == sorted(angles)
+    assert angles[-1] == 40
+    assert not hardware.motion.is_moving(ServoName.CROCO_JAW_LEFT)
+
+
+def test_direct_set_stops_move(simulation):
+    hardware = simulation.hardware
+    hardware.crocos.jaw_left(30)
+    hardware.crocos.move(ServoName.CROCO_JAW_LEFT, 40)
+    simulation.clock.advance_to(0.1)
+
+    hardware.crocos.jaw_left(35)
+    simulation.clock.advance_to(1)
+
+    assert hardware.servos.last_angle(ServoName.CROCO_JAW_LEFT) == 35
+
+
+def test_move_rejects_other_servos(simulation):
+    with pytest.raises(ValueError):
+        simulation.hardware.crocos.move(ServoName.HIHAT, 40)
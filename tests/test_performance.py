@@ -0,0 +1,29 @@
+import json
+
+
+def write_play(render_directory, frame_count):
+    frames = [
+        {"index": index, "_absolute_index": index + 1, "audio": [], "instructions": []}
+        for index in range(frame_count)
+    ]
+    play = {
+        "meta": {},
+        "fps": 25,
+        "audio_files": [],
+        "servo_curves": {},
+        "frame_count": frame_count,
+        "frames": frames,
+    }
+    with open(render_directory / "play.json", "w") as play_file:
+        json.dump(play, play_file)
+
+
+def test_invalid_start_finishes_play(simulation, tmp_path):
+    write_play(tmp_path, 10)
+    finished = []
+
+    simulation.hardware.performance.play(
+        finish_callback=lambda: finished.append(True), start_at="no such marker"
+    )
+
+    assert finished == [True]
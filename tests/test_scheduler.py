@@ -0,0 +1,36 @@
+import pytest
+
+from client.scheduler import FrameScheduler, OverrunPolicy
+from client.simulation import VirtualClock
+
+FPS = 25
+
+
+def overrun_scheduler(overrun_policy):
+    """Scheduler whose processing of frame 0 took until frame 2.5"""
+    clock = VirtualClock()
+    scheduler = FrameScheduler(FPS, overrun_policy, clock=clock)
+    scheduler.start(0)
+    clock.sleep(2.5 / FPS)
+    return scheduler
+
+
+def test_overrun_skips_servo_frames():
+    scheduler = overrun_scheduler(OverrunPolicy.SKIP_SERVO_FRAMES)
+
+    assert scheduler.should_skip_servos(0)
+    # the next update is evaluated where the schedule is now
+    assert scheduler.current_frame() == pytest.approx(2.5)
+    assert scheduler.wait_for(3) == pytest.approx(0)
+    assert not scheduler.should_skip_servos(3)
+    assert scheduler.statistics.overruns == 0
+
+
+def test_overrun_runs_late_until_caught_up():
+    scheduler = overrun_scheduler(OverrunPolicy.RUN_LATE)
+
+    assert not scheduler.should_skip_servos(0)
+    lateness = [scheduler.wait_for(frame_index) for frame_index in range(1, 5)]
+
+    assert lateness == pytest.approx([1.5 / FPS, 0.5 / FPS, 0, 0])
+    assert scheduler.statistics.overruns == 1
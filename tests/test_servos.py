@@ -0,0 +1,42 @@
+from client.constants import I2CAddress, ServoConfigs, ServoName
+
+
+def test_failed_write_is_sent_again(simulation):
+    servos = simulation.hardware.servos
+    servo_config = ServoConfigs[ServoName.CROCO_JAW_LEFT]
+    servos.set(ServoName.CROCO_JAW_LEFT, 30)
+    written = servos.write_statistics()["written"]
+
+    # as reported by the bus thread for the queued write
+    register = servos.LED0_ON_L + 4 * servo_config.pin.value
+    servos._on_write_error(
+        servo_config.side, "writeList", (register, [0] * 4), OSError("Remote I/O")
+    )
+    servos.set(ServoName.CROCO_JAW_LEFT, 30)
+
+    assert servos.write_statistics()["written"] == written + 1
+    servos.set(ServoName.CROCO_JAW_LEFT, 30)
+    assert servos.write_statistics()["written"] == written + 1
+
+
+def test_resync_initializes_reset_board(simulation):
+    servos = simulation.hardware.servos
+    servos.set(ServoName.CROCO_JAW_LEFT, 30)
+    registers = simulation._i2c_registers[I2CAddress.SERVOS_LEFT]
+    # power-on state: asleep, totem pole outputs off, LEDs off
+    registers[servos.MODE1] = servos.SLEEP | servos.ALLCALL
+    registers[servos.MODE2] = 0
+    registers[servos.PRESCALE] = 0x1E
+    registers[servos.LED0_ON_L : servos.LED0_ON_L + 4 * servos.CHANNELS] = bytes(
+        4 * servos.CHANNELS
+    )
+
+    servos.resync()
+
+    assert not registers[servos.MODE1] & servos.SLEEP
+    assert registers[servos.MODE1] & servos.AUTO_INCREMENT
+    assert registers[servos.MODE2] == servos.OUTDRV
+    assert registers[servos.PRESCALE] == int(25000000 / 4096 / servos.FREQUENCY - 0.5)
+    assert servos.last_angle(ServoName.CROCO_JAW_LEFT) == 30
+    register = servos.LED0_ON_L + 4 * ServoConfigs[ServoName.CROCO_JAW_LEFT].pin.value
+    assert registers[register + 2] | registers[register + 3] << 8 == 30 * 33
@@ -0,0 +1,68 @@
+from types import SimpleNamespace
+
+
+class PointerBus:
+    """Device at any address with a register pointer, set by writes and incremented by reads"""
+
+    def __init__(self, busnum):
+        self.registers = list(range(256))
+        self.pointer = 0
+        self.transfers = []
+
+    def write_byte(self, address, value):
+        self.pointer = value
+        self.transfers.append("write")
+
+    def write_i2c_block_data(self, address, register, values):
+        self.pointer = register
+        self.transfers.append("write")
+
+    def read_byte(self, address):
+        value = self.registers[self.pointer]
+        self.pointer += 1
+        self.transfers.append("read")
+        return value
+
+
+class CombinedPointerBus(PointerBus):
+    def i2c_rdwr(self, write, read):
+        self.pointer = write[0]
+        read[:] = self.registers[self.pointer : self.pointer + len(read)]
+        self.transfers.append("rdwr")
+
+
+class Message(list):
+    """`smbus2.i2c_msg`, iterating over a read message yields the bytes read"""
+
+    @staticmethod
+    def write(address, data):
+        return Message(data)
+
+    @staticmethod
+    def read(address, length):
+        return Message([None] * length)
+
+
+def test_write_read_without_combined_transfers(simulation, monkeypatch):
+    # the simulation provides the smbus module
+    from client.devices import Adafruit_I2C
+
+    monkeypatch.setattr(Adafruit_I2C, "smbus", SimpleNamespace(SMBus=PointerBus))
+    bus = Adafruit_I2C.SharedSMBus(1)
+
+    assert bus.write_read(0x20, [0x10], 3) == [0x10, 0x11, 0x12]
+    assert bus._bus.transfers == ["write", "read", "read", "read"]
+
+
+def test_write_read_with_combined_transfer(simulation, monkeypatch):
+    from client.devices import Adafruit_I2C
+
+    monkeypatch.setattr(
+        Adafruit_I2C,
+        "smbus",
+        SimpleNamespace(SMBus=CombinedPointerBus, i2c_msg=Message),
+    )
+    bus = Adafruit_I2C.SharedSMBus(1)
+
+    assert bus.write_read(0x20, [0x10], 3) == [0x10, 0x11, 0x12]
+    assert bus._bus.transfers == ["rdwr"]
@@ -0,0 +1,34 @@
+from threading import Event
+
+from client.timer import Timer
+
+
+def test_timers_fire_in_time_order():
+    timer = Timer(lambda: 10.0)
+    fired = []
+    done = Event()
+
+    # all are due, none fires before they're all queued
+    with timer._condition:
+        timer.call_at(3, lambda: fired.append("c"))
+        timer.call_at(1, lambda: fired.append("a"))
+        cancelled = timer.call_at(2, lambda: fired.append("cancelled"))
+        timer.call_at(2, lambda: fired.append("b"))
+        # same time as "a", after it
+        timer.call_at(1, lambda: fired.append("a2"))
+        timer.call_at(5, done.set)
+        timer.cancel(cancelled)
+
+    assert done.wait(5)
+    assert fired == ["a", "a2", "b", "c"]
+
+
+def test_failing_action_does_not_stop_timer():
+    timer = Timer(lambda: 10.0)
+    done = Event()
+
+    with timer._condition:
+        timer.call_at(1, lambda: 1 / 0)
+        timer.call_at(2, done.set)
+
+    assert done.wait(5)